@@ -0,0 +1,94 @@
+"""
+Benchmark of each stage of the dependency analysis on generated source trees of several sizes
+
+Usage: python benchmarks/benchmark_pipeline.py [packages:modules ...] [config_option=value ...]
+For example: python benchmarks/benchmark_pipeline.py 100:20 1000:20 extractor=ast workers=4
+"""
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import snakefood.find as finder
+from pordego_dependency.dependency_analysis import DependencyAnalyzer
+from pordego_dependency.dependency_config import DependencyConfig
+from pordego_dependency.dependency_query import DependencyQuery
+from pordego_dependency.entry_point import build_package_dependencies, DependencyInputValidator
+from pordego_dependency.requirements_analysis import RequirementsAnalyzer
+from pordego_dependency.snakefood_lib import preload_packages
+from tests.monorepo_generator import generate_monorepo
+
+DEFAULT_SCALES = [(20, 10), (100, 20), (300, 20)]
+
+
+def run_scale(package_count, module_count, **config_options):
+    root = tempfile.mkdtemp()
+    try:
+        tree = generate_monorepo(root, package_count, module_count, fan_out=3,
+                                 namespace_packages=package_count // 10)
+        finder.module_cache.clear()
+        timings = []
+
+        start_time = time.time()
+        config = DependencyConfig(source_paths=[tree["source_path"]], dependency_map=tree["dependency_map"],
+                                  check_requirements=True, ignore_third_party=True, **config_options)
+        config.dependency_inputs
+        timings.append(("config expansion and tree walk", time.time() - start_time, tree["file_count"], "files"))
+
+        start_time = time.time()
+        cycles = DependencyInputValidator(config.dependency_inputs).find_cycles()
+        timings.append(("cycle check", time.time() - start_time, len(config.dependency_inputs), "packages"))
+
+        start_time = time.time()
+        root_cache = preload_packages(config.source_paths, source_index=config.source_index)
+        timings.append(("preload_packages", time.time() - start_time, len(root_cache), "files"))
+
+        start_time = time.time()
+        package_dependency_map = build_package_dependencies(config, root_cache)
+        edge_count = sum(len(dependencies) for dependencies in package_dependency_map.values())
+        timings.append(("build_package_dependencies", time.time() - start_time, len(root_cache), "files"))
+
+        start_time = time.time()
+        result = DependencyAnalyzer(config).analyze(package_dependency_map)
+        timings.append(("DependencyAnalyzer", time.time() - start_time, edge_count, "edges"))
+
+        start_time = time.time()
+        RequirementsAnalyzer(config).analyze(package_dependency_map)
+        timings.append(("RequirementsAnalyzer", time.time() - start_time, len(package_dependency_map), "packages"))
+
+        start_time = time.time()
+        query = DependencyQuery(package_dependency_map)
+        timings.append(("DependencyQuery index", time.time() - start_time, edge_count, "edges"))
+
+        start_time = time.time()
+        for package in tree["dependency_map"]:
+            query.dependents(package, transitive=True)
+            query.why(package, "pkg_0000")
+        timings.append(("dependents and why queries", time.time() - start_time, 2 * package_count, "queries"))
+
+        print("\n{} packages x {} modules: {} files, {} package edges, {} cycles, dependency errors: {}".format(
+            package_count, module_count, tree["file_count"], edge_count, len(cycles), result.has_error))
+        for stage, elapsed, count, unit in timings:
+            print("  {:<32} {:8.3f}s {:10.0f} {}/s".format(stage, elapsed, count / max(elapsed, 1e-9), unit))
+    finally:
+        shutil.rmtree(root)
+
+
+def parse_scale(arg):
+    package_count, module_count = arg.split(":")
+    return int(package_count), int(module_count)
+
+
+def parse_option(arg):
+    name, value = arg.split("=", 1)
+    return name, int(value) if value.isdigit() else value
+
+
+if __name__ == "__main__":
+    scales = [parse_scale(arg) for arg in sys.argv[1:] if ":" in arg] or DEFAULT_SCALES
+    options = dict(parse_option(arg) for arg in sys.argv[1:] if "=" in arg)
+    for package_count, module_count in scales:
+        run_scale(package_count, module_count, **options)
@@ -0,0 +1,32 @@
+"""
+Benchmark of the package server existence checks of RequirementResolver against a local stand-in index
+
+Usage: python benchmarks/benchmark_requirement_resolver.py [requirement count] [latency in seconds]
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pordego_dependency.requirement_resolver import RequirementResolver
+from tests.stand_in_index import start_index_server
+
+
+def run(requirement_count=200, latency=0.02):
+    requirements = ["project-{}".format(i) for i in range(requirement_count)]
+    server, url = start_index_server(set(requirements[::2]), latency=latency)
+    try:
+        for workers in (1, 4, 8, 16, 32):
+            resolver = RequirementResolver(package_server_url=url, max_workers=workers)
+            start_time = time.time()
+            existing = resolver.filter_existing_requirements(requirements)
+            elapsed = time.time() - start_time
+            print("workers={:<3} requirements={} found={} time={:.3f}s ({:.0f} req/s)".format(
+                workers, requirement_count, len(existing), elapsed, requirement_count / elapsed))
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    run(*[float(arg) if "." in arg else int(arg) for arg in sys.argv[1:]])
@@ -2,8 +2,47 @@ from abc import ABCMeta, abstractmethod
 
 
 class Analyzer(object):
+    """
+    Analysis of the package dependencies, fed one package at a time so that the dependencies of a package can be
+    dropped as soon as every analyzer has seen them
+    """
     __metaclass__ = ABCMeta
 
     @abstractmethod
+    def start(self):
+        """
+        Prepare the analysis
+
+        :return: empty result, updated by analyze_package
+        :rtype: pordego_dependency.analysis_result.AnalysisResult
+        """
+
+    @abstractmethod
+    def analyze_package(self, result, package_path, dependencies):
+        """
+        Update the result with the dependencies of one package
+
+        :param package_path: path of the package
+        :param dependencies: set of dependencies of the package
+        """
+
+    def finish(self, result):
+        """Complete the result once all the packages are analyzed"""
+
+    def analyze_stream(self, package_dependencies):
+        """
+        :param package_dependencies: iterable of (package path, set of dependencies)
+        :rtype: pordego_dependency.analysis_result.AnalysisResult
+        """
+        result = self.start()
+        for package_path, dependencies in package_dependencies:
+            self.analyze_package(result, package_path, dependencies)
+        self.finish(result)
+        return result
+
     def analyze(self, package_dependency_map):
-        pass
+        """
+        :param package_dependency_map: dict of package path: set of dependencies
+        :rtype: pordego_dependency.analysis_result.AnalysisResult
+        """
+        return self.analyze_stream(package_dependency_map.iteritems())
@@ -0,0 +1,111 @@
+"""
+Cycle detection in package graphs using Tarjan's strongly connected components algorithm
+"""
+from collections import deque
+
+
+def find_cycles(graph):
+    """
+    :param graph: dict of node: iterable of successor nodes
+    :return: list of (component, example cycle) for each cycle, where component is the sorted list of the nodes of
+        a strongly connected component and example cycle is a shortest cycle in that component,
+        as a list of nodes starting and ending with the same node
+    """
+    cycles = []
+    for component in strongly_connected_components(graph):
+        component_nodes = set(component)
+        if len(component) > 1 or component[0] in graph.get(component[0], ()):
+            cycles.append((sorted(component), shortest_cycle(graph, component_nodes)))
+    return sorted(cycles)
+
+
+def strongly_connected_components(graph):
+    """
+    Iterative version of Tarjan's algorithm, linear in the number of nodes and edges
+
+    :param graph: dict of node: iterable of successor nodes. Successors that are not keys are nodes without edges.
+    :return: list of components, each a list of nodes
+    """
+    index_counter = [0]
+    indexes = {}
+    low_links = {}
+    stack = []
+    on_stack = set()
+    components = []
+
+    for start_node in sorted(graph):
+        if start_node in indexes:
+            continue
+        work = [(start_node, iter(graph.get(start_node, ())))]
+        _visit(start_node, indexes, low_links, index_counter, stack, on_stack)
+        while work:
+            node, successors = work[-1]
+            for successor in successors:
+                if successor not in indexes:
+                    _visit(successor, indexes, low_links, index_counter, stack, on_stack)
+                    work.append((successor, iter(graph.get(successor, ()))))
+                    break
+                elif successor in on_stack:
+                    low_links[node] = min(low_links[node], indexes[successor])
+            else:
+                work.pop()
+                if work:
+                    parent = work[-1][0]
+                    low_links[parent] = min(low_links[parent], low_links[node])
+                if low_links[node] == indexes[node]:
+                    component = []
+                    while True:
+                        member = stack.pop()
+                        on_stack.discard(member)
+                        component.append(member)
+                        if member == node:
+                            break
+                    components.append(component)
+    return components
+
+
+def _visit(node, indexes, low_links, index_counter, stack, on_stack):
+    indexes[node] = low_links[node] = index_counter[0]
+    index_counter[0] += 1
+    stack.append(node)
+    on_stack.add(node)
+
+
+def shortest_cycle(graph, component_nodes):
+    """
+    Shortest cycle inside a strongly connected component, found with a breadth first search from each node
+
+    :return: list of nodes starting and ending with the same node
+    """
+    best_cycle = None
+    for start_node in sorted(component_nodes):
+        cycle = _shortest_cycle_through(graph, component_nodes, start_node)
+        if cycle and (best_cycle is None or len(cycle) < len(best_cycle)):
+            best_cycle = cycle
+            if len(best_cycle) <= 3:
+                # a cycle between two packages is as short as an example gets, skip searching the other nodes
+                break
+    return best_cycle
+
+
+def _shortest_cycle_through(graph, component_nodes, start_node):
+    parents = {start_node: None}
+    queue = deque([start_node])
+    while queue:
+        node = queue.popleft()
+        for successor in sorted(graph.get(node, ())):
+            if successor == start_node:
+                path = [node]
+                while parents[path[-1]] is not None:
+                    path.append(parents[path[-1]])
+                return list(reversed(path)) + [start_node]
+            if successor in component_nodes and successor not in parents:
+                parents[successor] = node
+                queue.append(successor)
+    return None
+
+
+def format_cycles(cycles):
+    return "\n".join("{} packages in cycle {}, for example {}".format(len(component), ", ".join(component),
+                                                                      " -> ".join(cycle))
+                     for component, cycle in cycles)
@@ -13,12 +13,20 @@ logger = getLogger(__name__)
 class DependencyAnalyzer(Analyzer):
     def __init__(self, config):
         self._config = config
+        self._inputs_by_path = None
 
-    def analyze(self, package_dependency_map):
-        result = DependencyAnalysisResult()
+    def start(self):
+        self._inputs_by_path = defaultdict(list)
         for dependency_input in self._config.dependency_inputs:
-            dependencies = package_dependency_map[dependency_input.package_path]
-            local_depends = filter_local_dependencies(dependencies, self._config.source_paths)
+            self._inputs_by_path[dependency_input.package_path].append(dependency_input)
+        return DependencyAnalysisResult()
+
+    def analyze_package(self, result, package_path, dependencies):
+        dependency_inputs = self._inputs_by_path.get(package_path)
+        if not dependency_inputs:
+            return
+        local_depends = filter_local_dependencies(dependencies, self._config.source_path_matcher)
+        for dependency_input in dependency_inputs:
             allowed_dependency_names = dependency_input.allowed_dependency
             if allowed_dependency_names is not None:
                 non_ignored_depends = filter_ignored_dependencies(local_depends, allowed_dependency_names)
@@ -27,7 +35,6 @@ class DependencyAnalyzer(Analyzer):
                 redundant_dependency_names = find_redundant_dependency_names(local_depends, allowed_dependency_names)
                 if redundant_dependency_names and not dependency_input.ignore_redundant:
                     result.update_redundant_dependency_names(dependency_input.input_package, redundant_dependency_names)
-        return result
 
 
 class DependencyAnalysisResult(AnalysisResult):
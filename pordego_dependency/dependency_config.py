@@ -1,18 +1,25 @@
-import fnmatch
 import glob
 import os
-from snakefood.util import iter_pyfiles
 
-from pordego_dependency.snakefood_lib import find_package_names
+from pordego_dependency.dependency_tools import SourcePathMatcher
+from pordego_dependency.distribution_cache import DEFAULT_TTL
+from pordego_dependency.ignore_matcher import IgnoreMatcher
+from pordego_dependency.module_resolver import DEFAULT_MAX_ENTRIES
+from pordego_dependency.requirement_resolver import DEFAULT_MAX_PER_HOST
+from pordego_dependency.source_index import SourceIndex
+from pordego_dependency.stage_timer import StageTimer
 
 
 class DependencyCheckInput(object):
 
     def __init__(self, input_package, allowed_dependency=None, root=None, source_paths=None,
-                 ignores=None, ignore_redundant=False):
+                 ignores=None, ignore_redundant=False, source_index=None, ignore_matcher=None):
         """
         :param input_package: package to check
         :param allowed_dependency: Allowed dependency
+        :type source_index: pordego_dependency.source_index.SourceIndex
+        :param ignore_matcher: matcher compiled from ignores, shared by the inputs of a config
+        :type ignore_matcher: pordego_dependency.ignore_matcher.IgnoreMatcher
         """
         self.input_package = input_package
         self._allowed_dependency = allowed_dependency or []  # default to not allowing any dependencies
@@ -21,6 +28,8 @@ class DependencyCheckInput(object):
         self.ignores = ignores or ""
         self._package_path = None
         self._ignore_redundant = ignore_redundant
+        self._source_index = source_index
+        self._ignore_matcher = ignore_matcher or IgnoreMatcher(self.ignores)
 
     def __str__(self):
         return "Dependency Check on - {}".format(self.input_package)
@@ -40,8 +49,12 @@ class DependencyCheckInput(object):
         """
         :return: files under input package
         """
-        return [found_file for found_file in iter_pyfiles([self.package_path], None, abspaths=False)
-                if not self._is_ignored(found_file)]
+        if self._source_index is not None and self._source_index.contains(self.package_path):
+            package_files = self._source_index.files_under(self.package_path)
+            if self._ignore_matcher:
+                package_files = [found_file for found_file in package_files if not self._is_ignored(found_file)]
+            return package_files
+        return list(self._ignore_matcher.iter_pyfiles([self.package_path]))
 
     @property
     def allowed_dependency(self):
@@ -62,14 +75,7 @@ class DependencyCheckInput(object):
         raise Exception("Could not find package {} in paths {}".format(self.input_package, self.source_paths))
 
     def _is_ignored(self, path):
-        if isinstance(self.ignores, basestring):
-            ignore_globs = [self.ignores]
-        else:
-            ignore_globs = self.ignores
-        for ignore_glob in ignore_globs:
-            if fnmatch.fnmatch(path, ignore_glob):
-                return True
-        return False
+        return self._ignore_matcher.matches(path)
 
 
 class DependencyConfig(object):
@@ -82,8 +88,12 @@ class DependencyConfig(object):
         """
         self._source_paths = source_paths or []
         self._all_packages = None
+        self._source_index = None
+        self._ignore_matcher = None
+        self._source_path_matcher = None
+        self._dependency_inputs = None
         self._root = root
-        self._analysis_packages = analysis_packages or self.all_found_packages
+        self._analysis_packages = analysis_packages
         self._dependency_map = dependency_map or {}
         self._check_cyclic = check_cyclic
         self._check_requirements = check_requirements
@@ -91,6 +101,25 @@ class DependencyConfig(object):
         self.ignore_third_party = kw.get("ignore_third_party")
         self.package_server_url = kw.get("package_server_url")
         self.pip_options = kw.get("pip_options")
+        self.pip_batch_size = kw.get("pip_batch_size")
+        self.package_server_workers = kw.get("package_server_workers", 8)
+        self.package_server_per_host = kw.get("package_server_per_host", DEFAULT_MAX_PER_HOST)
+        self.package_server_timeout = kw.get("package_server_timeout", 10)
+        self.package_server_retries = kw.get("package_server_retries", 2)
+        self.cache_dir = kw.get("cache_dir")
+        self.distribution_cache_ttl = kw.get("distribution_cache_ttl", DEFAULT_TTL)
+        self.distribution_workers = kw.get("distribution_workers", 8)
+        self.workers = kw.get("workers") or 1
+        self.base_revision = kw.get("base_revision")
+        self.changed_files = kw.get("changed_files")
+        self.extractor = kw.get("extractor")
+        self.timing_report = kw.get("timing_report")
+        self.profile = kw.get("profile")
+        self.resolver_cache_size = kw.get("resolver_cache_size", DEFAULT_MAX_ENTRIES)
+        self.graph_file = kw.get("graph_file")
+        self.watch_socket = kw.get("watch_socket")
+        self.watch_interval = kw.get("watch_interval")
+        self.stage_timer = StageTimer()
 
     @property
     def root(self):
@@ -103,9 +132,28 @@ class DependencyConfig(object):
     def all_found_packages(self):
         """List of all packages found in the source_dirs"""
         if self._all_packages is None:
-            self._all_packages = find_package_names(self.source_paths)
+            self._all_packages = self.source_index.package_names()
         return self._all_packages
 
+    @property
+    def source_index(self):
+        """Index of the files and packages in the source paths, built once"""
+        if self._source_index is None:
+            self._source_index = SourceIndex(self.source_paths)
+        return self._source_index
+
+    @property
+    def ignore_matcher(self):
+        """Matcher of the ignore globs, compiled once"""
+        if self._ignore_matcher is None:
+            self._ignore_matcher = IgnoreMatcher(self._ignore)
+        return self._ignore_matcher
+
+    @property
+    def is_incremental(self):
+        """Only packages affected by changed_files or by the changes since base_revision are rebuilt"""
+        return self.base_revision is not None or self.changed_files is not None
+
     @property
     def check_cyclic(self):
         """
@@ -123,10 +171,17 @@ class DependencyConfig(object):
         """Paths to source directories"""
         return filter(None, self._source_paths)
 
+    @property
+    def source_path_matcher(self):
+        """Matcher of the paths under the source paths, built once"""
+        if self._source_path_matcher is None:
+            self._source_path_matcher = SourcePathMatcher(self.source_paths)
+        return self._source_path_matcher
+
     @property
     def analysis_packages(self):
         """List of packages to analyze. If None, all packages found in the source paths are analyzed"""
-        return self._analysis_packages
+        return self._analysis_packages or self.all_found_packages
 
     @property
     def dependency_map(self):
@@ -138,11 +193,16 @@ class DependencyConfig(object):
         """
         :return: List of DependencyCheckInput instances that hold dependency_map
         """
+        if self._dependency_inputs is None:
+            self._dependency_inputs = self._build_dependency_inputs()
+        return self._dependency_inputs
+
+    def _build_dependency_inputs(self):
         dependency_list = []
         for key in self.analysis_packages:
             if key.endswith('/'):
                 source_paths = [os.path.join(base_path, key[:-1]) for base_path in self.source_paths]
-                analysis_packages = find_package_names(source_paths)
+                analysis_packages = self.source_index.package_names(source_paths)
             else:
                 analysis_packages = [key]
                 source_paths = self.source_paths
@@ -156,7 +216,9 @@ class DependencyConfig(object):
                                                             root=self.root,
                                                             source_paths=source_paths,
                                                             ignores=self._ignore,
-                                                            ignore_redundant=ignore_redundant))
+                                                            ignore_redundant=ignore_redundant,
+                                                            source_index=self.source_index,
+                                                            ignore_matcher=self.ignore_matcher))
         return dependency_list
 
     def expand_allowed_dependencies(self, allowed_dependency_list):
@@ -164,7 +226,8 @@ class DependencyConfig(object):
         for dep in allowed_dependency_list:
             if dep.endswith("/"):
                 expanded_allowed_dependencies.extend(
-                    find_package_names([os.path.join(base_path, dep[:-1]) for base_path in self.source_paths]))
+                    self.source_index.package_names([os.path.join(base_path, dep[:-1])
+                                                     for base_path in self.source_paths]))
             else:
                 expanded_allowed_dependencies.append(dep)
         return expanded_allowed_dependencies
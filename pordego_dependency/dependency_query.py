@@ -0,0 +1,142 @@
+"""
+Queries over a package dependency map: dependents, import paths between packages and impact of changed files
+"""
+import os
+from collections import defaultdict, deque
+
+from pordego_dependency.dependency_tools import get_source_package
+
+
+class DependencyQuery(object):
+    def __init__(self, package_dependency_map):
+        """
+        Build the forward and reverse indexes of the package graph, once
+
+        :param package_dependency_map: mapping of package path: set of dependencies, like the result of
+            entry_point.build_package_dependencies or GraphFile.package_dependency_map
+        """
+        self._edges = defaultdict(dict)
+        self._dependents = defaultdict(set)
+        self._package_roots = {}
+        self._transitive_dependents = {}
+        self._transitive_dependencies = {}
+        self._seen_roots = set()
+        for package_path in package_dependency_map:
+            self._add_package_root(package_path, get_source_package(package_path))
+        for dependencies in package_dependency_map.values():
+            for dependency in dependencies:
+                source_package, target_package = dependency.source_package, dependency.target_package
+                self._add_package_root(dependency.from_root, source_package)
+                if target_package == get_source_package(dependency.to_root):
+                    # local package, the roots of third party packages are shared site-packages directories
+                    self._add_package_root(dependency.to_root, target_package)
+                if source_package == target_package:
+                    continue
+                self._edges[source_package].setdefault(target_package, dependency)
+                self._dependents[target_package].add(source_package)
+
+    @property
+    def packages(self):
+        """Set of the names of the packages of the map and of the local packages they import"""
+        return set(self._package_roots.values())
+
+    def dependencies(self, package, transitive=False):
+        """
+        :return: set of the names of the packages imported by package
+        """
+        if not transitive:
+            return set(self._edges.get(package, ()))
+        return self._reachable(package, self._edges, self._transitive_dependencies)
+
+    def dependents(self, package, transitive=False):
+        """
+        :return: set of the names of the packages importing package
+        """
+        if not transitive:
+            return set(self._dependents.get(package, ()))
+        return self._reachable(package, self._dependents, self._transitive_dependents)
+
+    def dependency(self, source_package, target_package):
+        """
+        :return: Dependency with an example of the files involved in the import of target_package by source_package,
+            None if source_package does not import target_package
+        """
+        return self._edges.get(source_package, {}).get(target_package)
+
+    def why(self, source_package, target_package):
+        """
+        Shortest chain of imports through which source_package depends on target_package
+
+        :return: list of Dependency, the files involved are from_file and to_file of each dependency.
+            Empty if both packages are the same, None if source_package doesn't depend on target_package.
+        """
+        if source_package == target_package:
+            return []
+        parents = {source_package: None}
+        queue = deque([source_package])
+        while queue:
+            package = queue.popleft()
+            for successor in sorted(self._edges.get(package, ())):
+                if successor in parents:
+                    continue
+                parents[successor] = package
+                if successor == target_package:
+                    return self._build_path(parents, target_package)
+                queue.append(successor)
+        return None
+
+    def package_of_file(self, file_path):
+        """
+        :return: name of the package containing the file, None if the file is not in a known package
+        """
+        path = os.path.realpath(file_path)
+        while True:
+            package = self._package_roots.get(path)
+            if package is not None:
+                return package
+            parent = os.path.dirname(path)
+            if parent == path:
+                return None
+            path = parent
+
+    def impacted_packages(self, changed_files):
+        """
+        Packages that may be affected by changes to the files: the packages containing the files and all the
+        packages depending on them, directly or not
+
+        :return: set of package names
+        """
+        changed_packages = {self.package_of_file(changed_file) for changed_file in changed_files}
+        changed_packages.discard(None)
+        impacted = set(changed_packages)
+        for package in changed_packages:
+            impacted |= self.dependents(package, transitive=True)
+        return impacted
+
+    def _add_package_root(self, root, package):
+        if root not in self._seen_roots:
+            self._seen_roots.add(root)
+            self._package_roots.setdefault(os.path.realpath(root), package)
+
+    def _build_path(self, parents, target_package):
+        path = []
+        package = target_package
+        while parents[package] is not None:
+            path.append(self._edges[parents[package]][package])
+            package = parents[package]
+        return list(reversed(path))
+
+    @staticmethod
+    def _reachable(package, adjacency, memo):
+        reachable = memo.get(package)
+        if reachable is None:
+            reachable = set()
+            stack = [package]
+            while stack:
+                for successor in adjacency.get(stack.pop(), ()):
+                    if successor not in reachable:
+                        reachable.add(successor)
+                        stack.append(successor)
+            reachable.discard(package)
+            memo[package] = reachable
+        return set(reachable)
@@ -1,7 +1,12 @@
 import os
 import re
 import sys
-from importlib import import_module
+from bisect import bisect_right
+
+try:
+    _intern = sys.intern
+except AttributeError:
+    _intern = intern
 
 UNKNOWN_PACKAGE = "UNKNOWN"
 
@@ -11,16 +16,36 @@ def filter_local_dependencies(dependencies, local_source_paths):
     Return a list of dependencies to packages in the specified source paths
 
     :type dependencies: list[pordego_dependency.snakefood_lib.Dependency]
-    :param local_source_paths: list of paths containing python packages
+    :param local_source_paths: list of paths containing python packages, or a SourcePathMatcher built from them
     """
-    return [d for d in dependencies if not d.is_unknown and is_local_package(d.target_path, local_source_paths)]
+    matcher = get_source_path_matcher(local_source_paths)
+    return [d for d in dependencies if not d.is_unknown and matcher.matches(d.target_path)]
 
 
 def is_local_package(file_path, local_source_paths):
-    for source in local_source_paths:
-        if file_path.startswith(os.path.abspath(source)):
-            return True
-    return False
+    return get_source_path_matcher(local_source_paths).matches(file_path)
+
+
+class SourcePathMatcher(object):
+    """Tests if a path starts with one of the source paths, using a bisect over the sorted absolute source paths"""
+
+    def __init__(self, source_paths):
+        self._prefixes = []
+        for prefix in sorted({os.path.abspath(source) for source in source_paths}):
+            # in sorted order, a path starting with a kept prefix can only start with the last one
+            if not self._prefixes or not prefix.startswith(self._prefixes[-1]):
+                self._prefixes.append(prefix)
+
+    def matches(self, path):
+        # the prefixes don't start with each other, so the only candidate is the greatest prefix <= path
+        index = bisect_right(self._prefixes, path) - 1
+        return index >= 0 and path.startswith(self._prefixes[index])
+
+
+def get_source_path_matcher(source_paths):
+    if isinstance(source_paths, SourcePathMatcher):
+        return source_paths
+    return SourcePathMatcher(source_paths)
 
 
 def find_redundant_dependency_names(dependencies, allowed_dependency_names):
@@ -43,52 +68,192 @@ def filter_builtin_packages(dependencies):
 
 
 def is_builtin_root(root_path):
-    if os.path.basename(os.path.dirname(sys.executable)) in ["bin", "Scripts"]:
-        python_basedir = os.path.split(os.path.dirname(sys.executable))[0]
-    else:
-        python_basedir = os.path.dirname(sys.executable)
-    path_parts = root_path.split(os.path.sep)
-    return "usr" in path_parts or ("site-packages" not in root_path and root_path.startswith(python_basedir))
+    return get_module_classifier().is_builtin_root(root_path)
 
 
 def is_builtin_module(module_path):
-    match_file = re.match(r"(.*)(.py|.pyd|.so|.pyo)$", module_path)
-    if match_file:
-        module_name = match_file.group(1).replace(os.path.sep, ".")
-    else:
-        module_name = module_path.replace(os.path.sep, ".")
-    if module_name in sys.builtin_module_names:
-        return True
-    try:
-        import_module(module_name)
-    except ImportError:
-        return False
-    return True
+    """True if the module can be found in the standard library or in the python path, without importing it"""
+    return get_module_classifier().is_importable_module(module_path)
 
 
-class Dependency(object):
-    def __init__(self, from_root, from_file, to_root, to_file):
-        self.from_root = from_root
-        self.to_root = to_root
-        self.from_file = from_file
-        self.to_file = to_file
+BUILTIN = "builtin"
+THIRD_PARTY = "third-party"
+LOCAL = "local"
+UNKNOWN = "unknown"
+MODULE_SUFFIXES = (".py", ".pyc", ".pyo", ".pyd", ".so")
 
-    @property
-    def source_package(self):
-        """Source package name"""
-        return os.path.basename(self.from_root)
 
-    @property
-    def target_package(self):
-        """Target (dependency) package name"""
-        if "site-packages" in self.to_root:
-            path_parts = self.to_file.split(os.path.sep)
-            package_name = path_parts[0]
-        elif self.is_unknown:
-            return self.to_file
+class ModuleClassifier(object):
+    """
+    Classifies package roots and modules as builtin, third party, local or unknown.
+    Everything is computed from the interpreter paths once, nothing is imported, and every answer is cached.
+    """
+
+    def __init__(self, local_source_paths=None):
+        """
+        :param local_source_paths: list of paths containing the local python packages, or a SourcePathMatcher
+        """
+        executable_dir = os.path.dirname(sys.executable)
+        if os.path.basename(executable_dir) in ["bin", "Scripts"]:
+            self.python_basedir = os.path.split(executable_dir)[0]
+        else:
+            self.python_basedir = executable_dir
+        self.local_source_matcher = get_source_path_matcher(local_source_paths or [])
+        self.stdlib_modules = find_stdlib_modules()
+        self.search_paths = [os.path.abspath(path or os.curdir) for path in sys.path]
+        self._root_classes = {}
+        self._importable_modules = {}
+        self._dir_listings = {}
+
+    def classify_root(self, root_path):
+        """
+        :return: BUILTIN, THIRD_PARTY, LOCAL or UNKNOWN
+        """
+        try:
+            return self._root_classes[root_path]
+        except KeyError:
+            root_class = self._root_classes[root_path] = self._classify_root(root_path)
+            return root_class
+
+    def is_builtin_root(self, root_path):
+        return self.classify_root(root_path) == BUILTIN
+
+    def is_importable_module(self, module_path):
+        """
+        :param module_path: module path relative to its root, like package/module.py
+        """
+        match_file = re.match(r"(.*)(.py|.pyd|.so|.pyo)$", module_path)
+        if match_file:
+            module_name = match_file.group(1).replace(os.path.sep, ".")
         else:
-            package_name = os.path.basename(self.to_root)
-        return package_name
+            module_name = module_path.replace(os.path.sep, ".")
+        try:
+            return self._importable_modules[module_name]
+        except KeyError:
+            importable = self._importable_modules[module_name] = self._find_module(module_name)
+            return importable
+
+    def _classify_root(self, root_path):
+        path_parts = root_path.split(os.path.sep)
+        if "usr" in path_parts or ("site-packages" not in root_path and root_path.startswith(self.python_basedir)):
+            return BUILTIN
+        if os.path.basename(root_path) == UNKNOWN_PACKAGE:
+            return UNKNOWN
+        if self.local_source_matcher.matches(root_path):
+            return LOCAL
+        if "site-packages" in path_parts or "dist-packages" in path_parts:
+            return THIRD_PARTY
+        return UNKNOWN
+
+    def _find_module(self, module_name):
+        names = module_name.split(".")
+        if module_name in sys.builtin_module_names or names[0] in self.stdlib_modules:
+            return True
+        for search_path in self.search_paths:
+            if self._find_in_path(search_path, names):
+                return True
+        return False
+
+    def _find_in_path(self, search_path, names):
+        """Look for package/subpackage/module in a python path entry using cached directory listings"""
+        directory = search_path
+        for name in names[:-1]:
+            if "__init__.py" not in self._list_dir(os.path.join(directory, name)):
+                return False
+            directory = os.path.join(directory, name)
+        listing = self._list_dir(directory)
+        last_name = names[-1]
+        if last_name in listing and "__init__.py" in self._list_dir(os.path.join(directory, last_name)):
+            return True
+        if any(last_name + suffix in listing for suffix in MODULE_SUFFIXES):
+            return True
+        # extension modules with an ABI tag, like module.cpython-37m-x86_64-linux-gnu.so
+        return any(name.startswith(last_name + ".") and name.endswith((".so", ".pyd")) for name in listing)
+
+    def _list_dir(self, directory):
+        try:
+            return self._dir_listings[directory]
+        except KeyError:
+            try:
+                listing = frozenset(os.listdir(directory))
+            except OSError:
+                listing = frozenset()
+            self._dir_listings[directory] = listing
+            return listing
+
+
+def find_stdlib_modules():
+    """Names of the top level modules of the standard library"""
+    if hasattr(sys, "stdlib_module_names"):
+        return frozenset(sys.stdlib_module_names)
+    from distutils.sysconfig import get_python_lib
+    stdlib_path = get_python_lib(standard_lib=True)
+    modules = set(sys.builtin_module_names)
+    for directory in (stdlib_path, os.path.join(stdlib_path, "lib-dynload")):
+        try:
+            names = os.listdir(directory)
+        except OSError:
+            continue
+        for name in names:
+            if name in ("site-packages", "dist-packages"):
+                continue
+            module_name, extension = os.path.splitext(name)
+            if extension in MODULE_SUFFIXES:
+                modules.add(module_name.split(".")[0])
+            elif os.path.exists(os.path.join(directory, name, "__init__.py")):
+                modules.add(name)
+    return frozenset(modules)
+
+
+_module_classifier = None
+
+
+def get_module_classifier():
+    """
+    Default classifier, which only depends on the interpreter, created on first use.
+    A run passes its own classifier, which knows the local source paths, to the DependencyBuilder.
+    """
+    global _module_classifier
+    if _module_classifier is None:
+        _module_classifier = ModuleClassifier()
+    return _module_classifier
+
+
+def intern_string(value):
+    """
+    Share a single copy of repeated root and path strings.
+    Interned strings are freed once no dependency uses them, so nothing accumulates between runs.
+    Unicode strings can't be interned on python 2 and are returned as they are.
+    """
+    return _intern(value) if type(value) is str else value
+
+
+def get_source_package(from_root):
+    return os.path.basename(from_root)
+
+
+def get_target_package(to_root, to_file):
+    if "site-packages" in to_root:
+        return to_file.split(os.path.sep)[0]
+    elif os.path.basename(to_root) == UNKNOWN_PACKAGE:
+        return to_file
+    return os.path.basename(to_root)
+
+
+class Dependency(object):
+    __slots__ = ("from_root", "from_file", "to_root", "to_file", "source_package", "target_package")
+
+    def __init__(self, from_root, from_file, to_root, to_file, source_package=None, target_package=None):
+        """
+        :param source_package: Source package name, computed from from_root if not given
+        :param target_package: Target (dependency) package name, computed from to_root and to_file if not given
+        """
+        self.from_root = intern_string(from_root)
+        self.to_root = intern_string(to_root)
+        self.from_file = intern_string(from_file)
+        self.to_file = intern_string(to_file)
+        self.source_package = intern_string(source_package or get_source_package(from_root))
+        self.target_package = intern_string(target_package or get_target_package(to_root, to_file))
 
     @property
     def is_builtin(self):
@@ -115,4 +280,9 @@ class Dependency(object):
     def __eq__(self, other):
         return (self.source_package, self.target_package) == (other.source_package, other.target_package)
 
+    def __ne__(self, other):
+        return not self == other
 
+    def __reduce__(self):
+        return Dependency, (self.from_root, self.from_file, self.to_root, self.to_file,
+                            self.source_package, self.target_package)
@@ -0,0 +1,106 @@
+"""
+Persistent on-disk cache of the third party distribution metadata resolved from the package server
+"""
+import json
+import os
+import time
+from logging import getLogger
+
+import pkg_resources
+
+from pordego_dependency.requirement_resolver import CachedDistribution
+
+logger = getLogger(__name__)
+
+CACHE_FILE_NAME = "distributions.json"
+DEFAULT_TTL = 7 * 24 * 3600
+DEFAULT_MAX_ENTRIES = 10000
+
+
+class DistributionCache(object):
+    def __init__(self, cache_dir, ttl=DEFAULT_TTL, max_entries=DEFAULT_MAX_ENTRIES):
+        """
+        :param cache_dir: directory where the cache file is stored
+        :param ttl: time in seconds after which an entry is resolved again
+        :param max_entries: maximum number of entries, the oldest entries are evicted first
+        """
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = None
+        self._modified = False
+
+    @property
+    def cache_path(self):
+        return os.path.join(self.cache_dir, CACHE_FILE_NAME)
+
+    @property
+    def entries(self):
+        """dict of project key: dict of version: entry"""
+        if self._entries is None:
+            self._entries = self._load()
+        return self._entries
+
+    def get(self, project_name):
+        """
+        :return: CachedDistribution of the most recently resolved version of the project, None if not cached
+        """
+        now = time.time()
+        matching_entries = [entry for entry in self.entries.get(project_key(project_name), {}).values()
+                            if now - entry["stored"] < self.ttl]
+        if not matching_entries:
+            return None
+        entry = max(matching_entries, key=lambda e: e["stored"])
+        distribution = pkg_resources.Distribution(project_name=entry["project_name"], version=entry["version"])
+        return CachedDistribution(distribution, entry["top_level_packages"])
+
+    def add(self, cached_dist):
+        """
+        :type cached_dist: pordego_dependency.requirement_resolver.CachedDistribution
+        """
+        distribution = cached_dist.distribution
+        self.entries.setdefault(project_key(distribution.project_name), {})[distribution.version] = {
+            "project_name": distribution.project_name,
+            "version": distribution.version,
+            "top_level_packages": list(cached_dist.top_level_packages),
+            "stored": time.time()}
+        self._modified = True
+
+    def save(self):
+        if not self._modified:
+            return
+        self._evict()
+        if not os.path.isdir(self.cache_dir):
+            os.makedirs(self.cache_dir)
+        temp_path = "{}.{}.tmp".format(self.cache_path, os.getpid())
+        with open(temp_path, "w") as f:
+            json.dump(self.entries, f)
+        if os.path.exists(self.cache_path):
+            os.remove(self.cache_path)
+        os.rename(temp_path, self.cache_path)
+        self._modified = False
+
+    def _evict(self):
+        now = time.time()
+        versions = [(entry["stored"], key, version) for key, key_entries in self.entries.items()
+                    for version, entry in key_entries.items()]
+        expired = [(key, version) for stored, key, version in versions if now - stored >= self.ttl]
+        oldest = [(key, version) for stored, key, version in sorted(versions)[:max(0, len(versions) - self.max_entries)]]
+        for key, version in set(expired + oldest):
+            del self.entries[key][version]
+            if not self.entries[key]:
+                del self.entries[key]
+
+    def _load(self):
+        if not os.path.exists(self.cache_path):
+            return {}
+        try:
+            with open(self.cache_path) as f:
+                return json.load(f)
+        except (IOError, ValueError):
+            logger.warning("Ignoring unreadable distribution cache at %s", self.cache_path)
+            return {}
+
+
+def project_key(project_name):
+    return pkg_resources.safe_name(project_name).lower()
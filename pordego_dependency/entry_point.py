@@ -1,7 +1,17 @@
+import cProfile
 import time
+from collections import defaultdict
+from itertools import chain
 
+from pordego_dependency.cycle_detection import find_cycles, format_cycles
 from pordego_dependency.dependency_analysis import DependencyAnalyzer, logger
 from pordego_dependency.dependency_config import DependencyConfig
+from pordego_dependency.dependency_tools import filter_local_dependencies, ModuleClassifier
+from pordego_dependency.graph_file import GraphWriter
+from pordego_dependency.import_cache import ImportCache, build_resolver_inputs, build_fingerprint
+from pordego_dependency.module_resolver import ModuleResolver
+from pordego_dependency.incremental import ResultStore, get_changed_files, select_inputs_to_rebuild
+from pordego_dependency.parallel_builder import iter_packages_in_pool
 from pordego_dependency.requirements_analysis import RequirementsAnalyzer
 from pordego_dependency.snakefood_lib import preload_packages, DependencyBuilder
 
@@ -20,11 +30,71 @@ def analyze_dependency(config_dict):
     :return:
     """
     config = build_config(config_dict)
-    analyse_cyclic_dependency(config)
-    root_cache = preload_packages(config.source_paths)
+    profiler = cProfile.Profile() if config.profile else None
+    if profiler is not None:
+        profiler.enable()
+    try:
+        run_analysis(config)
+    finally:
+        if profiler is not None:
+            profiler.disable()
+            profiler.dump_stats(config.profile)
+            logger.info("Wrote profile stats to %s", config.profile)
+        if config.timing_report:
+            config.stage_timer.write_report(config.timing_report)
+            logger.info("Wrote timing report to %s", config.timing_report)
 
-    package_dependency_map = build_package_dependencies(config, root_cache)
-    analyze_results([analyzer.analyze(package_dependency_map) for analyzer in build_analyzers(config)])
+
+def run_analysis(config):
+    """
+    Run all the stages of the analysis, timing each stage with the stage_timer of the config
+
+    :type config: DependencyConfig
+    """
+    stage_timer = config.stage_timer
+    resolver = ModuleResolver(max_entries=config.resolver_cache_size)
+    with stage_timer.stage("tree walk"):
+        source_index = config.source_index
+    with stage_timer.stage("config expansion"):
+        config.dependency_inputs
+    classifier = ModuleClassifier(config.source_path_matcher)
+    with stage_timer.stage("cyclic dependency check"):
+        analyse_cyclic_dependency(config)
+    with stage_timer.stage("preload"):
+        root_cache = preload_packages(config.source_paths, source_index=source_index, resolver=resolver)
+
+    analyzers = build_analyzers(config)
+    results = []
+    for analyzer in analyzers:
+        with stage_timer.stage("start {}".format(type(analyzer).__name__)):
+            results.append(analyzer.start())
+    package_graph = defaultdict(set)
+    graph_writer = GraphWriter(config.graph_file) if config.graph_file else None
+    module_imports = [] if graph_writer is not None else None
+    package_dependencies = iter_package_dependencies(config, root_cache, resolver, classifier=classifier,
+                                                     module_imports=module_imports)
+    try:
+        for package_path, dependencies in stage_timer.iterate("build", package_dependencies):
+            add_to_package_graph(package_graph, dependencies, config.source_path_matcher)
+            if graph_writer is not None:
+                graph_writer.add(package_path, dependencies)
+                graph_writer.add_module_imports(module_imports)
+                del module_imports[:]
+            for analyzer, result in zip(analyzers, results):
+                with stage_timer.stage("analyze {}".format(type(analyzer).__name__)):
+                    analyzer.analyze_package(result, package_path, dependencies)
+    except BaseException:
+        if graph_writer is not None:
+            graph_writer.abort()
+        raise
+    for analyzer, result in zip(analyzers, results):
+        analyzer.finish(result)
+    if graph_writer is not None:
+        graph_writer.close()
+        logger.info("Wrote dependency graph to %s", config.graph_file)
+    with stage_timer.stage("cyclic import check"):
+        check_package_graph_cycles(config, dict(package_graph))
+    analyze_results(results)
 
 
 def build_analyzers(config):
@@ -60,16 +130,144 @@ def log_time(f):
 
 
 @log_time
-def build_package_dependencies(config, root_cache):
-    package_dependency_map = {}
-    logger.info("Building package dependency map for %s packages...", len(config.dependency_inputs))
-    for dependency_check_input in sorted(config.dependency_inputs, key=lambda dep: dep.input_package):
+def build_package_dependencies(config, root_cache, resolver=None, classifier=None):
+    """
+    :return: dict of package path: set of dependencies
+    """
+    return dict(iter_package_dependencies(config, root_cache, resolver, classifier=classifier))
+
+
+def iter_package_dependencies(config, root_cache, resolver=None, classifier=None, module_imports=None):
+    """
+    Build the dependencies of the packages one at a time. Nothing is kept in memory once a package is yielded,
+    the caches are saved when the generator is exhausted.
+
+    :param resolver: resolver the packages were preloaded into, default the process wide resolver
+    :type resolver: pordego_dependency.module_resolver.ModuleResolver
+    :param classifier: classifier of the imported modules, default the classifier of the interpreter
+    :type classifier: pordego_dependency.dependency_tools.ModuleClassifier
+    :param module_imports: list receiving the (file, imported files) of the built files, see DependencyBuilder
+    :return: generator of (package path, set of dependencies)
+    """
+    reused_results = iter([])
+    import_cache = build_import_cache(config, root_cache)
+    result_store = build_result_store(config, import_cache)
+    dependency_inputs = config.dependency_inputs
+    if config.is_incremental and module_imports is not None:
+        # the stored results don't have the module imports, the import cache still saves the parsing
+        logger.info("The module graph needs the imports of every package, rebuilding all packages")
+    elif config.is_incremental:
+        dependency_inputs, reused_results = select_incremental_inputs(config, root_cache, result_store)
+    result_writer = result_store.open_writer() if result_store is not None else None
+    logger.info("Building package dependency map for %s packages...", len(dependency_inputs))
+    built_packages = iter_built_packages(config, dependency_inputs, root_cache, import_cache, resolver,
+                                         classifier=classifier, module_imports=module_imports)
+    try:
+        for package_path, dependencies in chain(reused_results, built_packages):
+            if result_writer is not None:
+                result_writer.write(package_path, dependencies)
+            yield package_path, dependencies
+    except BaseException:
+        if result_writer is not None:
+            result_writer.abort()
+        raise
+    if import_cache is not None:
+        import_cache.log_stats()
+        config.stage_timer.increment("import_cache_hits", import_cache.hits)
+        config.stage_timer.increment("import_cache_misses", import_cache.misses)
+        import_cache.save()
+    if result_writer is not None:
+        result_writer.close()
+
+
+def iter_built_packages(config, dependency_inputs, root_cache, import_cache=None, resolver=None, classifier=None,
+                        module_imports=None):
+    """
+    Build the dependencies of the given packages, serially or in a pool of worker processes.
+    Serially, each file is parsed at most once, even if it is included in several dependency inputs. Each worker
+    process keeps its own parse memo, so a file shared by packages built in different workers is parsed once per
+    worker.
+
+    :type import_cache: pordego_dependency.import_cache.ImportCache
+    :type classifier: pordego_dependency.dependency_tools.ModuleClassifier
+    :param module_imports: list receiving the (file, imported files) of the built files, see DependencyBuilder
+    :return: generator of (package path, set of dependencies)
+    """
+    if config.workers > 1:
+        logger.info("Using %s worker processes", config.workers)
+        for package_path, dependencies in iter_packages_in_pool(dependency_inputs, config.workers,
+                                                                config.source_paths, root_cache, import_cache,
+                                                                extractor=config.extractor,
+                                                                stage_timer=config.stage_timer,
+                                                                resolver=resolver,
+                                                                classifier=classifier,
+                                                                module_imports=module_imports):
+            yield package_path, dependencies
+        return
+    built_paths = set()
+    parse_memo = {}
+    for dependency_check_input in sorted(dependency_inputs, key=lambda dep: dep.input_package):
+        if dependency_check_input.package_path in built_paths:
+            continue
+        built_paths.add(dependency_check_input.package_path)
+        start_time = time.time()
         dependency_builder = DependencyBuilder(dependency_check_input.input_package,
                                                dependency_check_input.files,
                                                source_path=config.source_paths,
-                                               root_cache=root_cache)
-        package_dependency_map[dependency_check_input.package_path] = dependency_builder.build()
-    return package_dependency_map
+                                               root_cache=root_cache,
+                                               import_cache=import_cache,
+                                               extractor=config.extractor,
+                                               classifier=classifier,
+                                               stage_timer=config.stage_timer,
+                                               resolver=resolver,
+                                               parse_memo=parse_memo,
+                                               module_imports=module_imports)
+        dependencies = dependency_builder.build()
+        config.stage_timer.record_package(dependency_check_input.package_path, time.time() - start_time)
+        yield dependency_check_input.package_path, dependencies
+
+
+def build_import_cache(config, root_cache):
+    """
+    :return: ImportCache if a cache_dir is configured, otherwise None
+    """
+    if not config.cache_dir:
+        return None
+    return ImportCache(config.cache_dir, resolver_inputs=build_resolver_inputs(config.source_paths, root_cache))
+
+
+def build_result_store(config, import_cache):
+    """
+    :return: ResultStore if a cache_dir is configured, otherwise None
+    """
+    if import_cache is None:
+        return None
+    # the ignore globs and the extractor change the dependencies found in the same files
+    fingerprint = build_fingerprint([import_cache.fingerprint, config.ignore_matcher.ignore_globs, config.extractor])
+    return ResultStore(config.cache_dir, fingerprint)
+
+
+def select_incremental_inputs(config, root_cache, result_store):
+    """
+    Select the dependency inputs affected by the changed files and reuse the stored results for the others
+
+    :return: tuple of (list of DependencyCheckInput to rebuild,
+        generator of (package path, dependencies) reading the reused results from the store)
+    """
+    if result_store is None:
+        logger.warning("Incremental check requires a cache_dir, analyzing all packages")
+        return config.dependency_inputs, iter([])
+    stored_results = result_store.package_paths()
+    changed_files = config.changed_files
+    if changed_files is None:
+        changed_files = get_changed_files(config.base_revision, config.root or ".")
+    dependency_inputs = select_inputs_to_rebuild(config.dependency_inputs, changed_files, stored_results,
+                                                 package_roots=set(root_cache.values()))
+    rebuilt_paths = {dci.package_path for dci in dependency_inputs}
+    reused_paths = {dci.package_path for dci in config.dependency_inputs} - rebuilt_paths
+    logger.info("Incremental check: %s changed files, rebuilding %s packages and reusing %s",
+                len(changed_files), len(rebuilt_paths), len(reused_paths))
+    return dependency_inputs, result_store.iter_results(reused_paths)
 
 
 def analyse_cyclic_dependency(config):
@@ -77,10 +275,52 @@ def analyse_cyclic_dependency(config):
     Raise exception when there is dependency cycle and check is true in config
     """
     validator = DependencyInputValidator(config.dependency_inputs)
-    if validator.is_cyclic():
-        msg = ("Found cyclic dependency in {}".format(validator.dependency_inputs))
+    cycles = validator.find_cycles()
+    if cycles:
+        msg = "Found cyclic dependency in dependency_map:\n{}".format(format_cycles(cycles))
+        if config.check_cyclic:
+            raise AssertionError(msg)
+        logger.warning(msg)
+
+
+def analyse_cyclic_imports(config, package_dependency_map):
+    """
+    Raise exception when the packages import each other in a cycle and check is true in config
+    """
+    check_package_graph_cycles(config, build_package_graph(package_dependency_map, config.source_path_matcher))
+
+
+def check_package_graph_cycles(config, package_graph):
+    """
+    :param package_graph: dict of package name: set of names of the local packages it imports
+    """
+    cycles = find_cycles(package_graph)
+    if cycles:
+        msg = "Found cyclic imports between packages:\n{}".format(format_cycles(cycles))
         if config.check_cyclic:
             raise AssertionError(msg)
+        logger.warning(msg)
+
+
+def build_package_graph(package_dependency_map, source_paths):
+    """
+    :param source_paths: list of source paths or SourcePathMatcher
+    :return: dict of package name: set of names of the local packages it imports
+    """
+    package_graph = defaultdict(set)
+    for dependencies in package_dependency_map.values():
+        add_to_package_graph(package_graph, dependencies, source_paths)
+    return dict(package_graph)
+
+
+def add_to_package_graph(package_graph, dependencies, source_paths):
+    """
+    :param package_graph: defaultdict(set) of package name: set of names of the local packages it imports
+    :param dependencies: dependencies of one package
+    :param source_paths: list of source paths or SourcePathMatcher
+    """
+    for dependency in filter_local_dependencies(dependencies, source_paths):
+        package_graph[dependency.source_package].add(dependency.target_package)
 
 
 class DependencyInputValidator(object):
@@ -99,20 +339,17 @@ class DependencyInputValidator(object):
 
     def is_cyclic(self):
         """
-        Determines if there is a cycle in dependency input by trying to do a topological sort
+        Determines if there is a cycle in dependency input
         :return: bool
         """
-        while self.dependency_inputs:
-            depended_packages = set()
-            for package in self.dependency_inputs.keys():
-                for dependencies in self.dependency_inputs.itervalues():
-                    if dependencies and package in dependencies:
-                        depended_packages.add(package)
-                        break
-            non_depended_packages = set(self.dependency_inputs.keys()).difference(depended_packages)
-            for package in non_depended_packages:
-                self.dependency_inputs.pop(package)
-
-            if not non_depended_packages and self.dependency_inputs:
-                return True
-        return False
+        return bool(self.find_cycles())
+
+    def find_cycles(self):
+        """
+        Find the strongly connected components of the allowed dependency graph
+
+        :return: list of (component, example cycle), see pordego_dependency.cycle_detection.find_cycles
+        """
+        graph = {package: [dep for dep in dependencies if dep in self.dependency_inputs]
+                 for package, dependencies in self.dependency_inputs.items()}
+        return find_cycles(graph)
@@ -0,0 +1,282 @@
+"""
+Compact binary file of the package dependency map, which can be memory-mapped and read lazily.
+
+Layout, all integers little endian:
+
+- header: magic, format version, string count, package count, edge count, module count, module edge count
+  and the offsets of the sections
+- edges: 6 string ids per dependency (from_root, from_file, to_root, to_file, source_package, target_package),
+  grouped by package
+- packages: string id of each package path, then the CSR index of the edges, the edges of package i being
+  edge_index[i] to edge_index[i + 1]
+- modules: string id of each module file, then the module level import graph in CSR form over the module indexes,
+  module_targets followed by module_offsets, the modules imported by module i being
+  module_targets[module_offsets[i]:module_offsets[i + 1]]
+- strings: byte offset of each string, then the UTF-8 encoded strings
+"""
+import mmap
+import os
+import struct
+
+try:
+    from collections.abc import Mapping
+except ImportError:
+    from collections import Mapping
+
+from pordego_dependency.dependency_tools import Dependency
+
+MAGIC = b"PDGRAPH\0"
+FORMAT_VERSION = 2
+HEADER = struct.Struct("<8sIIIIIIQQQQ")
+EDGE = struct.Struct("<6I")
+UINT = struct.Struct("<I")
+
+
+class GraphWriter(object):
+    """
+    Writes the dependencies of the packages as they are built.
+    Only the string table and the module import graph, as module indexes, are kept in memory.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.temp_path = "{}.{}.tmp".format(path, os.getpid())
+        self._file = open(self.temp_path, "wb")
+        self._file.write(b"\0" * HEADER.size)
+        self._string_ids = {}
+        self._strings = []
+        self._package_ids = []
+        self._edge_index = [0]
+        self._module_ids = {}
+        self._module_string_ids = []
+        self._module_targets = {}
+
+    def add(self, package_path, dependencies):
+        """
+        :param dependencies: set of Dependency of the package
+        """
+        edges = sorted((dep.source_package, dep.target_package, dep.from_file, dep.to_file, dep.from_root,
+                        dep.to_root) for dep in dependencies)
+        for source_package, target_package, from_file, to_file, from_root, to_root in edges:
+            self._file.write(EDGE.pack(*[self._string_id(value) for value in (from_root, from_file, to_root, to_file,
+                                                                              source_package, target_package)]))
+        self._package_ids.append(self._string_id(package_path))
+        self._edge_index.append(self._edge_index[-1] + len(edges))
+
+    def add_module_imports(self, module_imports):
+        """
+        :param module_imports: iterable of (module file, list of the files it imports)
+        """
+        for module_file, imported_files in module_imports:
+            targets = self._module_targets.setdefault(self._module_id(module_file), set())
+            targets.update(self._module_id(imported_file) for imported_file in imported_files)
+
+    def close(self):
+        packages_offset = self._file.tell()
+        self._write_uints(self._package_ids)
+        self._write_uints(self._edge_index)
+        modules_offset = self._file.tell()
+        self._write_uints(self._module_string_ids)
+        module_offsets = [0]
+        for module_id in range(len(self._module_string_ids)):
+            targets = sorted(self._module_targets.get(module_id, ()))
+            self._write_uints(targets)
+            module_offsets.append(module_offsets[-1] + len(targets))
+        self._write_uints(module_offsets)
+        strings_offset = self._file.tell()
+        encoded_strings = [_encode(value) for value in self._strings]
+        string_offsets = [0]
+        for encoded_string in encoded_strings:
+            string_offsets.append(string_offsets[-1] + len(encoded_string))
+        self._write_uints(string_offsets)
+        self._file.write(b"".join(encoded_strings))
+        self._file.seek(0)
+        self._file.write(HEADER.pack(MAGIC, FORMAT_VERSION, len(self._strings), len(self._package_ids),
+                                     self._edge_index[-1], len(self._module_string_ids), module_offsets[-1],
+                                     HEADER.size, packages_offset, modules_offset, strings_offset))
+        self._file.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        os.rename(self.temp_path, self.path)
+
+    def abort(self):
+        self._file.close()
+        os.remove(self.temp_path)
+
+    def _string_id(self, value):
+        string_id = self._string_ids.get(value)
+        if string_id is None:
+            string_id = self._string_ids[value] = len(self._strings)
+            self._strings.append(value)
+        return string_id
+
+    def _module_id(self, module_file):
+        module_id = self._module_ids.get(module_file)
+        if module_id is None:
+            module_id = self._module_ids[module_file] = len(self._module_string_ids)
+            self._module_string_ids.append(self._string_id(module_file))
+        return module_id
+
+    def _write_uints(self, values):
+        self._file.write(struct.pack("<{}I".format(len(values)), *values))
+
+
+class GraphFile(object):
+    """Memory-mapped graph file. Strings and dependencies are only decoded when they are accessed."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            self._data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, version, self.string_count, self.package_count, self.edge_count, self.module_count,
+         self.module_edge_count, self._edges_offset, packages_offset, modules_offset,
+         strings_offset) = HEADER.unpack_from(self._data, 0)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            self._data.close()
+            raise Exception("{} is not a dependency graph file of version {}".format(path, FORMAT_VERSION))
+        self._package_ids_offset = packages_offset
+        self._edge_index_offset = packages_offset + UINT.size * self.package_count
+        self._module_ids_offset = modules_offset
+        self._module_targets_offset = modules_offset + UINT.size * self.module_count
+        self._module_offsets_offset = self._module_targets_offset + UINT.size * self.module_edge_count
+        self._string_offsets_offset = strings_offset
+        self._string_data_offset = strings_offset + UINT.size * (self.string_count + 1)
+        self._strings = {}
+        self._package_indexes = None
+        self._module_indexes = None
+
+    def close(self):
+        self._data.close()
+
+    def string(self, string_id):
+        value = self._strings.get(string_id)
+        if value is None:
+            start = self._uint(self._string_offsets_offset, string_id)
+            end = self._uint(self._string_offsets_offset, string_id + 1)
+            value = _decode(self._data[self._string_data_offset + start:self._string_data_offset + end])
+            self._strings[string_id] = value
+        return value
+
+    def package_path(self, index):
+        return self.string(self._uint(self._package_ids_offset, index))
+
+    def package_paths(self):
+        return [self.package_path(index) for index in range(self.package_count)]
+
+    def package_index(self, package_path):
+        """
+        :return: index of the package, None if the package is not in the graph
+        """
+        if self._package_indexes is None:
+            self._package_indexes = {path: index for index, path in enumerate(self.package_paths())}
+        return self._package_indexes.get(package_path)
+
+    def edge_ids(self, index):
+        """
+        :return: list of (from_root, from_file, to_root, to_file, source_package, target_package) string ids
+            of the edges of the package
+        """
+        start = self._uint(self._edge_index_offset, index)
+        end = self._uint(self._edge_index_offset, index + 1)
+        return [EDGE.unpack_from(self._data, self._edges_offset + EDGE.size * edge) for edge in range(start, end)]
+
+    def dependencies(self, index):
+        """
+        :return: set of Dependency of the package
+        """
+        return {Dependency(*[self.string(string_id) for string_id in edge]) for edge in self.edge_ids(index)}
+
+    def module_path(self, index):
+        return self.string(self._uint(self._module_ids_offset, index))
+
+    def module_index(self, module_path):
+        """
+        :return: index of the module file, None if the module is not in the graph
+        """
+        if self._module_indexes is None:
+            self._module_indexes = {self.module_path(index): index for index in range(self.module_count)}
+        return self._module_indexes.get(module_path)
+
+    def imported_module_indexes(self, index):
+        """
+        :return: indexes of the modules imported by the module, only builtin modules are left out
+        """
+        start = self._uint(self._module_offsets_offset, index)
+        end = self._uint(self._module_offsets_offset, index + 1)
+        return list(struct.unpack_from("<{}I".format(end - start), self._data,
+                                       self._module_targets_offset + UINT.size * start))
+
+    def imported_modules(self, module_path):
+        """
+        :return: list of the files imported by the module file
+        :raise: KeyError if the module is not in the graph
+        """
+        index = self.module_index(module_path)
+        if index is None:
+            raise KeyError(module_path)
+        return [self.module_path(target) for target in self.imported_module_indexes(index)]
+
+    def package_dependency_map(self):
+        """
+        :return: read only mapping of package path: set of dependencies, built when a package is accessed
+        """
+        return LazyPackageDependencyMap(self)
+
+    def _uint(self, offset, index):
+        return UINT.unpack_from(self._data, offset + UINT.size * index)[0]
+
+
+class LazyPackageDependencyMap(Mapping):
+    """package_dependency_map backed by a GraphFile, the dependencies of a package are decoded on every access"""
+
+    def __init__(self, graph_file):
+        """
+        :type graph_file: GraphFile
+        """
+        self.graph_file = graph_file
+
+    def __getitem__(self, package_path):
+        index = self.graph_file.package_index(package_path)
+        if index is None:
+            raise KeyError(package_path)
+        return self.graph_file.dependencies(index)
+
+    def __contains__(self, package_path):
+        return self.graph_file.package_index(package_path) is not None
+
+    def __iter__(self):
+        return (self.graph_file.package_path(index) for index in range(self.graph_file.package_count))
+
+    def __len__(self):
+        return self.graph_file.package_count
+
+    def iteritems(self):
+        for index in range(self.graph_file.package_count):
+            yield self.graph_file.package_path(index), self.graph_file.dependencies(index)
+
+    items = iteritems
+
+
+def write_graph(path, package_dependency_map, module_imports=()):
+    """
+    :param package_dependency_map: dict of package path: set of dependencies
+    :param module_imports: iterable of (module file, list of the files it imports)
+    """
+    writer = GraphWriter(path)
+    try:
+        for package_path in sorted(package_dependency_map):
+            writer.add(package_path, package_dependency_map[package_path])
+        writer.add_module_imports(module_imports)
+    except BaseException:
+        writer.abort()
+        raise
+    writer.close()
+
+
+def _encode(value):
+    return value if isinstance(value, bytes) else value.encode("utf-8")
+
+
+def _decode(data):
+    # native strings: bytes on python 2, unicode on python 3
+    return data if str is bytes else data.decode("utf-8")
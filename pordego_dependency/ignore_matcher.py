@@ -0,0 +1,67 @@
+"""
+Matcher of the ignore globs of the config, compiled once and applied while walking the source tree
+"""
+import fnmatch
+import logging
+import os
+import re
+
+from snakefood.util import def_ignores, is_python
+
+
+class IgnoreMatcher(object):
+    def __init__(self, ignore_globs=None):
+        """
+        :param ignore_globs: glob or list of globs matched against the real path of each file
+        """
+        if isinstance(ignore_globs, basestring):
+            ignore_globs = [ignore_globs]
+        self.ignore_globs = [ignore_glob for ignore_glob in ignore_globs or [] if ignore_glob]
+        self._file_pattern = _compile(self.ignore_globs)
+        # a directory whose path followed by a separator matches a glob ending with "*" only contains files
+        # matching that glob, so it doesn't need to be walked
+        self._dir_pattern = _compile([ignore_glob for ignore_glob in self.ignore_globs if ignore_glob.endswith("*")])
+
+    def __nonzero__(self):
+        return bool(self.ignore_globs)
+
+    __bool__ = __nonzero__
+
+    def matches(self, path):
+        """True if the file path matches one of the ignore globs"""
+        return self._file_pattern is not None and self._file_pattern.match(path) is not None
+
+    def prunes(self, dir_path):
+        """True if all the files under the directory match one of the ignore globs"""
+        return self._dir_pattern is not None and self._dir_pattern.match(os.path.join(dir_path, "")) is not None
+
+    def iter_pyfiles(self, paths, ignored_dir_names=None):
+        """
+        Like snakefood.util.iter_pyfiles, but skips the ignored files and does not walk the pruned directories
+
+        :param paths: list of files or directories
+        :param ignored_dir_names: names of the directories never walked, default snakefood.util.def_ignores
+        :return: generator of the real paths of the python files
+        """
+        ignored_dir_names = set(ignored_dir_names or def_ignores)
+        for path in paths:
+            path = os.path.realpath(path)
+            if not os.path.exists(path):
+                logging.warning("File '%s' does not exist." % path)
+            elif not os.path.isdir(path):
+                if is_python(path) and not self.matches(path):
+                    yield path
+            elif not self.prunes(path):
+                for root, dirs, files in os.walk(path):
+                    dirs[:] = [name for name in dirs
+                               if name not in ignored_dir_names and not self.prunes(os.path.join(root, name))]
+                    for file_name in files:
+                        file_path = os.path.join(root, file_name)
+                        if is_python(file_path) and not self.matches(file_path):
+                            yield file_path
+
+
+def _compile(globs):
+    if not globs:
+        return None
+    return re.compile("|".join("(?:{})".format(fnmatch.translate(glob)) for glob in globs))
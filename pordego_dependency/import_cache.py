@@ -0,0 +1,145 @@
+"""
+Persistent on-disk cache of the files each source file imports, so unchanged files skip parsing
+"""
+import hashlib
+import json
+import os
+import sys
+from logging import getLogger
+
+logger = getLogger(__name__)
+
+CACHE_FILE_FORMAT = "imports-{}.json"
+
+
+class ImportCache(object):
+    def __init__(self, cache_dir, resolver_inputs=None):
+        """
+        :param cache_dir: directory where the cache files are stored, None to only keep the cache in memory
+        :param resolver_inputs: values that affect import resolution (source roots, package roots...).
+            Cached entries are only reused when the resolver inputs are identical.
+        """
+        self.cache_dir = cache_dir
+        self.resolver_inputs = resolver_inputs
+        self.fingerprint = build_fingerprint(resolver_inputs)
+        self.hits = 0
+        self.misses = 0
+        self._entries = None
+        self._new_entries = {}
+
+    @property
+    def cache_path(self):
+        return os.path.join(self.cache_dir, CACHE_FILE_FORMAT.format(self.fingerprint))
+
+    @property
+    def entries(self):
+        if self._entries is None:
+            self._entries = self._load()
+        return self._entries
+
+    @property
+    def new_entries(self):
+        """Entries added or refreshed since the cache was loaded"""
+        return self._new_entries
+
+    def take_new_entries(self):
+        """Return the new entries and forget them, for handing them over to another cache"""
+        new_entries, self._new_entries = self._new_entries, {}
+        return new_entries
+
+    def get(self, file_name):
+        """
+        :return: list of imported files, or None if the file changed or is not in the cache
+        """
+        entry = self.entries.get(file_name)
+        if entry is not None:
+            mtime, size, content_hash, imported_files = entry
+            try:
+                stat = os.stat(file_name)
+            except OSError:
+                stat = None
+            if stat is not None:
+                if (stat.st_mtime, stat.st_size) == (mtime, size):
+                    self.hits += 1
+                    return imported_files
+                if stat.st_size == size and hash_file(file_name) == content_hash:
+                    # touched but not modified
+                    self.update({file_name: [stat.st_mtime, size, content_hash, imported_files]})
+                    self.hits += 1
+                    return imported_files
+        self.misses += 1
+        return None
+
+    def set(self, file_name, imported_files):
+        stat = os.stat(file_name)
+        self.update({file_name: [stat.st_mtime, stat.st_size, hash_file(file_name), list(imported_files)]})
+
+    def update(self, entries):
+        """Merge raw entries (e.g. the new_entries of a cache used by another process)"""
+        self.entries.update(entries)
+        self._new_entries.update(entries)
+
+    def save(self):
+        if not self.cache_dir or not self._new_entries:
+            return
+        if not os.path.isdir(self.cache_dir):
+            os.makedirs(self.cache_dir)
+        temp_path = "{}.{}.tmp".format(self.cache_path, os.getpid())
+        with open(temp_path, "w") as f:
+            json.dump(self.entries, f)
+        if os.path.exists(self.cache_path) and sys.platform == "win32":
+            os.remove(self.cache_path)
+        os.rename(temp_path, self.cache_path)
+        self._new_entries = {}
+
+    def log_stats(self):
+        logger.info("Import cache: %s hits, %s misses", self.hits, self.misses)
+
+    def _load(self):
+        if not self.cache_dir or not os.path.exists(self.cache_path):
+            return {}
+        try:
+            with open(self.cache_path) as f:
+                return json.load(f)
+        except (IOError, ValueError):
+            logger.warning("Ignoring unreadable import cache at %s", self.cache_path)
+            return {}
+
+
+def build_fingerprint(resolver_inputs):
+    """Hash of everything that affects how an import is resolved to a file"""
+    fingerprint_data = [sys.version, sys.executable, os.getcwd(), sys.path, resolver_inputs]
+    return hashlib.sha1(json.dumps(fingerprint_data, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def build_resolver_inputs(source_paths, root_cache):
+    """
+    Values that affect how the imports of the local files resolve: the source paths, the local packages and modules,
+    and the entries of the sys.path directories, which change when a distribution is installed or removed
+
+    :param root_cache: dict of file path: package root of all the local modules, see snakefood_lib.preload_packages
+    """
+    return [sorted(source_paths), sorted(set(root_cache.values())), hash_names(root_cache),
+            hash_names(list_sys_path_entries())]
+
+
+def list_sys_path_entries():
+    """
+    :return: generator of the paths of the files and directories directly under each sys.path directory
+    """
+    for path_entry in sys.path:
+        try:
+            names = os.listdir(path_entry or ".")
+        except OSError:
+            continue
+        for name in names:
+            yield os.path.join(path_entry, name)
+
+
+def hash_names(names):
+    return hashlib.sha1("\n".join(sorted(names)).encode("utf-8")).hexdigest()
+
+
+def hash_file(file_name):
+    with open(file_name, "rb") as f:
+        return hashlib.sha1(f.read()).hexdigest()
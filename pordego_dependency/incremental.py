@@ -0,0 +1,189 @@
+"""
+Incremental checks: only rebuild the dependencies of packages affected by a set of changed files
+"""
+import os
+import pickle
+from logging import getLogger
+from subprocess import check_output, CalledProcessError, STDOUT
+
+logger = getLogger(__name__)
+
+RESULTS_FILE_FORMAT = "package-dependencies-{}.pickle"
+
+
+class ResultStore(object):
+    """
+    Package dependency sets of the previous runs, stored in the cache dir in one file per fingerprint.
+    Each package is stored as a pickled (package path, size) header followed by its pickled dependencies, so that
+    the packages can be listed and read one at a time without loading the whole file.
+    """
+
+    def __init__(self, cache_dir, fingerprint):
+        self.cache_dir = cache_dir
+        self.fingerprint = fingerprint
+
+    @property
+    def results_path(self):
+        return os.path.join(self.cache_dir, RESULTS_FILE_FORMAT.format(self.fingerprint))
+
+    def load(self):
+        """
+        :return: dict of package path: set of dependencies, empty if there is no usable stored result
+        """
+        return dict(self.iter_results())
+
+    def package_paths(self):
+        """
+        :return: set of the paths of the stored packages, their dependencies are not read
+        """
+        return {package_path for package_path, data in self._iter_records(read_data=False)}
+
+    def iter_results(self, package_paths=None):
+        """
+        Read the stored results one package at a time
+
+        :param package_paths: only read these packages, default all the stored packages
+        :return: generator of (package path, set of dependencies)
+        """
+        for package_path, data in self._iter_records(package_paths):
+            yield package_path, pickle.loads(data)
+
+    def open_writer(self):
+        """
+        :return: ResultWriter which stores the results one package at a time
+        """
+        return ResultWriter(self)
+
+    def save(self, package_dependency_map):
+        writer = self.open_writer()
+        for package_path, dependencies in package_dependency_map.items():
+            writer.write(package_path, dependencies)
+        writer.close()
+
+    def _iter_records(self, package_paths=None, read_data=True):
+        """
+        :return: generator of (package path, pickled dependencies), the data is None if it is not read
+        """
+        if not os.path.exists(self.results_path):
+            return
+        with open(self.results_path, "rb") as f:
+            try:
+                fingerprint = pickle.load(f)
+            except Exception:
+                logger.warning("Ignoring unreadable dependency results at %s", self.results_path)
+                return
+            if fingerprint != self.fingerprint:
+                logger.info("Stored dependency results were built with a different configuration, ignoring them")
+                return
+            while True:
+                try:
+                    package_path, size = pickle.load(f)
+                except EOFError:
+                    return
+                except Exception:
+                    logger.warning("Ignoring the rest of the unreadable dependency results at %s", self.results_path)
+                    return
+                if read_data and (package_paths is None or package_path in package_paths):
+                    yield package_path, f.read(size)
+                else:
+                    f.seek(size, os.SEEK_CUR)
+                    if not read_data:
+                        yield package_path, None
+
+
+class ResultWriter(object):
+    """
+    Writes the package dependency sets to a temporary file as they are built.
+    On close the stored results of the packages that were not written again are kept, and the file replaces the
+    stored results.
+    """
+
+    def __init__(self, result_store):
+        """
+        :type result_store: ResultStore
+        """
+        self.result_store = result_store
+        if not os.path.isdir(result_store.cache_dir):
+            os.makedirs(result_store.cache_dir)
+        self.temp_path = "{}.{}.tmp".format(result_store.results_path, os.getpid())
+        self._file = open(self.temp_path, "wb")
+        self._written_paths = set()
+        pickle.dump(result_store.fingerprint, self._file, pickle.HIGHEST_PROTOCOL)
+
+    def write(self, package_path, dependencies):
+        self._write_record(package_path, pickle.dumps(dependencies, pickle.HIGHEST_PROTOCOL))
+
+    def close(self):
+        for package_path, data in self.result_store._iter_records():
+            if package_path not in self._written_paths:
+                self._write_record(package_path, data)
+        self._file.close()
+        results_path = self.result_store.results_path
+        if os.path.exists(results_path):
+            os.remove(results_path)
+        os.rename(self.temp_path, results_path)
+
+    def abort(self):
+        """Discard the written results and keep the stored results unchanged"""
+        self._file.close()
+        os.remove(self.temp_path)
+
+    def _write_record(self, package_path, data):
+        pickle.dump((package_path, len(data)), self._file, pickle.HIGHEST_PROTOCOL)
+        self._file.write(data)
+        self._written_paths.add(package_path)
+
+
+def get_changed_files(base_revision, repo_path="."):
+    """
+    List the files changed in the local repository since base_revision, including uncommitted and untracked files
+
+    :return: list of absolute file paths
+    """
+    try:
+        top_level = git_output(["rev-parse", "--show-toplevel"], repo_path).strip()
+        changed = git_output(["diff", "--name-only", base_revision, "--"], repo_path).splitlines()
+        untracked = git_output(["ls-files", "--others", "--exclude-standard"], top_level).splitlines()
+    except CalledProcessError as e:
+        raise Exception("Unable to list files changed since {}: {}".format(base_revision, e.output))
+    return [os.path.join(top_level, path) for path in changed + untracked if path]
+
+
+def git_output(args, cwd):
+    return check_output(["git"] + args, cwd=cwd, stderr=STDOUT).decode("utf-8")
+
+
+def find_changed_package_paths(package_paths, changed_files):
+    """
+    :param package_paths: paths of the packages to check
+    :param changed_files: paths of the changed files
+    :return: set of the package paths containing at least one of the changed files
+    """
+    real_package_paths = {os.path.join(os.path.realpath(path), ""): path for path in package_paths}
+    changed_package_paths = set()
+    for changed_file in changed_files:
+        real_file_path = os.path.realpath(changed_file)
+        for real_package_path, package_path in real_package_paths.items():
+            if real_file_path.startswith(real_package_path):
+                changed_package_paths.add(package_path)
+    return changed_package_paths
+
+
+def select_inputs_to_rebuild(dependency_inputs, changed_files, stored_results, package_roots=None):
+    """
+    Select the inputs that contain changed files, whose allowed dependencies reference a changed package,
+    or that have no stored result
+
+    :param dependency_inputs: list of DependencyCheckInput instances
+    :param changed_files: paths of the changed files
+    :param stored_results: paths of the packages stored by a previous run (or dict of package path: dependencies)
+    :param package_roots: paths of all the local packages, including the ones that are not analyzed
+    :return: list of DependencyCheckInput instances
+    """
+    package_paths = {dci.package_path for dci in dependency_inputs} | set(package_roots or [])
+    changed_package_paths = find_changed_package_paths(package_paths, changed_files)
+    changed_package_names = {os.path.basename(path) for path in changed_package_paths}
+    return [dci for dci in dependency_inputs
+            if dci.package_path in changed_package_paths
+            or dci.package_path not in stored_results
+            or changed_package_names.intersection(dci.allowed_dependency)]
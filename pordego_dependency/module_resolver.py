@@ -0,0 +1,250 @@
+"""
+Resolution of imported module names to files for the snakefood finder, memoized per import and backed by
+snapshots of the directory listings instead of probing the filesystem for every import
+"""
+import os
+import sys
+import threading
+from collections import defaultdict, OrderedDict
+from contextlib import contextmanager
+
+import snakefood.find as finder
+from pordego_dependency.dependency_tools import UNKNOWN_PACKAGE
+
+try:
+    import imp
+    MODULE_SUFFIXES = [suffix for suffix, mode, module_type in imp.get_suffixes()]
+    is_builtin_or_frozen = lambda name: bool(imp.is_builtin(name) or imp.is_frozen(name))
+except ImportError:
+    from importlib.machinery import all_suffixes
+    MODULE_SUFFIXES = all_suffixes()
+    is_builtin_or_frozen = lambda name: name in sys.builtin_module_names
+
+DEFAULT_MAX_ENTRIES = 100000
+
+_active_resolvers = threading.local()
+
+
+class LRUCache(object):
+    """Dict bounded to max_entries, the least recently used entries are evicted first"""
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key, default=None):
+        try:
+            value = self._entries.pop(key)
+        except KeyError:
+            return default
+        self._entries[key] = value
+        return value
+
+    def set(self, key, value):
+        self._entries.pop(key, None)
+        self._entries[key] = value
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        self._entries.clear()
+
+
+class ModuleResolver(object):
+    """
+    Resolver context of an analysis run: the module cache of the preloaded packages and the memoized resolutions.
+    It can be shared by threads, and separate resolvers can be used concurrently. The lock only guards the caches,
+    the directory listings and the resolutions themselves run outside of it.
+    """
+
+    def __init__(self, module_cache=None, max_entries=DEFAULT_MAX_ENTRIES):
+        """
+        :param module_cache: dict of module name: list of files of the module, like snakefood.find.module_cache
+        :param max_entries: maximum number of memoized resolutions, directory listings and real paths each
+        """
+        self.module_cache = module_cache if module_cache is not None else defaultdict(list)
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._resolutions = LRUCache(max_entries)
+        self._listings = LRUCache(max_entries)
+        self._real_paths = LRUCache(max_entries)
+
+    def reset(self, module_cache=None):
+        """
+        Forget the resolved imports and the directory listings, for example after files were added or removed
+
+        :param module_cache: replaces the content of the module cache if given
+        """
+        with self._lock:
+            if module_cache is not None:
+                self.module_cache.clear()
+                self.module_cache.update(module_cache)
+            self._resolutions.clear()
+            self._listings.clear()
+            self._real_paths.clear()
+            self.hits = self.misses = 0
+
+    def add_module(self, modname, file_name):
+        with self._lock:
+            self.module_cache[modname].append(file_name)
+
+    @contextmanager
+    def activate(self):
+        """Resolve the imports found by snakefood in the current thread with this resolver"""
+        previous = getattr(_active_resolvers, "resolver", None)
+        _active_resolvers.resolver = self
+        try:
+            yield self
+        finally:
+            _active_resolvers.resolver = previous
+
+    def find_dotted_module(self, modname, rname, parentdir, level):
+        """
+        A version of find_module that supports dotted module names (packages).  This
+        function returns the filename of the module if found, otherwise returns
+        None.
+
+        If 'rname' is not None, it first attempts to import 'modname.rname', and if it
+        fails, it must therefore not be a module, so we look up 'modname' and return
+        that instead.
+
+        'parentdir' is the directory of the file that attempts to do the import.  We
+        attempt to do a local import there first.
+
+        'level' is the level of a relative import (i.e. the number of leading dots).
+        If 0, the import is absolute.
+
+        The result of each (modname, rname, parentdir, level) is memoized. Threads resolving the same key at the same
+        time may both compute it, they get the same result.
+        """
+        key = (modname, rname, parentdir, level)
+        with self._lock:
+            fn = self._resolutions.get(key, self)
+            if fn is not self:
+                self.hits += 1
+                return fn, []
+            self.misses += 1
+        fn = self._find_dotted_module(modname, rname, parentdir, level)
+        with self._lock:
+            self._resolutions.set(key, fn)
+        return fn, []
+
+    def _find_dotted_module(self, modname, rname, parentdir, level):
+        # Check for builtins.
+        if modname in finder.builtin_module_names:
+            return os.path.join(finder.libpath, modname)
+
+        names = modname.split('.')
+        for i in range(level - 1):
+            parentdir = os.path.dirname(parentdir)
+        # Try relative import, then global imports.
+        fn = self.find_dotted(names, parentdir)
+        if not fn:
+            with self._lock:
+                is_cached = modname in self.module_cache
+            if not is_cached:
+                fn = self.find_dotted(names)
+            with self._lock:
+                # another thread may have added the module in the meantime
+                if not is_cached and fn and modname not in self.module_cache:
+                    self.module_cache[modname].append(fn)
+                file_names = list(self.module_cache[modname])
+            if not file_names:
+                file_names = [os.path.join(UNKNOWN_PACKAGE, modname)]
+            fn = file_names[0]
+        else:
+            file_names = [fn]
+
+        # If this is a from-form, try the target symbol as a module.
+        if rname:
+            for name in file_names:
+                fn2 = self.find_dotted([rname], os.path.dirname(name))
+                if fn2:
+                    return fn2
+            # Pass-thru and return the filename of the parent, which was found.
+        return fn
+
+    def find_dotted(self, names, parentdir=None):
+        """
+        Same result as snakefood.find.find_dotted, looking the names up in directory listing snapshots
+
+        :param names: list of path components
+        :param parentdir: directory to search, None to search sys.path
+        """
+        filename = None
+        for name in names:
+            if parentdir is None:
+                filename = self._find_in_sys_path(name)
+            else:
+                filename = self._find_in_dir(name, self._realpath(parentdir))
+            if not filename:
+                return None
+            parentdir = os.path.dirname(filename)
+        return filename
+
+    def _find_in_sys_path(self, name):
+        if is_builtin_or_frozen(name):
+            return None
+        for path_entry in sys.path:
+            filename = self._find_in_dir(name, path_entry)
+            if filename:
+                return filename
+        return None
+
+    def _find_in_dir(self, name, dir_path):
+        """
+        Like imp.find_module(name, [dir_path]): a package directory comes first, then the module suffixes in order
+
+        :return: path of the module, or of the __init__ module of a package
+        """
+        listing = self._listing(dir_path)
+        if not listing:
+            return None
+        if name in listing:
+            package_path = os.path.join(dir_path, name)
+            package_listing = self._listing(package_path)
+            if package_listing and ("__init__.py" in package_listing or "__init__.pyc" in package_listing):
+                package_path = self._realpath(package_path)
+                for suffix in MODULE_SUFFIXES:
+                    if "__init__" + suffix in package_listing:
+                        return os.path.join(package_path, "__init__" + suffix)
+        for suffix in MODULE_SUFFIXES:
+            if name + suffix in listing:
+                return os.path.join(dir_path, name + suffix)
+        return None
+
+    def _realpath(self, path):
+        with self._lock:
+            real_path = self._real_paths.get(path)
+        if real_path is None:
+            real_path = os.path.realpath(path)
+            with self._lock:
+                self._real_paths.set(path, real_path)
+        return real_path
+
+    def _listing(self, dir_path):
+        """
+        :return: frozenset of the names in the directory, None if it isn't a readable directory
+        """
+        with self._lock:
+            listing = self._listings.get(dir_path, self)
+        if listing is self:
+            try:
+                listing = frozenset(os.listdir(dir_path or "."))
+            except OSError:
+                listing = None
+            with self._lock:
+                self._listings.set(dir_path, listing)
+        return listing
+
+
+def get_active_resolver(default=None):
+    """
+    :return: ModuleResolver activated in the current thread, default if there is none
+    """
+    return getattr(_active_resolvers, "resolver", None) or default
@@ -0,0 +1,121 @@
+"""
+Builds package dependencies in a pool of worker processes
+"""
+import time
+from multiprocessing import Pool
+
+from pordego_dependency.import_cache import ImportCache
+from pordego_dependency.module_resolver import ModuleResolver
+from pordego_dependency.snakefood_lib import DependencyBuilder, module_resolver
+from pordego_dependency.stage_timer import StageTimer
+
+# state shipped once to each worker process by init_worker
+_worker_state = {}
+
+
+def build_packages_in_pool(dependency_check_inputs, workers, source_paths, root_cache, import_cache=None,
+                           extractor=None, stage_timer=None, resolver=None, classifier=None, module_imports=None):
+    """
+    Build the dependencies of each package in a separate worker process
+
+    :return: dict of package path: set of dependencies, see iter_packages_in_pool for the parameters
+    """
+    return dict(iter_packages_in_pool(dependency_check_inputs, workers, source_paths, root_cache,
+                                      import_cache=import_cache, extractor=extractor, stage_timer=stage_timer,
+                                      resolver=resolver, classifier=classifier, module_imports=module_imports))
+
+
+def iter_packages_in_pool(dependency_check_inputs, workers, source_paths, root_cache, import_cache=None,
+                          extractor=None, stage_timer=None, resolver=None, classifier=None, module_imports=None):
+    """
+    Build the dependencies of each package in a separate worker process, yielding each package as soon as it is built
+
+    :param dependency_check_inputs: list of DependencyCheckInput instances
+    :param workers: number of worker processes
+    :type import_cache: pordego_dependency.import_cache.ImportCache
+    :param extractor: name of the import extractor used by the DependencyBuilder
+    :param stage_timer: receives the build time of each package and the parse time of each file
+    :type stage_timer: pordego_dependency.stage_timer.StageTimer
+    :param resolver: its module cache is copied to the resolver of each worker, default the process wide resolver
+    :type resolver: pordego_dependency.module_resolver.ModuleResolver
+    :param classifier: classifier copied to each worker, default the classifier of the interpreter
+    :type classifier: pordego_dependency.dependency_tools.ModuleClassifier
+    :param module_imports: list receiving the (file, imported files) of the files built by the workers,
+        extended before each package is yielded
+    :return: generator of (package path, set of dependencies)
+    """
+    # like the serial build, each package path is built once, for the first of its inputs by name
+    inputs_by_path = {}
+    for dci in sorted(dependency_check_inputs, key=lambda dep: dep.input_package):
+        inputs_by_path.setdefault(dci.package_path, dci)
+    # biggest packages first so that a large package does not end up running alone at the end
+    jobs = sorted([(dci.input_package, dci.package_path, dci.files) for dci in inputs_by_path.values()],
+                  key=lambda job: len(job[2]), reverse=True)
+    cache_args = (import_cache.cache_dir, import_cache.resolver_inputs) if import_cache is not None else None
+    resolver = resolver or module_resolver
+    pool = Pool(workers, initializer=init_worker,
+                initargs=(source_paths, root_cache, dict(resolver.module_cache), cache_args, extractor,
+                          resolver.max_entries, classifier, module_imports is not None))
+    try:
+        for package_path, dependencies, cache_stats, timings, package_module_imports in pool.imap_unordered(
+                build_package, jobs, chunksize=1):
+            if stage_timer is not None:
+                seconds, file_times, counters = timings
+                stage_timer.record_package(package_path, seconds)
+                stage_timer.update(file_times, counters)
+            if import_cache is not None:
+                new_entries, hits, misses = cache_stats
+                import_cache.update(new_entries)
+                import_cache.hits += hits
+                import_cache.misses += misses
+            if module_imports is not None:
+                module_imports.extend(package_module_imports)
+            yield package_path, dependencies
+    except GeneratorExit:
+        # the consumer stopped early, don't wait for the remaining packages
+        pool.terminate()
+        raise
+    finally:
+        pool.close()
+        pool.join()
+
+
+def init_worker(source_paths, root_cache, module_cache, cache_args, extractor, resolver_max_entries,
+                classifier=None, collect_module_imports=False):
+    resolver = ModuleResolver(max_entries=resolver_max_entries)
+    resolver.reset(module_cache)
+    _worker_state["resolver"] = resolver
+    # files shared by several packages are parsed once per worker, not once per run
+    _worker_state["parse_memo"] = {}
+    _worker_state["source_paths"] = source_paths
+    _worker_state["root_cache"] = root_cache
+    _worker_state["extractor"] = extractor
+    _worker_state["classifier"] = classifier
+    _worker_state["import_cache"] = ImportCache(*cache_args) if cache_args is not None else None
+    _worker_state["collect_module_imports"] = collect_module_imports
+
+
+def build_package(job):
+    input_package, package_path, files = job
+    start_time = time.time()
+    stage_timer = StageTimer()
+    import_cache = _worker_state["import_cache"]
+    if import_cache is not None:
+        import_cache.hits = import_cache.misses = 0
+    module_imports = [] if _worker_state["collect_module_imports"] else None
+    dependency_builder = DependencyBuilder(input_package, files,
+                                           source_path=_worker_state["source_paths"],
+                                           root_cache=_worker_state["root_cache"],
+                                           import_cache=import_cache,
+                                           extractor=_worker_state["extractor"],
+                                           classifier=_worker_state["classifier"],
+                                           stage_timer=stage_timer,
+                                           resolver=_worker_state["resolver"],
+                                           parse_memo=_worker_state["parse_memo"],
+                                           module_imports=module_imports)
+    dependencies = dependency_builder.build()
+    cache_stats = None
+    if import_cache is not None:
+        cache_stats = (import_cache.take_new_entries(), import_cache.hits, import_cache.misses)
+    timings = (time.time() - start_time, stage_timer.file_times, dict(stage_timer.counters))
+    return package_path, dependencies, cache_stats, timings, module_imports
@@ -3,83 +3,215 @@ import os
 import shutil
 import sys
 import tarfile
+import threading
 import zipfile
-from collections import namedtuple
+from collections import namedtuple, defaultdict
 from contextlib import contextmanager, closing
 from logging import getLogger
+from multiprocessing.pool import ThreadPool
 from subprocess import check_call, CalledProcessError, check_output, STDOUT
 from tempfile import NamedTemporaryFile, mkdtemp
 
 import pkg_resources
 import requests
 from requests import ConnectionError
-from requests.exceptions import ReadTimeout
+from requests.adapters import HTTPAdapter
+from requests.exceptions import ReadTimeout, RetryError
+from requests.packages.urllib3.util.retry import Retry
+
+from pordego_dependency.setup_metadata import SetupMetadataCache, hash_metadata_files, read_static_metadata, \
+    create_static_distribution
 
 logger = getLogger(__name__)
 
+# concurrent requests to a single host, kept small so that a package server is not flooded
+DEFAULT_MAX_PER_HOST = 4
+
 
 CachedDistribution = namedtuple("CachedDistribution", ["distribution", "top_level_packages"])
 
 
 class RequirementResolver(object):
     def __init__(self, local_source_package_map=None, package_server_url=None, pip_options=None,
-                 local_package_names=None, ignore_third_party=True):
+                 local_package_names=None, ignore_third_party=True, max_workers=8, max_per_host=None,
+                 request_timeout=10, retries=2, backoff_factor=0.3, distribution_cache=None, pip_batch_size=None,
+                 metadata_cache=None):
+        """
+        :param max_workers: number of concurrent requests to the package server (size of the connection pool)
+        :param max_per_host: maximum number of concurrent requests to a single host, default DEFAULT_MAX_PER_HOST
+        :param request_timeout: timeout in seconds of each request
+        :param retries: number of retries of a failed request, with exponential backoff
+        :param backoff_factor: backoff factor in seconds between retries
+        :type distribution_cache: pordego_dependency.distribution_cache.DistributionCache
+        :param pip_batch_size: maximum number of requirements downloaded by each pip run, default all in one run
+        :param metadata_cache: metadata of the downloaded packages, default a cache held by this resolver only
+        :type metadata_cache: pordego_dependency.setup_metadata.SetupMetadataCache
+        """
         self.package_server_url = package_server_url or "https://pypi.python.org/pypi"
         self.pip_options = pip_options or {}
         self.local_package_names = local_package_names or set()
         self.package_server_not_responding = False
         self.cached_dists = {}
-        self.cached_dists.update(local_source_package_map or {})
+        self.pip_runs = 0
+        self.pip_batch_size = pip_batch_size
+        self.metadata_cache = metadata_cache if metadata_cache is not None else SetupMetadataCache()
+        self._top_level_index = {}
+        # requirements that could not be resolved, so that they are not looked up again
+        self._unresolved_requirements = set()
+        self._parsed_requirements = {}
+        self.add_distributions(local_source_package_map or {})
         self.ignore_third_party = ignore_third_party
-        self.session = requests.session()
+        self.distribution_cache = distribution_cache
+        self.max_workers = max_workers
+        self.request_timeout = request_timeout
+        self.session = build_session(max_workers, retries, backoff_factor)
+        max_per_host = max_per_host or DEFAULT_MAX_PER_HOST
+        self._host_semaphores = defaultdict(lambda: threading.BoundedSemaphore(max_per_host))
+        self._host_semaphores_lock = threading.Lock()
 
     def filter_existing_requirements(self, requirements):
-        exist_requires = []
-        for req in requirements:
-            try:
-                url = self.package_server_url+"/{}".format(req)
-                r = self.session.head(url, headers={"Accept": "application/json"})
-            except (ConnectionError, ReadTimeout):
-                self.package_server_not_responding = True
-                break
-            else:
-                if r.status_code == requests.codes.ok:
-                    exist_requires.append(req)
-        return exist_requires
+        """
+        Check concurrently which requirements exist on the package server
+
+        :return: list of the existing requirements, in the order of requirements
+        """
+        requirements = list(requirements)
+        if not requirements:
+            return []
+        pool = ThreadPool(min(self.max_workers, len(requirements)))
+        try:
+            exists = pool.map(self.requirement_exists, requirements)
+        finally:
+            pool.close()
+            pool.join()
+        return [req for req, req_exists in zip(requirements, exists) if req_exists]
+
+    def requirement_exists(self, req):
+        if self.package_server_not_responding:
+            return False
+        url = self.package_server_url+"/{}".format(req)
+        try:
+            with self._host_semaphore(url):
+                r = self.session.head(url, headers={"Accept": "application/json"}, timeout=self.request_timeout)
+        except (ConnectionError, ReadTimeout, RetryError):
+            self.package_server_not_responding = True
+            return False
+        return r.status_code == requests.codes.ok
+
+    def _host_semaphore(self, url):
+        host = requests.utils.urlparse(url).netloc
+        with self._host_semaphores_lock:
+            return self._host_semaphores[host]
+
+    def add_distributions(self, dist_package_map):
+        """
+        Add distributions to the cache and to the index of top level package name: distribution
+
+        :param dist_package_map: dict of dist key: CachedDistribution
+        """
+        self.cached_dists.update(dist_package_map)
+        for cached_dist in dist_package_map.values():
+            for package_name in cached_dist.top_level_packages:
+                self._top_level_index.setdefault(package_name, cached_dist.distribution)
+
+    def get_dist_from_package(self, package_name):
+        """
+        :return: distribution exporting the top level package, None if unknown
+        """
+        return self._top_level_index.get(package_name)
+
+    def parse_requirement(self, requirement):
+        """Memoized pkg_resources.Requirement.parse"""
+        try:
+            return self._parsed_requirements[requirement]
+        except KeyError:
+            parsed_requirement = self._parsed_requirements[requirement] = pkg_resources.Requirement.parse(requirement)
+            return parsed_requirement
 
     def filter_local_packages(self, requirements):
         return [req for req in requirements if req not in self.local_package_names]
 
     def resolve_requirements(self, requirements):
+        """
+        Find the distribution of each requirement, from the known distributions, the distribution cache or the
+        package server. Requirements that can't be resolved are remembered and not looked up again, so resolving
+        the requirements of all the packages at once makes later calls purely in memory.
+
+        :return: dict of dist key: CachedDistribution of the resolved requirements
+        """
         tlp_map = {}
         not_found_reqs = []
-        for req in requirements:
-            dist = get_dist_from_package(req, self.cached_dists)
-            if dist:
-                tlp_map[dist.key] = self.cached_dists[dist.key]
-            else:
+        for req in sorted(set(requirements)):
+            cached_dist = self._find_cached_dist(req)
+            if cached_dist:
+                tlp_map[cached_dist.distribution.key] = cached_dist
+            elif req not in self._unresolved_requirements:
                 not_found_reqs.append(req)
         if not_found_reqs and not self.ignore_third_party:
-            not_found_reqs = self.filter_existing_requirements(self.filter_local_packages(not_found_reqs))
-            found_pkg_map = self.resolve_packages_from_pypi(not_found_reqs)
-            self.cached_dists.update(found_pkg_map)
+            looked_up_reqs = not_found_reqs
+            not_found_reqs = self.filter_local_packages(not_found_reqs)
+            found_pkg_map, not_found_reqs = self.resolve_from_distribution_cache(not_found_reqs)
+            not_found_reqs = self.filter_existing_requirements(not_found_reqs)
+            pypi_pkg_map = self.resolve_packages_from_pypi(not_found_reqs)
+            self.store_in_distribution_cache(pypi_pkg_map)
+            found_pkg_map.update(pypi_pkg_map)
+            self.add_distributions(found_pkg_map)
             tlp_map.update(found_pkg_map)
+            self._unresolved_requirements.update(req for req in looked_up_reqs if not self._find_cached_dist(req))
         return tlp_map
 
+    def _find_cached_dist(self, requirement):
+        """
+        :return: CachedDistribution exporting the requirement as top level package or named like the requirement
+        """
+        dist = self.get_dist_from_package(requirement)
+        if dist:
+            return self.cached_dists[dist.key]
+        return self.cached_dists.get(self.parse_requirement(requirement).key)
+
+    def resolve_from_distribution_cache(self, requirements):
+        """
+        :return: tuple of (dict of dist key: CachedDistribution, list of requirements not in the cache)
+        """
+        found_pkg_map = {}
+        not_found_reqs = []
+        for req in requirements:
+            cached_dist = self.distribution_cache.get(req) if self.distribution_cache is not None else None
+            if cached_dist:
+                found_pkg_map[cached_dist.distribution.key] = cached_dist
+            else:
+                not_found_reqs.append(req)
+        if found_pkg_map:
+            logger.info("Resolved requirements %s from the distribution cache", sorted(found_pkg_map))
+        return found_pkg_map, not_found_reqs
+
+    def store_in_distribution_cache(self, found_pkg_map):
+        if self.distribution_cache is None or not found_pkg_map:
+            return
+        for cached_dist in found_pkg_map.values():
+            self.distribution_cache.add(cached_dist)
+        self.distribution_cache.save()
+
     def resolve_installed_packages(self, requirements):
         dist = pkg_resources
 
     def resolve_packages_from_pypi(self, requirements):
+        """
+        Download the requirements with pip, in batches of pip_batch_size requirements
+        """
         if self.package_server_not_responding:
             logger.warning("Skipping requirements resolution because package server is not responding")
             return {}
         if not requirements:
             return {}
+        requirements = list(requirements)
+        batch_size = self.pip_batch_size or len(requirements)
         logger.info("Resolving requirements %s from pypi", requirements)
-        with write_temp_req_file(requirements) as req_file_path:
-            with temp_dir() as temp_path:
-                self.run_pip_resolve_command(temp_path, req_file_path)
-                return get_top_level_package_map(temp_path)
+        with temp_dir() as temp_path:
+            for start in range(0, len(requirements), batch_size):
+                with write_temp_req_file(requirements[start:start + batch_size]) as req_file_path:
+                    self.run_pip_resolve_command(temp_path, req_file_path)
+            return get_top_level_package_map(temp_path, self.metadata_cache)
 
     def build_pip_resolve_command(self, install_path, req_file_path):
         command = ["pip", "download", "--no-deps", "--disable-pip-version-check", "--dest", install_path,
@@ -91,6 +223,7 @@ class RequirementResolver(object):
         return command
 
     def run_pip_resolve_command(self, temp_path, req_file_path):
+        self.pip_runs += 1
         with open(os.devnull, "w") as f:
             try:
                 check_call(self.build_pip_resolve_command(temp_path, req_file_path), stderr=STDOUT)
@@ -105,10 +238,50 @@ class RequirementResolver(object):
         return pip_options
 
 
-def get_top_level_package_map(base_path):
+def build_session(pool_size, retries, backoff_factor):
+    """Session with a bounded connection pool that retries failed requests with an exponential backoff"""
+    session = requests.session()
+    retry = Retry(total=retries, connect=retries, read=retries, backoff_factor=backoff_factor,
+                  status_forcelist=[500, 502, 503, 504], raise_on_status=False)
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry, pool_block=True)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def discover_distributions(package_paths, metadata_cache=None, max_workers=8):
+    """
+    Find the distribution and the top level packages of each local package concurrently
+
+    :type metadata_cache: pordego_dependency.setup_metadata.SetupMetadataCache
+    :param max_workers: number of packages processed at the same time
+    :return: list of (package path, CachedDistribution), in the order of package_paths
+    """
+    package_paths = list(package_paths)
+    if not package_paths:
+        return []
+
+    def discover(package_path):
+        dist = get_distribution(package_path, metadata_cache)
+        return package_path, CachedDistribution(dist, get_top_level_packages(package_path))
+
+    if max_workers <= 1:
+        return [discover(package_path) for package_path in package_paths]
+    pool = ThreadPool(min(max_workers, len(package_paths)))
+    try:
+        return pool.map(discover, package_paths)
+    finally:
+        pool.close()
+        pool.join()
+
+
+def get_top_level_package_map(base_path, metadata_cache=None):
+    """
+    :type metadata_cache: pordego_dependency.setup_metadata.SetupMetadataCache
+    """
     top_level_package_map = {}
     for path in extract_packages(base_path):
-        dist = get_distribution(path)
+        dist = get_distribution(path, metadata_cache)
         top_level_package_map[dist.key] = CachedDistribution(dist, get_top_level_packages(path))
     return top_level_package_map
 
@@ -139,15 +312,41 @@ def extract_packages(path):
     return extracted_paths
 
 
-def get_distribution(package_path):
+def get_distribution(package_path, metadata_cache=None):
+    """
+    :param metadata_cache: cache of the statically read metadata, default a cache used for this call only
+    :type metadata_cache: pordego_dependency.setup_metadata.SetupMetadataCache
+    """
     dist = try_find_dist(package_path)
     if not dist:
-        dist = get_dist_from_egg_info(package_path)
+        dist = get_dist_from_setup_metadata(package_path,
+                                            metadata_cache if metadata_cache is not None else SetupMetadataCache())
     if not dist:
         dist = create_distribution(package_path)
     return dist
 
 
+def get_dist_from_setup_metadata(package_path, metadata_cache):
+    """
+    Distribution built from the metadata read statically from the setup files, cached by the hash of the setup files,
+    or from the egg-info built by running setup.py when the metadata is computed dynamically.
+    Dynamic metadata can depend on any file (requirements.txt, version.py...), so it is never cached.
+    """
+    metadata_hash = hash_metadata_files(package_path)
+    metadata = metadata_cache.get(metadata_hash)
+    if metadata is None:
+        metadata = read_static_metadata(package_path)
+        if metadata is None:
+            dist = get_dist_from_egg_info(package_path)
+            if not dist:
+                return None
+            metadata = {"name": dist.project_name, "version": dist.version,
+                        "install_requires": [str(req) for req in dist.requires()]}
+        else:
+            metadata_cache.set(metadata_hash, metadata)
+    return create_static_distribution(package_path, metadata)
+
+
 def try_find_dist(package_path):
     try:
         return pkg_resources.find_distributions(package_path).next()
@@ -160,44 +359,41 @@ def create_distribution(package_path):
 
 
 def get_dist_from_egg_info(package_path):
-    with change_dir(package_path):
-        logger.info("Building egg info for package at %s", package_path)
-        build_egg_info()
-        try:
-            dist = pkg_resources.find_distributions(package_path).next()
-            dist.requires()
-            return dist
-        except StopIteration:
-            logger.warning("Unable to get distribution information from package at %s."
-                           "Requirements analysis might find false positives", package_path)
-            return None
-        finally:
-            for egg_path in glob.glob("*.egg-info"):
-                try:
-                    shutil.rmtree(egg_path)
-                except Exception:
-                    pass
+    """
+    Distribution read from the egg-info built by running setup.py in package_path.
+    The current directory of the process is not changed, so it can run concurrently for several packages.
+    """
+    logger.info("Building egg info for package at %s", package_path)
+    build_egg_info(package_path)
+    try:
+        dist = pkg_resources.find_distributions(package_path).next()
+        dist.requires()
+        return dist
+    except StopIteration:
+        logger.warning("Unable to get distribution information from package at %s."
+                       "Requirements analysis might find false positives", package_path)
+        return None
+    finally:
+        for egg_path in glob.glob(os.path.join(package_path, "*.egg-info")):
+            try:
+                shutil.rmtree(egg_path)
+            except Exception:
+                pass
 
 
-def build_egg_info():
+def build_egg_info(package_path):
+    package_path = os.path.abspath(package_path)
     code = "import setuptools;import sys;sys.argv[0]='setup.py';__file__={0!r};execfile(__file__)".format(
-        os.path.join(os.path.abspath("."), 'setup.py')
+        os.path.join(package_path, 'setup.py')
     )
     call_args = [sys.executable, '-c', code, "egg_info"]
     try:
-        check_output(call_args, stderr=STDOUT)
+        check_output(call_args, stderr=STDOUT, cwd=package_path)
     except CalledProcessError as e:
         logger.warning("Unable to build egg-info for package at %s. "
                        "Probably the setup file imports some package that is not installed or something like that. "
                        "Here is the output: %s",
-                       os.path.abspath("."), e.output)
-
-
-def get_dist_from_package(package_name, dist_package_map):
-    for cached_dist in dist_package_map.itervalues():
-        if package_name in cached_dist.top_level_packages:
-            return cached_dist.distribution
-    return None
+                       package_path, e.output)
 
 
 @contextmanager
@@ -220,13 +416,3 @@ def temp_dir():
         yield temp_path
     finally:
         shutil.rmtree(temp_path)
-
-
-@contextmanager
-def change_dir(new_path):
-    orig_path = os.path.abspath(os.curdir)
-    os.chdir(new_path)
-    try:
-        yield
-    finally:
-        os.chdir(orig_path)
@@ -1,11 +1,12 @@
+from collections import defaultdict
 from logging import getLogger
 from operator import itemgetter
 
-import pkg_resources
 from pordego_dependency.analysis_result import AnalysisResult
 from pordego_dependency.analyzer import Analyzer
-from pordego_dependency.requirement_resolver import RequirementResolver, get_top_level_packages, get_distribution, \
-    CachedDistribution
+from pordego_dependency.distribution_cache import DistributionCache
+from pordego_dependency.setup_metadata import SetupMetadataCache
+from pordego_dependency.requirement_resolver import RequirementResolver, discover_distributions
 
 logger = getLogger(__name__)
 
@@ -16,33 +17,83 @@ class RequirementsAnalyzer(Analyzer):
         :type analysis_config: pordego_dependency.dependency_config.DependencyConfig
         """
         self.analysis_config = analysis_config
+        self._package_path_dist_map = None
+        self._req_resolver = None
+        self._unresolved_packages = []
 
-    def analyze(self, package_dependency_map):
-        result = RequirementsAnalysisResult()
-        local_package_names = set(self.analysis_config.all_found_packages)
+    def start(self):
+        """
+        Discover the local distributions on the first start only, so that an analyzer kept between checks (like in
+        the watch mode) reuses them along with the requirements already resolved
+        """
+        if self._req_resolver is None:
+            self.find_local_distributions()
+        self._unresolved_packages = []
+        return RequirementsAnalysisResult()
+
+    def find_local_distributions(self):
         local_source_package_map = {}
-        package_path_dist_map = {}
-        for package_path in package_dependency_map:
-            if package_path in package_path_dist_map:
-                dist, top_level_packages = package_path_dist_map[package_path]
-            else:
-                dist = get_distribution(package_path)
-                top_level_packages = get_top_level_packages(package_path)
-            cached_dist = CachedDistribution(dist, top_level_packages)
-            local_source_package_map[dist.key] = cached_dist
-            package_path_dist_map[package_path] = cached_dist
-        req_resolver = RequirementResolver(local_source_package_map,
-                                           self.analysis_config.package_server_url,
-                                           self.analysis_config.pip_options,
-                                           local_package_names=local_package_names,
-                                           ignore_third_party=self.analysis_config.ignore_third_party)
-        for package_path, package_dependencies in package_dependency_map.iteritems():
-            distribution = package_path_dist_map[package_path].distribution
-            result.update(package_path, *self.analyze_package(distribution, package_dependencies,
-                                                              req_resolver))
-        return result
-
-    def analyze_package(self, distribution, package_dependencies, requirement_resolver):
+        self._package_path_dist_map = {}
+        metadata_cache = SetupMetadataCache(self.analysis_config.cache_dir)
+        with self.analysis_config.stage_timer.stage("distribution discovery"):
+            package_paths = sorted({dci.package_path for dci in self.analysis_config.dependency_inputs})
+            for package_path, cached_dist in discover_distributions(
+                    package_paths, metadata_cache, max_workers=self.analysis_config.distribution_workers):
+                local_source_package_map[cached_dist.distribution.key] = cached_dist
+                self._package_path_dist_map[package_path] = cached_dist
+            metadata_cache.save()
+        self._req_resolver = RequirementResolver(local_source_package_map,
+                                                 self.analysis_config.package_server_url,
+                                                 self.analysis_config.pip_options,
+                                                 local_package_names=set(self.analysis_config.all_found_packages),
+                                                 ignore_third_party=self.analysis_config.ignore_third_party,
+                                                 max_workers=self.analysis_config.package_server_workers,
+                                                 max_per_host=self.analysis_config.package_server_per_host,
+                                                 request_timeout=self.analysis_config.package_server_timeout,
+                                                 retries=self.analysis_config.package_server_retries,
+                                                 distribution_cache=self.build_distribution_cache(),
+                                                 pip_batch_size=self.analysis_config.pip_batch_size,
+                                                 metadata_cache=metadata_cache)
+
+    def analyze_package(self, result, package_path, dependencies):
+        cached_dist = self._package_path_dist_map.get(package_path)
+        if cached_dist is None:
+            return
+        with self.analysis_config.stage_timer.stage("requirement resolution"):
+            missing_reqs, extra_reqs = self.compare_requirements(cached_dist.distribution, dependencies)
+        if extra_reqs:
+            # the extra requirements of all the packages are resolved together in finish
+            self._unresolved_packages.append((package_path, missing_reqs, extra_reqs))
+        else:
+            result.update(package_path, missing_reqs, extra_reqs)
+
+    def finish(self, result):
+        """
+        Resolve the extra requirements of all the packages at once, with as few pip runs as possible,
+        then filter the requirements of each package in memory
+        """
+        unresolved_packages, self._unresolved_packages = self._unresolved_packages, []
+        if not unresolved_packages:
+            return
+        stage_timer = self.analysis_config.stage_timer
+        with stage_timer.stage("requirement resolution"):
+            pip_runs = self._req_resolver.pip_runs
+            self._req_resolver.resolve_requirements(
+                set().union(*[extra_reqs for package_path, missing_reqs, extra_reqs in unresolved_packages]))
+            for package_path, missing_reqs, extra_reqs in unresolved_packages:
+                result.update(package_path, *self.filter_resolved_requirements(self._req_resolver, missing_reqs,
+                                                                               extra_reqs))
+            stage_timer.increment("pip_runs", self._req_resolver.pip_runs - pip_runs)
+
+    def build_distribution_cache(self):
+        if not self.analysis_config.cache_dir:
+            return None
+        return DistributionCache(self.analysis_config.cache_dir, ttl=self.analysis_config.distribution_cache_ttl)
+
+    def compare_requirements(self, distribution, package_dependencies):
+        """
+        :return: tuple of (imported packages that are not listed requirements, listed requirements not imported)
+        """
         missing_reqs = set()
         extra_reqs = set()
         if self.analysis_config.check_requirements:
@@ -50,19 +101,20 @@ class RequirementsAnalyzer(Analyzer):
             dependency_names = {dep.target_package for dep in package_dependencies}
             missing_reqs = dependency_names - listed_requirements
             extra_reqs = listed_requirements - dependency_names
-            if extra_reqs:
-                missing_reqs, extra_reqs = self.filter_resolved_requirements(requirement_resolver, missing_reqs,
-                                                                             extra_reqs)
         return missing_reqs, extra_reqs
 
     @staticmethod
     def filter_resolved_requirements(requirement_resolver, missing_reqs, extra_reqs):
+        extra_reqs_by_key = defaultdict(list)
+        for extra_req in extra_reqs:
+            extra_reqs_by_key[requirement_resolver.parse_requirement(extra_req).key].append(extra_req)
         for dist_key, cached_dist in requirement_resolver.resolve_requirements(extra_reqs).iteritems():
             for pack in cached_dist.top_level_packages:
                 if pack in missing_reqs:
                     missing_reqs.remove(pack)
-                    for extra_req in extra_reqs:
-                        if cached_dist.distribution in pkg_resources.Requirement.parse(extra_req):
+                    for extra_req in extra_reqs_by_key[cached_dist.distribution.key]:
+                        if extra_req in extra_reqs and \
+                                cached_dist.distribution in requirement_resolver.parse_requirement(extra_req):
                             extra_reqs.remove(extra_req)
                             break
                     break
@@ -0,0 +1,304 @@
+"""
+Static reader of the package metadata in setup.py, setup.cfg and pyproject.toml, which avoids running setup.py
+"""
+import ast
+import hashlib
+import json
+import os
+import threading
+from logging import getLogger
+
+import pkg_resources
+
+try:
+    from ConfigParser import RawConfigParser
+except ImportError:
+    from configparser import RawConfigParser
+
+try:
+    import tomllib as toml_parser
+except ImportError:
+    try:
+        import toml as toml_parser
+    except ImportError:
+        toml_parser = None
+
+logger = getLogger(__name__)
+
+METADATA_FILES = ("setup.py", "setup.cfg", "pyproject.toml")
+CACHE_FILE_NAME = "setup-metadata.json"
+
+
+class StaticDistribution(pkg_resources.Distribution):
+    """Distribution whose requirements come from statically read metadata instead of an egg-info"""
+
+    def __init__(self, location, project_name, version, install_requires):
+        super(StaticDistribution, self).__init__(location=location, project_name=project_name, version=version)
+        self._install_requires = install_requires
+
+    def requires(self, extras=()):
+        requirements = []
+        for req in pkg_resources.parse_requirements(self._install_requires):
+            if not req.marker or req.marker.evaluate():
+                requirements.append(req)
+        return requirements
+
+
+class SetupMetadataCache(object):
+    """
+    Metadata of local packages keyed by the hash of their metadata files, optionally stored on disk.
+    It can be shared by the threads discovering the distributions.
+    """
+
+    def __init__(self, cache_dir=None):
+        self.cache_dir = cache_dir
+        self._entries = None
+        self._modified = False
+        self._lock = threading.Lock()
+
+    @property
+    def cache_path(self):
+        return os.path.join(self.cache_dir, CACHE_FILE_NAME)
+
+    @property
+    def entries(self):
+        if self._entries is None:
+            with self._lock:
+                if self._entries is None:
+                    self._entries = self._load()
+        return self._entries
+
+    def get(self, metadata_hash):
+        return self.entries.get(metadata_hash)
+
+    def set(self, metadata_hash, metadata):
+        entries = self.entries
+        with self._lock:
+            entries[metadata_hash] = metadata
+            self._modified = True
+
+    def save(self):
+        if not self.cache_dir or not self._modified:
+            return
+        if not os.path.isdir(self.cache_dir):
+            os.makedirs(self.cache_dir)
+        temp_path = "{}.{}.tmp".format(self.cache_path, os.getpid())
+        with open(temp_path, "w") as f:
+            json.dump(self.entries, f)
+        if os.path.exists(self.cache_path):
+            os.remove(self.cache_path)
+        os.rename(temp_path, self.cache_path)
+        self._modified = False
+
+    def _load(self):
+        if not self.cache_dir or not os.path.exists(self.cache_path):
+            return {}
+        try:
+            with open(self.cache_path) as f:
+                return json.load(f)
+        except (IOError, ValueError):
+            logger.warning("Ignoring unreadable setup metadata cache at %s", self.cache_path)
+            return {}
+
+
+def hash_metadata_files(package_path):
+    content_hash = hashlib.sha1()
+    for file_name in METADATA_FILES:
+        path = os.path.join(package_path, file_name)
+        content_hash.update(file_name.encode("utf-8"))
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                content_hash.update(f.read())
+    return content_hash.hexdigest()
+
+
+def create_static_distribution(package_path, metadata):
+    return StaticDistribution(package_path, metadata["name"], metadata["version"], metadata["install_requires"])
+
+
+def read_static_metadata(package_path):
+    """
+    Read the name, version and install_requires of a package without running any code
+
+    :return: dict of metadata, or None if the values are computed dynamically
+    """
+    metadata = {}
+    for reader in (read_pyproject_toml, read_setup_cfg, read_setup_py):
+        values = reader(package_path)
+        if values is None:
+            return None
+        metadata.update(values)
+    if not metadata.get("name"):
+        return None
+    metadata.setdefault("version", "0.0.0")
+    metadata.setdefault("install_requires", [])
+    return metadata
+
+
+def read_setup_py(package_path):
+    """
+    Literal keyword arguments of the setup() call in setup.py.
+    Module level names assigned to a literal (like VERSION = "1.0") are resolved, unless the name is bound more than
+    once, bound inside a compound statement, augmented or mutated, in which case the values are not static.
+
+    :return: dict of values, empty if there is no setup.py, None if the values can't be read statically
+    """
+    path = os.path.join(package_path, "setup.py")
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, "r") as f:
+            tree = ast.parse(f.read(), path)
+    except SyntaxError:
+        return None
+    changed_names = _find_changed_names(tree)
+    literals = {}
+    setup_calls = []
+    for node in tree.body:
+        if isinstance(node, ast.Assign) and len(node.targets) == 1 and isinstance(node.targets[0], ast.Name):
+            try:
+                literals[node.targets[0].id] = ast.literal_eval(node.value)
+            except (ValueError, TypeError, SyntaxError):
+                pass
+        if isinstance(node, ast.Expr) and _is_setup_call(node.value):
+            setup_calls.append(node.value)
+        if isinstance(node, ast.If):
+            # if __name__ == "__main__": setup(...)
+            setup_calls.extend(stmt.value for stmt in node.body
+                               if isinstance(stmt, ast.Expr) and _is_setup_call(stmt.value))
+    if len(setup_calls) != 1 or _has_star_args(setup_calls[0]):
+        return None
+    values = {}
+    for keyword in setup_calls[0].keywords:
+        if keyword.arg not in ("name", "version", "install_requires"):
+            continue
+        try:
+            if isinstance(keyword.value, ast.Name):
+                if keyword.value.id in changed_names:
+                    return None
+                values[keyword.arg] = literals[keyword.value.id]
+            else:
+                values[keyword.arg] = ast.literal_eval(keyword.value)
+        except (KeyError, ValueError, TypeError, SyntaxError):
+            return None
+    if "install_requires" in values:
+        values["install_requires"] = _requirement_list(values["install_requires"])
+    return values
+
+
+MUTATING_METHODS = frozenset(["append", "extend", "insert", "remove", "pop", "clear", "sort", "reverse", "add",
+                              "update", "discard", "setdefault", "popitem"])
+
+
+def _find_changed_names(tree):
+    """
+    :return: set of the names whose value at the setup() call may differ from their first module level assignment:
+        names bound more than once or inside a compound statement, augmented, deleted or mutated
+    """
+    bind_counts = {}
+    changed_names = set()
+    for node in ast.walk(tree):
+        bound_names = []
+        if isinstance(node, ast.Name):
+            if isinstance(node.ctx, ast.Del):
+                changed_names.add(node.id)
+            elif isinstance(node.ctx, ast.Store):
+                bound_names.append(node.id)
+        elif isinstance(node, (ast.Import, ast.ImportFrom)):
+            bound_names.extend((alias.asname or alias.name).split(".")[0] for alias in node.names)
+        elif isinstance(node, (ast.FunctionDef, ast.ClassDef)):
+            bound_names.append(node.name)
+        elif isinstance(node, ast.ExceptHandler) and isinstance(getattr(node, "name", None), str):
+            bound_names.append(node.name)
+        elif isinstance(node, ast.AugAssign) and isinstance(node.target, ast.Name):
+            changed_names.add(node.target.id)
+        elif isinstance(node, ast.Subscript) and isinstance(node.value, ast.Name) and \
+                isinstance(node.ctx, (ast.Store, ast.Del)):
+            changed_names.add(node.value.id)
+        elif isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute) and \
+                isinstance(node.func.value, ast.Name) and node.func.attr in MUTATING_METHODS:
+            changed_names.add(node.func.value.id)
+        for name in bound_names:
+            bind_counts[name] = bind_counts.get(name, 0) + 1
+    changed_names.update(name for name, count in bind_counts.items() if count > 1)
+    # a single binding is only static if it is a simple module level assignment
+    module_assignments = {node.targets[0].id for node in tree.body
+                          if isinstance(node, ast.Assign) and len(node.targets) == 1 and
+                          isinstance(node.targets[0], ast.Name)}
+    changed_names.update(name for name in bind_counts if name not in module_assignments)
+    return changed_names
+
+
+def _is_setup_call(node):
+    if not isinstance(node, ast.Call):
+        return False
+    func = node.func
+    return (isinstance(func, ast.Name) and func.id == "setup") or \
+        (isinstance(func, ast.Attribute) and func.attr == "setup")
+
+
+def _has_star_args(call):
+    if getattr(call, "starargs", None) or getattr(call, "kwargs", None):
+        return True
+    # python 3 stores **kwargs as a keyword without name
+    return any(keyword.arg is None for keyword in call.keywords)
+
+
+def read_setup_cfg(package_path):
+    """
+    :return: dict of values, empty if there is no setup.cfg, None if the values can't be read statically
+    """
+    path = os.path.join(package_path, "setup.cfg")
+    if not os.path.exists(path):
+        return {}
+    parser = RawConfigParser()
+    try:
+        parser.read(path)
+    except Exception:
+        return None
+    values = {}
+    for section, option, key in (("metadata", "name", "name"), ("metadata", "version", "version"),
+                                 ("options", "install_requires", "install_requires")):
+        if parser.has_option(section, option):
+            value = parser.get(section, option).strip()
+            if value.startswith(("file:", "attr:")):
+                return None
+            values[key] = value
+    if "install_requires" in values:
+        # like setuptools, a single line is a list separated by semicolons
+        install_requires = values["install_requires"]
+        values["install_requires"] = _requirement_list(install_requires.splitlines() if "\n" in install_requires
+                                                       else install_requires.split(";"))
+    return values
+
+
+def read_pyproject_toml(package_path):
+    """
+    :return: dict of values, empty if there is no [project] table, None if the values can't be read statically
+    """
+    path = os.path.join(package_path, "pyproject.toml")
+    if not os.path.exists(path):
+        return {}
+    if toml_parser is None:
+        logger.debug("No toml parser installed, ignoring %s", path)
+        return {}
+    try:
+        with open(path, "rb") as f:
+            contents = f.read().decode("utf-8")
+        project = toml_parser.loads(contents).get("project")
+    except Exception:
+        return None
+    if not project:
+        return {}
+    if set(project.get("dynamic", [])) & {"name", "version", "dependencies"}:
+        return None
+    values = {"name": project.get("name"), "version": project.get("version")}
+    if "dependencies" in project:
+        values["install_requires"] = _requirement_list(project["dependencies"])
+    return {key: value for key, value in values.items() if value is not None}
+
+
+def _requirement_list(requirements):
+    if not isinstance(requirements, (list, tuple)):
+        requirements = requirements.splitlines()
+    return [req.strip() for req in requirements if req.strip() and not req.strip().startswith("#")]
@@ -2,22 +2,51 @@
 Helper file for testing dependencies. Uses snakefood
 """
 
+import ast
+import logging
 import os
+import time
 
 import snakefood.find as finder
-from pordego_dependency.dependency_tools import Dependency, is_builtin_root, UNKNOWN_PACKAGE
+from pordego_dependency.dependency_tools import Dependency, get_module_classifier, \
+    get_source_package, get_target_package
 from snakefood.fallback.collections import defaultdict
 from snakefood.roots import relfile
-from snakefood.util import iter_pyfiles, is_python
+from snakefood.util import is_python
+
+from pordego_dependency.module_resolver import ModuleResolver, get_active_resolver
+from pordego_dependency.source_index import SourceIndex, get_module_name
 
 
 class DependencyBuilder(object):
-    def __init__(self, input_package, files, source_path=None, root_cache=None):
+    def __init__(self, input_package, files, source_path=None, root_cache=None, import_cache=None,
+                 extractor=None, classifier=None, stage_timer=None, resolver=None, parse_memo=None,
+                 module_imports=None):
+        """
+        :type import_cache: pordego_dependency.import_cache.ImportCache
+        :param extractor: name of the import extractor in EXTRACTORS, defaults to snakefood
+        :type classifier: pordego_dependency.dependency_tools.ModuleClassifier
+        :param stage_timer: records the parse time of each file
+        :type stage_timer: pordego_dependency.stage_timer.StageTimer
+        :param resolver: resolver of the imports, default the process wide resolver of snakefood_lib
+        :type resolver: pordego_dependency.module_resolver.ModuleResolver
+        :param parse_memo: dict of file path: imported files shared by the builders of a run,
+            so that a file included in several inputs is only parsed once
+        :param module_imports: list receiving (file, list of the non builtin files it imports) for each file built,
+            used to write the module level import graph
+        """
         self.input_package = input_package
         self.files = files
         self.all_errors = []
         self.source_paths = source_path or []
         self.root_cache = root_cache or {}
+        self.import_cache = import_cache
+        self.find_dependencies = get_extractor(extractor)
+        self.classifier = classifier or get_module_classifier()
+        self.stage_timer = stage_timer
+        self.resolver = resolver or module_resolver
+        self.parse_memo = parse_memo if parse_memo is not None else {}
+        self.module_imports = module_imports
 
     def build(self):
         """
@@ -25,23 +54,60 @@ class DependencyBuilder(object):
         """
         in_roots = set(self._split_dependency_path(fn)[0] for fn in self.files)
         processed_files = set()
-        dependency_details = set()
-        for fn in self.files:
-            if fn in processed_files or not is_python(fn):
-                continue  # Make sure we process each file only once.
-            processed_files.add(fn)
-            dependency_details |= self._build_dependencies_for_file(fn, in_roots)
-        return dependency_details
-
-    def _build_dependencies_for_file(self, file_name, in_roots):
-        files, errors = finder.find_dependencies(
-            file_name, verbose=False, process_pragmas=True, ignore_unused=False)
+        dependency_details = {}
+        with self.resolver.activate():
+            for fn in self.files:
+                if fn in processed_files or not is_python(fn):
+                    continue  # Make sure we process each file only once.
+                processed_files.add(fn)
+                self._add_dependencies_for_file(fn, in_roots, dependency_details)
+        return set(dependency_details.values())
+
+    def _add_dependencies_for_file(self, file_name, in_roots, dependency_details):
+        """
+        Add the dependencies of the file to dependency_details, a dict of (source package, target package): Dependency.
+        A Dependency is only created for the first occurrence of each package pair.
+        """
+        files = self._find_imported_files(file_name)
+        if self.module_imports is not None:
+            self.module_imports.append((file_name, self._filter_builtin_files(files)))
         if os.path.basename(file_name) == '__init__.py':
             file_name = os.path.dirname(file_name)
         from_root, from_path = self._split_dependency_path(file_name)
-        dependent_files = self._get_dependencies_from_paths(in_roots, files)
-        return {Dependency(from_root, from_path, to_root, to_path) for to_root, to_path in dependent_files
-                if not is_builtin_root(to_root)}
+        source_package = get_source_package(from_root)
+        for to_root, to_path in self._get_dependencies_from_paths(in_roots, files):
+            key = (source_package, get_target_package(to_root, to_path))
+            if key in dependency_details or self.classifier.is_builtin_root(to_root):
+                continue
+            dependency_details[key] = Dependency(from_root, from_path, to_root, to_path,
+                                                 source_package=key[0], target_package=key[1])
+
+    def _filter_builtin_files(self, files):
+        return sorted({dfn for dfn in files if not self.classifier.is_builtin_root(self._split_dependency_path(dfn)[0])})
+
+    def _find_imported_files(self, file_name):
+        files = self.parse_memo.get(file_name)
+        if files is not None:
+            if self.stage_timer is not None:
+                self.stage_timer.increment("deduplicated_parses")
+            return files
+        files = self._load_imported_files(file_name)
+        self.parse_memo[file_name] = files
+        return files
+
+    def _load_imported_files(self, file_name):
+        if self.import_cache is not None:
+            files = self.import_cache.get(file_name)
+            if files is not None:
+                return files
+        start_time = time.time()
+        files = self.find_dependencies(file_name)
+        if self.stage_timer is not None:
+            self.stage_timer.record_file(file_name, time.time() - start_time)
+            self.stage_timer.increment("parsed_files")
+        if self.import_cache is not None:
+            self.import_cache.set(file_name, files)
+        return files
 
     def _get_dependencies_from_paths(self, in_roots, files):
         """
@@ -88,89 +154,145 @@ class DependencyBuilder(object):
         return None
 
 
+def find_dependencies_snakefood(file_name):
+    """Files imported by file_name, found with the snakefood parser"""
+    files, errors = finder.find_dependencies(file_name, verbose=False, process_pragmas=True, ignore_unused=False)
+    return files
+
+
+def find_dependencies_ast(file_name):
+    """
+    Files imported by file_name, found by only visiting the import statements of the ast.
+    Gives the same result as find_dependencies_snakefood, including the handling of the OPTIONAL pragma.
+    """
+    files = []
+    seen_imports = set()
+    parent_dir = os.path.dirname(file_name)
+    for modname, rname, lineno, level, pragma in find_imports_ast(file_name):
+        if pragma == "OPTIONAL":
+            logging.warning(finder.WARNING_OPTIONAL, lineno, modname)
+            continue
+        if (modname, rname) in seen_imports:
+            continue
+        seen_imports.add((modname, rname))
+        module_file, errors = finder.find_dotted_module(modname, rname, parent_dir, level)
+        if module_file is not None:
+            files.append(os.path.realpath(module_file))
+    return files
+
+
+def find_imports_ast(file_name):
+    """
+    :return: list of (module name, imported name, line number, level, pragma) for each import in the file
+    """
+    try:
+        with open(file_name, "r") as f:
+            contents = f.read()
+    except (IOError, OSError):
+        logging.error("Could not read file '%s'.", file_name)
+        return []
+    if "import" not in contents:
+        return []
+    try:
+        tree = ast.parse(contents, file_name)
+    except (SyntaxError, TypeError) as e:
+        logging.error("Error processing file '%s':\n%s", file_name, e)
+        return []
+    found_imports = []
+    statement_lists = [tree.body]
+    while statement_lists:
+        statements = statement_lists.pop()
+        for index, node in enumerate(statements):
+            if isinstance(node, (ast.Import, ast.ImportFrom)):
+                found_imports.extend(_get_node_imports(node, _get_pragma(statements, index + 1)))
+            else:
+                statement_lists.extend(_get_statement_lists(node))
+    return sorted(found_imports, key=lambda found_import: found_import[2])
+
+
+def _get_node_imports(node, pragma):
+    if isinstance(node, ast.Import):
+        return [(alias.name, None, node.lineno, 0, pragma) for alias in node.names]
+    modname = node.module or ""
+    if modname == "__future__":
+        return []
+    return [(modname, None if alias.name == "*" else alias.name, node.lineno, node.level, pragma)
+            for alias in node.names]
+
+
+def _get_pragma(statements, index):
+    """Like snakefood, a string literal statement directly following an import is a pragma for that import"""
+    if index < len(statements):
+        node = statements[index]
+        if isinstance(node, ast.Expr) and isinstance(node.value, ast.Str):
+            return node.value.s
+    return None
+
+
+def _get_statement_lists(node):
+    """Bodies of compound statements, which can contain nested imports"""
+    statement_lists = []
+    for field in ("body", "orelse", "finalbody", "handlers"):
+        value = getattr(node, field, None)
+        if value and isinstance(value, list):
+            statement_lists.append(value)
+    return statement_lists
+
+
+EXTRACTORS = {"snakefood": find_dependencies_snakefood, "ast": find_dependencies_ast}
+
+
+def get_extractor(name):
+    if name is None:
+        return find_dependencies_snakefood
+    try:
+        return EXTRACTORS[name]
+    except KeyError:
+        raise Exception("Unknown import extractor {}, expected one of {}".format(name, sorted(EXTRACTORS)))
+
+
 def find_package_paths(source_roots, ignores=None):
-    return {os.path.dirname(path) for path in iter_pyfiles(source_roots, ignores)
-            if os.path.basename(path) == "setup.py"}
+    return set(SourceIndex(source_roots, ignores).package_paths())
 
 
 def find_package_names(source_roots, ignores=None):
-    return [os.path.basename(path) for path in find_package_paths(source_roots, ignores=ignores)]
+    return SourceIndex(source_roots, ignores).package_names()
+
 
+def preload_packages(source_paths, ignores=None, source_index=None, resolver=None):
+    """
+    Load the modules of all the packages into the module cache of the resolver
 
-def preload_packages(source_paths, ignores=None):
-    all_package_roots = find_package_paths(source_paths, ignores)
+    :type source_index: pordego_dependency.source_index.SourceIndex
+    :param resolver: default the process wide resolver, whose module cache is snakefood.find.module_cache
+    :type resolver: pordego_dependency.module_resolver.ModuleResolver
+    :return: dict of file path: package root
+    """
+    source_index = source_index or SourceIndex(source_paths, ignores)
+    resolver = resolver or module_resolver
+    resolver.reset()
     cache = {}
-    for package_path in all_package_roots:
-        pyfiles = iter_pyfiles([package_path], [], False)
-        for fn in pyfiles:
-            cache_package(fn, package_path)
+    for package_path in source_index.package_paths():
+        for fn, modname in source_index.package_modules(package_path):
+            resolver.add_module(modname, fn)
             cache[fn] = package_path
     return cache
 
 
-def cache_package(fn, root):
-    names = fn.partition(root)[2].split(os.path.sep)[1:]
-    names[-1] = names[-1].rpartition(".")[0]
-    if names[-1] == "__init__":
-        names = names[:-1]
-    modname = ".".join(names)
-    finder.module_cache[modname].append(fn)
+def cache_package(fn, root, resolver=None):
+    (resolver or module_resolver).add_module(get_module_name(fn, root), fn)
 
 
 def find_dotted_module(modname, rname, parentdir, level):
     """
-    A version of find_module that supports dotted module names (packages).  This
-    function returns the filename of the module if found, otherwise returns
-    None.
-
-    If 'rname' is not None, it first attempts to import 'modname.rname', and if it
-    fails, it must therefore not be a module, so we look up 'modname' and return
-    that instead.
-
-    'parentdir' is the directory of the file that attempts to do the import.  We
-    attempt to do a local import there first.
-
-    'level' is the level of a relative import (i.e. the number of leading dots).
-    If 0, the import is absolute.
+    Replacement of snakefood.find.find_dotted_module that supports namespace packages,
+    using the resolver activated in the current thread (see ModuleResolver.activate) or the process wide resolver
     """
-    # Check for builtins.
-    if modname in finder.builtin_module_names:
-        return os.path.join(finder.libpath, modname), None
-
-    errors = []
-    names = modname.split('.')
-    for i in range(level - 1):
-        parentdir = os.path.dirname(parentdir)
-    # Try relative import, then global imports.
-    fn = finder.find_dotted(names, parentdir)
-    if not fn:
-        if modname not in finder.module_cache:
-            fn = finder.find_dotted(names)
-            if fn:
-                finder.module_cache[modname].append(fn)
-        file_names = finder.module_cache[modname]
-        if not file_names:
-            file_names = [os.path.join(UNKNOWN_PACKAGE, modname)]
-        fn = file_names[0]
-    else:
-        file_names = [fn]
-
-    # If this is a from-form, try the target symbol as a module.
-    if rname:
-        fn2 = None
-        for name in file_names:
-            fn2 = finder.find_dotted([rname], os.path.dirname(name))
-            if fn2:
-                break
-        if fn2:
-            fn = fn2
-        else:
-            pass
-            # Pass-thru and return the filename of the parent, which was found.
-
-    return fn, errors
+    return get_active_resolver(module_resolver).find_dotted_module(modname, rname, parentdir, level)
 
 
 # monkey patch find so that it works with namespace packages
 finder.module_cache = defaultdict(list)
 finder.find_dotted_module = find_dotted_module
+# process wide resolver, used when no resolver is passed or activated
+module_resolver = ModuleResolver(finder.module_cache)
@@ -0,0 +1,79 @@
+"""
+Index of the python files and setup.py package roots under the source paths, built with a single walk
+"""
+import os
+from bisect import bisect_left
+
+from pordego_dependency.ignore_matcher import IgnoreMatcher
+
+
+class SourceIndex(object):
+    def __init__(self, source_paths, ignores=None):
+        """
+        All the packages and modules are indexed, the ignore globs of the config only filter the files analyzed
+        by each DependencyCheckInput.
+
+        :param source_paths: list of directories to index
+        :param ignores: directory names to skip, see snakefood.util.iter_pyfiles
+        """
+        self.source_paths = list(source_paths)
+        self._real_source_paths = [os.path.realpath(path) for path in self.source_paths]
+        self._files = sorted(set(IgnoreMatcher().iter_pyfiles(self.source_paths, ignores)))
+        self._package_paths = sorted({os.path.dirname(path) for path in self._files
+                                      if os.path.basename(path) == "setup.py"})
+        self._package_modules = {package_path: [(fn, get_module_name(fn, package_path))
+                                                for fn in self.files_under(package_path)]
+                                 for package_path in self._package_paths}
+
+    @property
+    def files(self):
+        """Sorted list of the real paths of all the python files"""
+        return self._files
+
+    def contains(self, path):
+        """True if path is under one of the indexed source paths"""
+        real_path = os.path.realpath(path)
+        return any(real_path == source_path or real_path.startswith(os.path.join(source_path, ""))
+                   for source_path in self._real_source_paths)
+
+    def has_file(self, path):
+        """True if path is one of the indexed python files"""
+        real_path = os.path.realpath(path)
+        index = bisect_left(self._files, real_path)
+        return index < len(self._files) and self._files[index] == real_path
+
+    def files_under(self, path):
+        """Sorted list of the python files under path"""
+        prefix = os.path.join(os.path.realpath(path), "")
+        start = bisect_left(self._files, prefix)
+        end = start
+        while end < len(self._files) and self._files[end].startswith(prefix):
+            end += 1
+        return self._files[start:end]
+
+    def package_paths(self, source_roots=None):
+        """
+        :param source_roots: only return packages under these paths, default all indexed source paths
+        :return: sorted list of the real paths of the directories containing a setup.py
+        """
+        if source_roots is None:
+            return list(self._package_paths)
+        prefixes = tuple(os.path.join(os.path.realpath(root), "") for root in source_roots)
+        return [path for path in self._package_paths if path.startswith(prefixes)]
+
+    def package_names(self, source_roots=None):
+        return [os.path.basename(path) for path in self.package_paths(source_roots)]
+
+    def package_modules(self, package_path):
+        """
+        :return: list of (file path, module name) for each python file in the package
+        """
+        return self._package_modules[package_path]
+
+
+def get_module_name(fn, root):
+    names = fn.partition(root)[2].split(os.path.sep)[1:]
+    names[-1] = names[-1].rpartition(".")[0]
+    if names[-1] == "__init__":
+        names = names[:-1]
+    return ".".join(names)
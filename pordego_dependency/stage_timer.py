@@ -0,0 +1,87 @@
+"""
+Timing of the stages of an analysis run, reported as JSON
+"""
+import json
+import time
+from collections import OrderedDict, defaultdict
+from contextlib import contextmanager
+from heapq import nlargest
+
+DEFAULT_SLOWEST_COUNT = 20
+
+
+class StageTimer(object):
+    def __init__(self):
+        self.start_time = time.time()
+        self.stages = OrderedDict()
+        self.package_times = {}
+        self.file_times = {}
+        self.counters = defaultdict(int)
+
+    @contextmanager
+    def stage(self, name):
+        """Time the enclosed block, adding to the stage total if the stage runs several times"""
+        start_time = time.time()
+        try:
+            yield
+        finally:
+            self.add_stage_time(name, time.time() - start_time)
+
+    def iterate(self, name, iterable):
+        """
+        Yield the items of iterable, adding the time spent producing each item to the stage.
+        The time spent by the consumer between items is not included.
+        """
+        iterator = iter(iterable)
+        while True:
+            start_time = time.time()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                self.add_stage_time(name, time.time() - start_time, count=0)
+                return
+            self.add_stage_time(name, time.time() - start_time)
+            yield item
+
+    def add_stage_time(self, name, seconds, count=1):
+        stage = self.stages.setdefault(name, {"seconds": 0.0, "count": 0})
+        stage["seconds"] += seconds
+        stage["count"] += count
+
+    def record_package(self, package, seconds):
+        self.package_times[package] = seconds
+
+    def record_file(self, file_name, seconds):
+        self.file_times[file_name] = seconds
+
+    def increment(self, counter, count=1):
+        self.counters[counter] += count
+
+    def update(self, file_times=None, counters=None):
+        """Merge the measurements of another timer, for example from a worker process"""
+        self.file_times.update(file_times or {})
+        for counter, count in (counters or {}).items():
+            self.counters[counter] += count
+
+    def report(self, slowest_count=DEFAULT_SLOWEST_COUNT):
+        """
+        :return: dict with the total time, the time of each stage, the slowest packages and files, and the counters
+        """
+        return {
+            "total_seconds": time.time() - self.start_time,
+            "stages": [{"name": name, "seconds": stage["seconds"], "count": stage["count"]}
+                       for name, stage in self.stages.items()],
+            "slowest_packages": [{"package": package, "seconds": seconds}
+                                 for package, seconds in _slowest(self.package_times, slowest_count)],
+            "slowest_files": [{"file": file_name, "seconds": seconds}
+                              for file_name, seconds in _slowest(self.file_times, slowest_count)],
+            "counters": dict(self.counters),
+        }
+
+    def write_report(self, path, slowest_count=DEFAULT_SLOWEST_COUNT):
+        with open(path, "w") as f:
+            json.dump(self.report(slowest_count), f, indent=2)
+
+
+def _slowest(times, count):
+    return nlargest(count, times.items(), key=lambda item: item[1])
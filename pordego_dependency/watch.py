@@ -0,0 +1,400 @@
+"""
+Watch mode: keep the source index, the module resolver and the package dependency map in memory, rebuild the
+packages whose files change and answer "check" requests over a local Unix socket
+"""
+import argparse
+import json
+import os
+import select
+import socket
+import sys
+import time
+from logging import getLogger, basicConfig, INFO
+
+from pordego_dependency.dependency_tools import ModuleClassifier, UNKNOWN_PACKAGE
+from pordego_dependency.entry_point import build_config, build_import_cache, iter_built_packages, \
+    analyse_cyclic_dependency, analyse_cyclic_imports, analyze_results, build_analyzers
+from pordego_dependency.import_cache import ImportCache
+from pordego_dependency.incremental import find_changed_package_paths
+from pordego_dependency.module_resolver import ModuleResolver
+from pordego_dependency.setup_metadata import METADATA_FILES
+from pordego_dependency.snakefood_lib import preload_packages
+
+try:
+    from inotify_simple import INotify, flags as inotify_flags
+except ImportError:
+    INotify = None
+
+logger = getLogger(__name__)
+
+DEFAULT_SOCKET_PATH = ".pordego-dependency.sock"
+DEFAULT_INTERVAL = 0.5
+# seconds a client has to send its request, so that an idle client doesn't block the watch mode
+REQUEST_TIMEOUT = 5.0
+CHECK_COMMAND = "check"
+STOP_COMMAND = "stop"
+
+
+class AnalysisSession(object):
+    """State of the analysis kept warm between checks"""
+
+    def __init__(self, config_dict):
+        """
+        :param config_dict: dictionary parsed from config file, see entry_point.analyze_dependency
+        """
+        self.config_dict = config_dict
+        self.config = None
+        self.root_cache = None
+        self.resolver = None
+        self.classifier = None
+        self.import_cache = None
+        self.analyzers = None
+        self.package_dependency_map = None
+        self.pending_files = set()
+
+    def load(self, changed_files=()):
+        """
+        Build everything again, like a cold run, except the imports of the files that are not affected by the
+        changed files, which are kept from the previous load
+
+        :param changed_files: paths of the files added or removed since the previous load
+        """
+        start_time = time.time()
+        self.config = build_config(self.config_dict)
+        self.classifier = ModuleClassifier(self.config.source_path_matcher)
+        self.resolver = ModuleResolver(max_entries=self.config.resolver_cache_size)
+        self.root_cache = preload_packages(self.config.source_paths, source_index=self.config.source_index,
+                                           resolver=self.resolver)
+        previous_import_cache = self.import_cache
+        self.import_cache = build_import_cache(self.config, self.root_cache) or ImportCache(None)
+        if previous_import_cache is not None:
+            self.import_cache.update(find_reusable_imports(previous_import_cache.entries, changed_files))
+        self.analyzers = None
+        self.package_dependency_map = dict(iter_built_packages(self.config, self.config.dependency_inputs,
+                                                               self.root_cache, self.import_cache, self.resolver,
+                                                               self.classifier))
+        self.import_cache.save()
+        self.pending_files = set()
+        logger.info("Loaded %s packages in %s s", len(self.package_dependency_map), time.time() - start_time)
+
+    def add_changes(self, changed_files):
+        """
+        :param changed_files: paths of the files that were modified, added or removed since the last update
+        """
+        self.pending_files.update(changed_files)
+
+    def update(self):
+        """
+        Rebuild the packages containing the pending changed files.
+        Adding or removing files changes how imports resolve, so it reloads everything.
+        """
+        changed_files, self.pending_files = self.pending_files, set()
+        if not changed_files:
+            return
+        if self.package_dependency_map is None or any(self._changes_structure(path) for path in changed_files):
+            logger.info("Files were added or removed, reloading")
+            self.load(changed_files)
+            return
+        if any(os.path.basename(path) in METADATA_FILES for path in changed_files):
+            # the requirements of the packages changed
+            self.analyzers = None
+        changed_package_paths = find_changed_package_paths(
+            {dci.package_path for dci in self.config.dependency_inputs}, changed_files)
+        dependency_inputs = [dci for dci in self.config.dependency_inputs if dci.package_path in changed_package_paths]
+        self.package_dependency_map.update(iter_built_packages(self.config, dependency_inputs, self.root_cache,
+                                                               self.import_cache, self.resolver, self.classifier))
+        self.import_cache.save()
+        logger.info("%s changed files, rebuilt %s packages", len(changed_files), len(changed_package_paths))
+
+    def check(self):
+        """
+        Apply the pending changes and run the analysis on the warm dependency map
+
+        :return: list of error messages, empty if the check passed
+        """
+        self.update()
+        if self.analyzers is None:
+            # kept between checks, so that the local distributions and the resolved requirements are reused
+            self.analyzers = build_analyzers(self.config)
+        try:
+            analyse_cyclic_dependency(self.config)
+            analyse_cyclic_imports(self.config, self.package_dependency_map)
+            analyze_results([analyzer.analyze(self.package_dependency_map) for analyzer in self.analyzers])
+        except AssertionError as e:
+            return [str(e)]
+        return []
+
+    def _changes_structure(self, path):
+        if not os.path.exists(path):
+            return True
+        if os.path.basename(path) == "setup.py":
+            return os.path.dirname(os.path.realpath(path)) not in self.config.source_index.package_paths()
+        if path.endswith(".py"):
+            return not self.config.source_index.has_file(path)
+        return False
+
+
+def find_reusable_imports(import_entries, changed_files):
+    """
+    Entries of an import cache that are still valid after files were added or removed.
+    The imports of a file are found again if it is in the directory of a changed file (relative imports), if it
+    imports a changed file, a file under a removed directory or the __init__ module of the directory of a changed
+    file ("from package import module" falls back to package/__init__.py), or if one of its imports was not resolved.
+
+    :param import_entries: dict of file path: entry, see ImportCache.entries
+    :return: dict of file path: entry
+    """
+    changed_paths = {os.path.realpath(path) for path in changed_files}
+    changed_dirs = {os.path.dirname(path) for path in changed_paths}
+    changed_prefixes = tuple(os.path.join(path, "") for path in changed_paths)
+
+    def is_affected_import(path):
+        return path in changed_paths or path.startswith(changed_prefixes) or UNKNOWN_PACKAGE in path.split(os.sep) \
+            or (os.path.basename(path).startswith("__init__.") and os.path.dirname(path) in changed_dirs)
+
+    reusable_entries = {}
+    for file_name, entry in import_entries.items():
+        if os.path.dirname(file_name) in changed_dirs or any(is_affected_import(path) for path in entry[-1]):
+            continue
+        reusable_entries[file_name] = entry
+    return reusable_entries
+
+
+class PollingWatcher(object):
+    """Finds changed files by comparing the modification time and size of all the watched files"""
+
+    def __init__(self, source_paths):
+        self.source_paths = list(source_paths)
+        self._snapshot = self._scan()
+
+    def fileno(self):
+        return None
+
+    def poll(self):
+        """
+        :return: set of the paths modified, added or removed since the last poll
+        """
+        snapshot = self._scan()
+        changed_files = {path for path in set(snapshot) | set(self._snapshot)
+                         if snapshot.get(path) != self._snapshot.get(path)}
+        self._snapshot = snapshot
+        return changed_files
+
+    def close(self):
+        pass
+
+    def _scan(self):
+        snapshot = {}
+        for source_path in self.source_paths:
+            for dir_path, dir_names, file_names in os.walk(source_path):
+                for file_name in file_names:
+                    if is_watched(file_name):
+                        path = os.path.join(dir_path, file_name)
+                        try:
+                            stat = os.stat(path)
+                        except OSError:
+                            continue
+                        snapshot[path] = (stat.st_mtime, stat.st_size)
+        return snapshot
+
+
+class InotifyWatcher(object):
+    """Finds changed files with inotify watches on every directory under the source paths"""
+
+    def __init__(self, source_paths):
+        self.source_paths = list(source_paths)
+        self._inotify = INotify()
+        self._mask = inotify_flags.CREATE | inotify_flags.DELETE | inotify_flags.CLOSE_WRITE | \
+            inotify_flags.MOVED_FROM | inotify_flags.MOVED_TO | inotify_flags.DELETE_SELF
+        self._watched_dirs = {}
+        for source_path in self.source_paths:
+            self._watch_tree(source_path)
+
+    def fileno(self):
+        return self._inotify.fileno()
+
+    def poll(self):
+        """
+        :return: set of the paths modified, added or removed since the last poll
+        """
+        changed_files = set()
+        for event in self._inotify.read(timeout=0):
+            dir_path = self._watched_dirs.get(event.wd)
+            if dir_path is None:
+                continue
+            if event.mask & inotify_flags.DELETE_SELF:
+                del self._watched_dirs[event.wd]
+                continue
+            path = os.path.join(dir_path, event.name)
+            if event.mask & inotify_flags.ISDIR:
+                if event.mask & (inotify_flags.CREATE | inotify_flags.MOVED_TO):
+                    # files may have been written before the watch of the new directory was added
+                    changed_files.update(self._watch_tree(path))
+                else:
+                    changed_files.add(path)
+            elif is_watched(event.name):
+                changed_files.add(path)
+        return changed_files
+
+    def close(self):
+        self._inotify.close()
+
+    def _watch_tree(self, root):
+        """
+        :return: list of the watched files found under root
+        """
+        found_files = []
+        for dir_path, dir_names, file_names in os.walk(root):
+            self._watched_dirs[self._inotify.add_watch(dir_path, self._mask)] = dir_path
+            found_files.extend(os.path.join(dir_path, file_name) for file_name in file_names
+                               if is_watched(file_name))
+        return found_files
+
+
+def is_watched(file_name):
+    return file_name.endswith(".py") or file_name in METADATA_FILES
+
+
+def create_watcher(source_paths):
+    """
+    :return: InotifyWatcher if inotify_simple is installed, otherwise PollingWatcher
+    """
+    if INotify is not None:
+        try:
+            return InotifyWatcher(source_paths)
+        except OSError as e:
+            logger.warning("Unable to use inotify (%s), polling for changes instead", e)
+    return PollingWatcher(source_paths)
+
+
+def watch_dependency(config_dict):
+    """
+    Run the watch mode until a "stop" request is received
+
+    :param config_dict: dictionary parsed from config file
+    """
+    session = AnalysisSession(config_dict)
+    session.load()
+    socket_path = session.config.watch_socket or DEFAULT_SOCKET_PATH
+    watcher = create_watcher(session.config.source_paths)
+    try:
+        serve(session, watcher, socket_path, session.config.watch_interval or DEFAULT_INTERVAL)
+    finally:
+        watcher.close()
+
+
+def serve(session, watcher, socket_path, interval, request_timeout=REQUEST_TIMEOUT):
+    """
+    Apply the changes found by the watcher and answer the requests sent to the Unix socket.
+    Each request is a command on one line, answered with one line of JSON.
+
+    :type session: AnalysisSession
+    :param request_timeout: seconds a client has to send its request before it is disconnected
+    """
+    if os.path.exists(socket_path):
+        os.remove(socket_path)
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(socket_path)
+    server.listen(5)
+    server.settimeout(request_timeout)
+    logger.info("Watching %s, listening on %s", ", ".join(session.config.source_paths), socket_path)
+    try:
+        running = True
+        while running:
+            readable = [server] + ([watcher] if watcher.fileno() is not None else [])
+            ready, _, _ = select.select(readable, [], [], interval)
+            changed_files = watcher.poll()
+            if changed_files:
+                session.add_changes(changed_files)
+                session.update()
+            if server in ready:
+                try:
+                    connection, _ = server.accept()
+                except socket.timeout:
+                    continue
+                connection.settimeout(request_timeout)
+                try:
+                    running = handle_request(session, connection)
+                except socket.timeout:
+                    logger.warning("Client sent no request within %s s, disconnecting it", request_timeout)
+                finally:
+                    connection.close()
+    finally:
+        server.close()
+        os.remove(socket_path)
+
+
+def handle_request(session, connection):
+    """
+    :type session: AnalysisSession
+    :return: False if the server should stop
+    """
+    command = _read_line(connection)
+    if command == STOP_COMMAND:
+        _send_response(connection, {"ok": True, "errors": []})
+        return False
+    if command != CHECK_COMMAND:
+        _send_response(connection, {"ok": False, "errors": ["Unknown command {!r}".format(command)]})
+        return True
+    try:
+        errors = session.check()
+    except Exception as e:
+        logger.exception("Check failed")
+        errors = ["Check failed: {}".format(e)]
+    _send_response(connection, {"ok": not errors, "errors": errors})
+    return True
+
+
+def send_request(socket_path=DEFAULT_SOCKET_PATH, command=CHECK_COMMAND, timeout=None):
+    """
+    Send a command to a running watch mode
+
+    :return: dict with "ok" and the list of "errors"
+    """
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    client.settimeout(timeout)
+    try:
+        client.connect(socket_path)
+        client.sendall((command + "\n").encode("utf-8"))
+        return json.loads(_read_line(client))
+    finally:
+        client.close()
+
+
+def _read_line(connection):
+    data = b""
+    while not data.endswith(b"\n"):
+        chunk = connection.recv(4096)
+        if not chunk:
+            break
+        data += chunk
+    return data.decode("utf-8").strip()
+
+
+def _send_response(connection, response):
+    connection.sendall((json.dumps(response) + "\n").encode("utf-8"))
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="Watch mode of the dependency analysis")
+    subparsers = parser.add_subparsers(dest="command")
+    serve_parser = subparsers.add_parser("serve", help="watch the source paths and answer check requests")
+    serve_parser.add_argument("config", help="JSON file with the dependency config")
+    check_parser = subparsers.add_parser("check", help="ask the running watch mode for a check")
+    check_parser.add_argument("--socket", default=DEFAULT_SOCKET_PATH)
+    stop_parser = subparsers.add_parser("stop", help="stop the running watch mode")
+    stop_parser.add_argument("--socket", default=DEFAULT_SOCKET_PATH)
+    options = parser.parse_args(args)
+    if options.command == "serve":
+        basicConfig(level=INFO)
+        with open(options.config) as f:
+            watch_dependency(json.load(f))
+        return 0
+    response = send_request(options.socket, CHECK_COMMAND if options.command == "check" else STOP_COMMAND)
+    for error in response["errors"]:
+        print(error)
+    return 0 if response["ok"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
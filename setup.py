@@ -27,5 +27,6 @@ setup(
     packages=find_packages(exclude=('tests', 'docs', "tests.*")),
     install_requires=["snakefood", "requests"],
     classifiers=CLASSIFIERS,
-    entry_points={'pordego.analysis': ["dependency = pordego_dependency.entry_point:analyze_dependency"]},
+    entry_points={'pordego.analysis': ["dependency = pordego_dependency.entry_point:analyze_dependency"],
+                  'console_scripts': ["pordego-dependency-watch = pordego_dependency.watch:main"]},
 )
@@ -0,0 +1,91 @@
+"""
+Generator of reproducible synthetic source trees with many setup.py packages, used by the benchmarks
+"""
+import os
+import random
+
+SETUP_TEMPLATE = """from setuptools import setup, find_packages
+
+setup(
+    name={name!r},
+    version='1.0.0',
+    packages=find_packages(),
+    install_requires={install_requires!r},
+)
+"""
+NAMESPACE_INIT = "__import__('pkg_resources').declare_namespace(__name__)\n"
+NAMESPACE_NAME = "sharedns"
+
+
+def package_name(index):
+    return "pkg_{:04d}".format(index)
+
+
+def generate_monorepo(root, package_count, module_count, fan_out=3, namespace_packages=0, cycles=0, seed=0):
+    """
+    Write a tree of packages under root/src. Package i only imports packages with a lower index, except for
+    the requested number of cycles, which make a low index package and a high index package import each other.
+
+    :param package_count: number of setup.py packages
+    :param module_count: number of modules in each package
+    :param fan_out: number of imports of other packages in each module
+    :param namespace_packages: number of packages that also contain a module of a shared namespace package
+    :param cycles: number of package import cycles
+    :param seed: random seed, the same arguments always generate the same tree
+    :return: dict with the source path, the dependency_map of the actual imports and the number of files
+    """
+    rand = random.Random(seed)
+    source_path = os.path.join(root, "src")
+    package_imports = {index: set() for index in range(package_count)}
+    module_imports = {}
+    for index in range(package_count):
+        for module_index in range(module_count):
+            imports = set()
+            if index:
+                for _ in range(fan_out):
+                    target = rand.randrange(index)
+                    imports.add((target, rand.randrange(module_count)))
+            module_imports[(index, module_index)] = imports
+            package_imports[index].update(target for target, _ in imports)
+    for cycle_index in range(min(cycles, package_count - 1)):
+        source, target = cycle_index, package_count - 1 - cycle_index
+        if source < target:
+            module_imports[(source, 0)].add((target, 0))
+            module_imports[(target, 0)].add((source, 0))
+            package_imports[source].add(target)
+            package_imports[target].add(source)
+
+    file_count = 0
+    for index in range(package_count):
+        name = package_name(index)
+        package_root = os.path.join(source_path, name)
+        module_dir = os.path.join(package_root, name)
+        os.makedirs(module_dir)
+        requires = sorted(package_name(target) for target in package_imports[index])
+        file_count += _write(os.path.join(package_root, "setup.py"),
+                             SETUP_TEMPLATE.format(name=name, install_requires=requires))
+        file_count += _write(os.path.join(module_dir, "__init__.py"), "")
+        for module_index in range(module_count):
+            lines = ["import os", "import sys"]
+            for target, target_module in sorted(module_imports[(index, module_index)]):
+                lines.append("from {} import mod_{}".format(package_name(target), target_module))
+            lines.append("")
+            lines.extend("def function_{}(value):\n    return os.path.join(sys.prefix, str(value))\n".format(i)
+                         for i in range(5))
+            file_count += _write(os.path.join(module_dir, "mod_{}.py".format(module_index)), "\n".join(lines))
+        if index < namespace_packages:
+            namespace_dir = os.path.join(package_root, NAMESPACE_NAME)
+            os.makedirs(namespace_dir)
+            file_count += _write(os.path.join(namespace_dir, "__init__.py"), NAMESPACE_INIT)
+            file_count += _write(os.path.join(namespace_dir, "part_{}.py".format(index)),
+                                 "from {} import mod_0\n".format(name))
+
+    dependency_map = {package_name(index): sorted(package_name(target) for target in package_imports[index])
+                      for index in range(package_count)}
+    return {"source_path": source_path, "dependency_map": dependency_map, "file_count": file_count}
+
+
+def _write(path, contents):
+    with open(path, "w") as f:
+        f.write(contents)
+    return 1
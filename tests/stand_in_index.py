@@ -0,0 +1,49 @@
+"""
+Local stand-in for a package server index, answering HEAD requests with a configurable latency
+"""
+import threading
+import time
+
+try:
+    from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+    from SocketServer import ThreadingMixIn
+except ImportError:
+    from http.server import HTTPServer, BaseHTTPRequestHandler
+    from socketserver import ThreadingMixIn
+
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+
+def start_index_server(existing_projects, latency=0.0):
+    """
+    Serve a package index in a background thread. Projects in existing_projects answer 200, others 404.
+    The server records the highest number of requests it handled at the same time in max_concurrent_requests.
+
+    :return: (server, base url)
+    """
+    class IndexHandler(BaseHTTPRequestHandler):
+        def do_HEAD(self):
+            with lock:
+                server.concurrent_requests += 1
+                server.max_concurrent_requests = max(server.max_concurrent_requests, server.concurrent_requests)
+            time.sleep(latency)
+            with lock:
+                server.concurrent_requests -= 1
+            project = self.path.rstrip("/").rpartition("/")[2]
+            self.send_response(200 if project in existing_projects else 404)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+
+        def log_message(self, *args):
+            pass
+
+    lock = threading.Lock()
+    server = ThreadingHTTPServer(("127.0.0.1", 0), IndexHandler)
+    server.concurrent_requests = server.max_concurrent_requests = 0
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    return server, "http://127.0.0.1:{}/pypi".format(server.server_address[1])
@@ -0,0 +1,35 @@
+import unittest
+
+from pordego_dependency.cycle_detection import find_cycles, strongly_connected_components
+from pordego_dependency.dependency_config import DependencyCheckInput
+from pordego_dependency.entry_point import DependencyInputValidator
+
+
+class TestCycleDetection(unittest.TestCase):
+    def test_acyclic_graph(self):
+        self.assertEqual([], find_cycles({"a": ["b", "c"], "b": ["c"], "c": []}))
+
+    def test_components_and_shortest_cycle(self):
+        """Each strongly connected component is reported with a shortest cycle through it"""
+        graph = {"a": ["b"], "b": ["c"], "c": ["a", "b"], "d": ["d"], "e": ["a"]}
+        self.assertEqual([(["a", "b", "c"], ["b", "c", "b"]), (["d"], ["d", "d"])], find_cycles(graph))
+
+    def test_long_chain(self):
+        """The iterative implementation handles graphs deeper than the recursion limit"""
+        size = 5000
+        graph = {i: [i + 1] for i in range(size)}
+        graph[size] = [0]
+        components = strongly_connected_components(graph)
+        self.assertEqual([size + 1], [len(component) for component in components])
+
+    def test_validator_ignores_unknown_packages(self):
+        """Allowed dependencies that are not in the dependency inputs can't be part of a cycle"""
+        validator = DependencyInputValidator([DependencyCheckInput("a", allowed_dependency=["b", "x"]),
+                                              DependencyCheckInput("b", allowed_dependency=["x"])])
+        self.assertFalse(validator.is_cyclic())
+
+    def test_validator_finds_cycle(self):
+        validator = DependencyInputValidator([DependencyCheckInput("a", allowed_dependency=["b"]),
+                                              DependencyCheckInput("b", allowed_dependency=["a"])])
+        self.assertTrue(validator.is_cyclic())
+        self.assertEqual([(["a", "b"], ["a", "b", "a"])], validator.find_cycles())
@@ -1,9 +1,13 @@
+import json
 import os
+import shutil
+import tempfile
 import unittest
 
 from pordego_dependency.dependency_analysis import DependencyAnalyzer
 from pordego_dependency.dependency_config import DependencyConfig
-from pordego_dependency.entry_point import build_package_dependencies
+from pordego_dependency.entry_point import build_package_dependencies, analyze_dependency, \
+    iter_package_dependencies
 from pordego_dependency.snakefood_lib import preload_packages
 from tests.test_source_code_names import SOURCE_PATH, IMPORT_LOCAL_DEPS_PKG, SOURCE_FOLDER_PACKAGE_NAME1, \
     SOURCE_FOLDER_PACKAGE_NAME2
@@ -99,3 +103,56 @@ class DependencyAnalysisTest(unittest.TestCase):
         analyzer = DependencyAnalyzer(config)
         # deps not allowed from folder 2 to folder 1
         self.assertTrue(analyzer.analyze(package_dependency_map).has_error)
+
+    def test_build_with_worker_processes(self):
+        """Building in a process pool gives the same dependency map as building serially"""
+        analysis_packages = [IMPORT_LOCAL_DEPS_PKG, SOURCE_FOLDER_PACKAGE_NAME1, SOURCE_FOLDER_PACKAGE_NAME2]
+        config = DependencyConfig(source_paths=[SOURCE_PATH], analysis_packages=analysis_packages)
+        root_cache = preload_packages(config.source_paths)
+        serial_dependency_map = build_package_dependencies(config, root_cache)
+
+        config = DependencyConfig(source_paths=[SOURCE_PATH], analysis_packages=analysis_packages, workers=2)
+        parallel_dependency_map = build_package_dependencies(config, root_cache)
+        self.assertEqual(serial_dependency_map, parallel_dependency_map)
+
+    def test_worker_processes_build_each_package_once(self):
+        """Inputs sharing a package path are built and yielded once, like in the serial build"""
+        config = DependencyConfig(source_paths=[SOURCE_PATH], workers=2,
+                                  analysis_packages=[IMPORT_LOCAL_DEPS_PKG, IMPORT_LOCAL_DEPS_PKG])
+        package_paths = [package_path for package_path, dependencies
+                         in iter_package_dependencies(config, preload_packages(config.source_paths))]
+        self.assertEqual(1, len(package_paths))
+
+    def test_streamed_analysis_matches_analysis_of_full_map(self):
+        config = DependencyConfig(
+            source_paths=[SOURCE_PATH],
+            analysis_packages=[IMPORT_LOCAL_DEPS_PKG, SOURCE_FOLDER_PACKAGE_NAME1, SOURCE_FOLDER_PACKAGE_NAME2],
+            dependency_map={IMPORT_LOCAL_DEPS_PKG: []}
+        )
+        root_cache = preload_packages(config.source_paths)
+        map_result = DependencyAnalyzer(config).analyze(build_package_dependencies(config, root_cache))
+        stream_result = DependencyAnalyzer(config).analyze_stream(iter_package_dependencies(config, root_cache))
+        self.assertTrue(stream_result.has_error)
+        self.assertEqual(map_result.error_messages, stream_result.error_messages)
+
+    def test_timing_report_and_profile(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            report_path = os.path.join(temp_dir, "timing.json")
+            profile_path = os.path.join(temp_dir, "run.prof")
+            analyze_dependency({"source_paths": [SOURCE_PATH],
+                                "analysis_packages": [IMPORT_LOCAL_DEPS_PKG],
+                                "dependency_map": {IMPORT_LOCAL_DEPS_PKG: ["other_package"]},
+                                "timing_report": report_path,
+                                "profile": profile_path})
+            with open(report_path) as f:
+                report = json.load(f)
+            stage_names = [stage["name"] for stage in report["stages"]]
+            for stage_name in ("tree walk", "config expansion", "preload", "build", "analyze DependencyAnalyzer"):
+                self.assertIn(stage_name, stage_names)
+            self.assertEqual(1, len(report["slowest_packages"]))
+            self.assertTrue(report["slowest_files"])
+            self.assertEqual(len(report["slowest_files"]), report["counters"]["parsed_files"])
+            self.assertTrue(os.path.getsize(profile_path))
+        finally:
+            shutil.rmtree(temp_dir)
@@ -0,0 +1,68 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from pordego_dependency.dependency_config import DependencyConfig
+from pordego_dependency.dependency_query import DependencyQuery
+from pordego_dependency.dependency_tools import Dependency
+from pordego_dependency.entry_point import build_package_dependencies
+from pordego_dependency.snakefood_lib import preload_packages
+from snakefood.find import module_cache
+from tests.monorepo_generator import generate_monorepo
+
+
+class TestDependencyQuery(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.root = tempfile.mkdtemp()
+        cls.tree = generate_monorepo(cls.root, 10, 3, fan_out=2)
+        config = DependencyConfig(source_paths=[cls.tree["source_path"]])
+        cls.query = DependencyQuery(build_package_dependencies(config, preload_packages(config.source_paths)))
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.root)
+        module_cache.clear()
+
+    def test_dependencies_and_dependents(self):
+        dependency_map = self.tree["dependency_map"]
+        for package, dependencies in dependency_map.items():
+            # setup.py also imports setuptools
+            self.assertEqual(set(dependencies) | {"setuptools"}, self.query.dependencies(package))
+            self.assertEqual({source for source, targets in dependency_map.items() if package in targets},
+                             self.query.dependents(package))
+
+    def test_transitive_dependents(self):
+        dependents = self.query.dependents("pkg_0000", transitive=True)
+        for package in dependents:
+            self.assertIsNotNone(self.query.why(package, "pkg_0000"))
+        self.assertNotIn("pkg_0000", dependents)
+
+    def test_why(self):
+        path = self.query.why("pkg_0009", "pkg_0000")
+        self.assertEqual("pkg_0009", path[0].source_package)
+        self.assertEqual("pkg_0000", path[-1].target_package)
+        for dependency, next_dependency in zip(path, path[1:]):
+            self.assertEqual(dependency.target_package, next_dependency.source_package)
+        for dependency in path:
+            self.assertTrue(dependency.from_file.endswith(".py"))
+        self.assertIsNone(self.query.why("pkg_0000", "pkg_0009"))
+        self.assertEqual([], self.query.why("pkg_0001", "pkg_0001"))
+
+    def test_impacted_packages(self):
+        changed_file = os.path.join(self.tree["source_path"], "pkg_0000", "pkg_0000", "mod_0.py")
+        self.assertEqual("pkg_0000", self.query.package_of_file(changed_file))
+        self.assertEqual({"pkg_0000"} | self.query.dependents("pkg_0000", transitive=True),
+                         self.query.impacted_packages([changed_file, "/not/a/package/file.py"]))
+
+    def test_leaf_package_without_imports(self):
+        """A package importing nothing is still known, changes to it impact its dependents"""
+        root = os.path.realpath(self.root)
+        pkg_a, pkg_b = os.path.join(root, "pkg_a"), os.path.join(root, "pkg_b")
+        query = DependencyQuery({pkg_a: set(),
+                                 pkg_b: {Dependency(pkg_b, "pkg_b/m.py", pkg_a, "pkg_a/__init__.py")}})
+        changed_file = os.path.join(pkg_a, "pkg_a", "util.py")
+        self.assertEqual({"pkg_a", "pkg_b"}, query.packages)
+        self.assertEqual("pkg_a", query.package_of_file(changed_file))
+        self.assertEqual({"pkg_a", "pkg_b"}, query.impacted_packages([changed_file]))
@@ -0,0 +1,100 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from pordego_dependency.dependency_analysis import DependencyAnalyzer
+from pordego_dependency.dependency_config import DependencyConfig
+from pordego_dependency.entry_point import build_package_dependencies, analyze_dependency
+from pordego_dependency.graph_file import GraphFile, write_graph
+from pordego_dependency.snakefood_lib import preload_packages
+from snakefood.find import module_cache
+from tests.monorepo_generator import generate_monorepo
+
+
+class TestGraphFile(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.tree = generate_monorepo(self.root, 6, 3)
+        self.graph_path = os.path.join(self.root, "dependencies.graph")
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+        module_cache.clear()
+
+    def test_round_trip(self):
+        config = DependencyConfig(source_paths=[self.tree["source_path"]], dependency_map={"pkg_0005": []})
+        package_dependency_map = build_package_dependencies(config, preload_packages(config.source_paths))
+        write_graph(self.graph_path, package_dependency_map)
+
+        graph = GraphFile(self.graph_path)
+        try:
+            loaded_map = graph.package_dependency_map()
+            self.assertEqual(sorted(package_dependency_map), sorted(loaded_map))
+            for package_path, dependencies in package_dependency_map.items():
+                expected = sorted((d.from_root, d.from_file, d.to_root, d.to_file, d.source_package,
+                                   d.target_package) for d in dependencies)
+                actual = sorted((d.from_root, d.from_file, d.to_root, d.to_file, d.source_package,
+                                 d.target_package) for d in loaded_map[package_path])
+                self.assertEqual(expected, actual)
+            expected_result = DependencyAnalyzer(config).analyze(package_dependency_map)
+            loaded_result = DependencyAnalyzer(config).analyze(loaded_map)
+            self.assertTrue(loaded_result.has_error)
+            self.assertEqual(sorted(str(dep) for dep in expected_result.invalid_dependencies),
+                             sorted(str(dep) for dep in loaded_result.invalid_dependencies))
+        finally:
+            graph.close()
+
+    def test_only_accessed_strings_are_decoded(self):
+        write_graph(self.graph_path, {"package": set()})
+        graph = GraphFile(self.graph_path)
+        try:
+            self.assertEqual(1, graph.package_count)
+            self.assertEqual({}, graph._strings)
+            self.assertEqual(set(), graph.package_dependency_map()["package"])
+        finally:
+            graph.close()
+
+    def test_written_by_analysis(self):
+        analyze_dependency({"source_paths": [self.tree["source_path"]],
+                            "dependency_map": self.tree["dependency_map"],
+                            "graph_file": self.graph_path})
+        graph = GraphFile(self.graph_path)
+        try:
+            self.assertEqual(6, graph.package_count)
+        finally:
+            graph.close()
+
+    def test_module_graph_written_by_analysis(self):
+        analyze_dependency({"source_paths": [self.tree["source_path"]],
+                            "dependency_map": self.tree["dependency_map"],
+                            "graph_file": self.graph_path})
+        graph = GraphFile(self.graph_path)
+        try:
+            module_dir = os.path.join(self.tree["source_path"], "pkg_0005", "pkg_0005")
+            for module_name in ("mod_0.py", "mod_1.py", "mod_2.py"):
+                module_path = os.path.join(module_dir, module_name)
+                with open(module_path) as f:
+                    expected = sorted(os.path.join(self.tree["source_path"], words[1], words[1], words[3] + ".py")
+                                      for words in (line.split() for line in f) if words and words[0] == "from")
+                # os and sys are builtin modules and are left out
+                self.assertEqual(expected, graph.imported_modules(module_path))
+            self.assertIsNotNone(graph.module_index(os.path.join(module_dir, "__init__.py")))
+            self.assertEqual([], graph.imported_modules(os.path.join(module_dir, "__init__.py")))
+        finally:
+            graph.close()
+
+    def test_membership_does_not_decode_dependencies(self):
+        config = DependencyConfig(source_paths=[self.tree["source_path"]], dependency_map={"pkg_0005": []})
+        package_dependency_map = build_package_dependencies(config, preload_packages(config.source_paths))
+        write_graph(self.graph_path, package_dependency_map)
+        graph = GraphFile(self.graph_path)
+        try:
+            loaded_map = graph.package_dependency_map()
+            package_path = sorted(package_dependency_map)[0]
+            self.assertIn(package_path, loaded_map)
+            self.assertNotIn(package_path + "_missing", loaded_map)
+            # only the package paths were decoded
+            self.assertEqual(graph.package_count, len(graph._strings))
+        finally:
+            graph.close()
@@ -0,0 +1,98 @@
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+from pordego_dependency.dependency_config import DependencyCheckInput
+from pordego_dependency.import_cache import ImportCache, build_resolver_inputs
+from pordego_dependency.snakefood_lib import DependencyBuilder, preload_packages
+from snakefood.find import module_cache
+
+from tests.test_source_code_names import SOURCE_PATH, OTHER_PKG, IMPORT_LOCAL_DEPS_PKG
+
+
+class TestImportCache(unittest.TestCase):
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.source_dir = tempfile.mkdtemp()
+        self.source_file = os.path.join(self.source_dir, "module.py")
+        with open(self.source_file, "w") as f:
+            f.write("import os\n")
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir)
+        shutil.rmtree(self.source_dir)
+
+    def test_unchanged_file_is_a_hit(self):
+        """Entries saved by one run are reused by the next one"""
+        cache = ImportCache(self.cache_dir)
+        self.assertIsNone(cache.get(self.source_file))
+        cache.set(self.source_file, ["/some/file.py"])
+        cache.save()
+
+        cache = ImportCache(self.cache_dir)
+        self.assertEqual(["/some/file.py"], cache.get(self.source_file))
+        self.assertEqual((1, 0), (cache.hits, cache.misses))
+
+    def test_modified_file_is_a_miss(self):
+        cache = ImportCache(self.cache_dir)
+        cache.set(self.source_file, ["/some/file.py"])
+        with open(self.source_file, "w") as f:
+            f.write("import sys, os\n")
+        self.assertIsNone(cache.get(self.source_file))
+
+    def test_touched_file_is_a_hit(self):
+        """Only the modification time changed, the content hash still matches"""
+        cache = ImportCache(self.cache_dir)
+        cache.set(self.source_file, ["/some/file.py"])
+        stat = os.stat(self.source_file)
+        os.utime(self.source_file, (stat.st_atime, stat.st_mtime + 10))
+        self.assertEqual(["/some/file.py"], cache.get(self.source_file))
+
+    def test_different_resolver_inputs(self):
+        """Entries are not shared between different resolver inputs"""
+        cache = ImportCache(self.cache_dir, resolver_inputs=["a"])
+        cache.set(self.source_file, ["/some/file.py"])
+        cache.save()
+        self.assertIsNone(ImportCache(self.cache_dir, resolver_inputs=["b"]).get(self.source_file))
+
+    def test_resolver_inputs_change_with_modules(self):
+        """Adding a local module or installing a distribution changes how unchanged files resolve their imports"""
+        root_cache = {self.source_file: self.source_dir}
+        resolver_inputs = build_resolver_inputs([self.source_dir], root_cache)
+        self.assertEqual(resolver_inputs, build_resolver_inputs([self.source_dir], dict(root_cache)))
+        new_module = os.path.join(self.source_dir, "new_module.py")
+        self.assertNotEqual(resolver_inputs,
+                            build_resolver_inputs([self.source_dir], dict(root_cache, **{new_module: self.source_dir})))
+        site_packages = tempfile.mkdtemp()
+        sys.path.append(site_packages)
+        try:
+            resolver_inputs = build_resolver_inputs([self.source_dir], root_cache)
+            os.mkdir(os.path.join(site_packages, "installed_package"))
+            self.assertNotEqual(resolver_inputs, build_resolver_inputs([self.source_dir], root_cache))
+        finally:
+            sys.path.remove(site_packages)
+            shutil.rmtree(site_packages)
+
+
+class TestDependencyBuilderImportCache(unittest.TestCase):
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        preload_packages([SOURCE_PATH])
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir)
+        module_cache.clear()
+
+    def test_cached_build_matches_uncached_build(self):
+        package = DependencyCheckInput(IMPORT_LOCAL_DEPS_PKG, source_paths=[SOURCE_PATH], ignores=["*setup.py"])
+        cold_cache = ImportCache(self.cache_dir)
+        cold_deps = DependencyBuilder(IMPORT_LOCAL_DEPS_PKG, package.files, import_cache=cold_cache).build()
+        cold_cache.save()
+
+        warm_cache = ImportCache(self.cache_dir)
+        warm_deps = DependencyBuilder(IMPORT_LOCAL_DEPS_PKG, package.files, import_cache=warm_cache).build()
+        self.assertEqual(0, warm_cache.misses)
+        self.assertEqual(cold_deps, warm_deps)
+        self.assertEqual([OTHER_PKG], [dep.target_package for dep in warm_deps])
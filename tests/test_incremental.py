@@ -0,0 +1,80 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from pordego_dependency.dependency_config import DependencyConfig
+from pordego_dependency.entry_point import build_package_dependencies
+from pordego_dependency.incremental import select_inputs_to_rebuild, ResultStore
+from pordego_dependency.snakefood_lib import preload_packages
+from snakefood.find import module_cache
+from tests.test_source_code_names import SOURCE_PATH, IMPORT_LOCAL_DEPS_PKG, OTHER_PKG, LOCAL_PACKAGE
+
+
+class TestIncrementalCheck(unittest.TestCase):
+    cur_dir = None
+
+    @classmethod
+    def setUpClass(cls):
+        cls.cur_dir = os.path.abspath(".")
+        os.chdir(os.path.dirname(__file__))
+
+    @classmethod
+    def tearDownClass(cls):
+        os.chdir(cls.cur_dir)
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.config_dict = dict(source_paths=[SOURCE_PATH],
+                                analysis_packages=[IMPORT_LOCAL_DEPS_PKG, OTHER_PKG, LOCAL_PACKAGE],
+                                dependency_map={IMPORT_LOCAL_DEPS_PKG: [OTHER_PKG]},
+                                cache_dir=self.cache_dir)
+        self.root_cache = preload_packages([SOURCE_PATH])
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir)
+        module_cache.clear()
+
+    def test_incremental_build_reuses_stored_results(self):
+        full_dependency_map = build_package_dependencies(DependencyConfig(**self.config_dict), self.root_cache)
+        config = DependencyConfig(changed_files=[], **self.config_dict)
+        self.assertEqual([], self.select_rebuilt_packages(config, full_dependency_map))
+        self.assertEqual(full_dependency_map, build_package_dependencies(config, self.root_cache))
+
+    def test_changed_package_and_referencing_packages_are_rebuilt(self):
+        full_dependency_map = build_package_dependencies(DependencyConfig(**self.config_dict), self.root_cache)
+        changed_file = os.path.join(SOURCE_PATH, OTHER_PKG, OTHER_PKG, "__init__.py")
+        config = DependencyConfig(changed_files=[changed_file], **self.config_dict)
+        self.assertEqual([IMPORT_LOCAL_DEPS_PKG, OTHER_PKG], self.select_rebuilt_packages(config, full_dependency_map))
+
+    def test_everything_rebuilt_without_stored_results(self):
+        config = DependencyConfig(changed_files=[], **self.config_dict)
+        self.assertEqual([IMPORT_LOCAL_DEPS_PKG, LOCAL_PACKAGE, OTHER_PKG], self.select_rebuilt_packages(config, {}))
+
+    def test_result_writer_keeps_packages_not_written_again(self):
+        result_store = ResultStore(self.cache_dir, "fingerprint")
+        result_store.save({"a": {1}, "b": {2}})
+        writer = result_store.open_writer()
+        writer.write("b", {3})
+        writer.close()
+        self.assertEqual({"a": {1}, "b": {3}}, result_store.load())
+
+        writer = result_store.open_writer()
+        writer.write("a", {4})
+        writer.abort()
+        self.assertEqual({"a": {1}, "b": {3}}, result_store.load())
+        self.assertEqual({}, ResultStore(self.cache_dir, "other fingerprint").load())
+
+    def test_results_stored_per_fingerprint_and_read_lazily(self):
+        ResultStore(self.cache_dir, "first").save({"a": {1}, "b": {2}})
+        ResultStore(self.cache_dir, "second").save({"a": {3}})
+        result_store = ResultStore(self.cache_dir, "first")
+        self.assertEqual({"a", "b"}, result_store.package_paths())
+        self.assertEqual([("b", {2})], list(result_store.iter_results({"b"})))
+        self.assertEqual({"a": {3}}, ResultStore(self.cache_dir, "second").load())
+
+    @staticmethod
+    def select_rebuilt_packages(config, stored_results):
+        return sorted(dci.input_package for dci in select_inputs_to_rebuild(config.dependency_inputs,
+                                                                            config.changed_files,
+                                                                            stored_results))
@@ -0,0 +1,40 @@
+import shutil
+import tempfile
+import unittest
+
+from pordego_dependency.dependency_analysis import DependencyAnalyzer
+from pordego_dependency.dependency_config import DependencyConfig
+from pordego_dependency.entry_point import build_package_dependencies, DependencyInputValidator, \
+    build_package_graph
+from pordego_dependency.cycle_detection import find_cycles
+from pordego_dependency.snakefood_lib import preload_packages
+from snakefood.find import module_cache
+from tests.monorepo_generator import generate_monorepo
+
+
+class TestGeneratedMonorepo(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+        module_cache.clear()
+
+    def test_generated_dependency_map_matches_imports(self):
+        """The whole pipeline runs on a generated tree, and the generated dependency_map is exactly right"""
+        tree = generate_monorepo(self.root, 8, 4, namespace_packages=2, cycles=1)
+        config = DependencyConfig(source_paths=[tree["source_path"]], dependency_map=tree["dependency_map"])
+        root_cache = preload_packages(config.source_paths, source_index=config.source_index)
+        package_dependency_map = build_package_dependencies(config, root_cache)
+
+        self.assertEqual(8, len(package_dependency_map))
+        self.assertFalse(DependencyAnalyzer(config).analyze(package_dependency_map).has_error)
+        cycles = DependencyInputValidator(config.dependency_inputs).find_cycles()
+        self.assertEqual(1, len(cycles))
+        self.assertEqual(["pkg_0000", "pkg_0007", "pkg_0000"], cycles[0][1])
+        self.assertEqual(1, len(find_cycles(build_package_graph(package_dependency_map, config.source_paths))))
+
+    def test_reproducible(self):
+        first = generate_monorepo(self.root + "/first", 5, 3, seed=1)
+        second = generate_monorepo(self.root + "/second", 5, 3, seed=1)
+        self.assertEqual(first["dependency_map"], second["dependency_map"])
@@ -0,0 +1,155 @@
+import shutil
+import tempfile
+import unittest
+
+import pkg_resources
+from pordego_dependency.distribution_cache import DistributionCache
+from pordego_dependency.requirement_resolver import RequirementResolver, CachedDistribution, DEFAULT_MAX_PER_HOST
+from pordego_dependency.requirements_analysis import RequirementsAnalyzer, RequirementsAnalysisResult
+from pordego_dependency.setup_metadata import StaticDistribution
+from pordego_dependency.stage_timer import StageTimer
+from tests.stand_in_index import start_index_server
+
+
+class TestFilterExistingRequirements(unittest.TestCase):
+    def setUp(self):
+        self.server, self.url = start_index_server({"requests", "six"})
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_existing_requirements_in_order(self):
+        resolver = RequirementResolver(package_server_url=self.url, max_workers=4)
+        self.assertEqual(["six", "requests"],
+                         resolver.filter_existing_requirements(["six", "missing", "requests", "other"]))
+        self.assertFalse(resolver.package_server_not_responding)
+
+    def test_requests_per_host_limited(self):
+        """The per host limit applies even with more workers, and has its own small default"""
+        self.server.shutdown()
+        self.server.server_close()
+        self.server, self.url = start_index_server({"requests", "six"}, latency=0.05)
+        requirements = ["six", "requests"] * 8
+        resolver = RequirementResolver(package_server_url=self.url, max_workers=16, max_per_host=2)
+        self.assertEqual(requirements, resolver.filter_existing_requirements(requirements))
+        self.assertEqual(2, self.server.max_concurrent_requests)
+        self.server.max_concurrent_requests = 0
+        resolver = RequirementResolver(package_server_url=self.url, max_workers=16)
+        resolver.filter_existing_requirements(requirements)
+        self.assertEqual(DEFAULT_MAX_PER_HOST, self.server.max_concurrent_requests)
+
+    def test_server_not_responding(self):
+        """Requests that still fail after the retries flag the package server as not responding"""
+        self.server.shutdown()
+        self.server.server_close()
+        resolver = RequirementResolver(package_server_url=self.url, retries=1, backoff_factor=0)
+        self.assertEqual([], resolver.filter_existing_requirements(["six", "requests"]))
+        self.assertTrue(resolver.package_server_not_responding)
+
+
+class TestDistributionCache(unittest.TestCase):
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir)
+
+    def test_cached_distribution_is_reused(self):
+        """Distributions stored by one run are resolved by the next one without going to the package server"""
+        cache = DistributionCache(self.cache_dir)
+        cache.add(make_cached_dist("PyYAML", "5.1", ["yaml"]))
+        cache.save()
+
+        resolver = NoPypiRequirementResolver(package_server_url="http://127.0.0.1:1/pypi", ignore_third_party=False,
+                                             distribution_cache=DistributionCache(self.cache_dir))
+        tlp_map = resolver.resolve_requirements(["pyyaml"])
+        self.assertEqual(["pyyaml"], list(tlp_map))
+        self.assertEqual(["yaml"], tlp_map["pyyaml"].top_level_packages)
+        self.assertEqual("5.1", tlp_map["pyyaml"].distribution.version)
+
+    def test_expired_entries(self):
+        cache = DistributionCache(self.cache_dir, ttl=-1)
+        cache.add(make_cached_dist("six", "1.0", ["six"]))
+        self.assertIsNone(cache.get("six"))
+        cache.save()
+        self.assertEqual({}, DistributionCache(self.cache_dir).entries)
+
+    def test_oldest_entries_evicted(self):
+        cache = DistributionCache(self.cache_dir, max_entries=2)
+        for version in ["1.0", "2.0", "3.0"]:
+            cache.add(make_cached_dist("six", version, ["six"]))
+        cache.save()
+        self.assertEqual({"2.0", "3.0"}, set(DistributionCache(self.cache_dir).entries["six"]))
+
+
+class NoPypiRequirementResolver(RequirementResolver):
+    def resolve_packages_from_pypi(self, requirements):
+        if requirements:
+            raise AssertionError("Unexpected package server resolution of {}".format(requirements))
+        return {}
+
+
+def make_cached_dist(project_name, version, top_level_packages):
+    return CachedDistribution(pkg_resources.Distribution(project_name=project_name, version=version),
+                              top_level_packages)
+
+
+class TestTopLevelIndex(unittest.TestCase):
+    def test_resolve_from_index(self):
+        """Requirements are resolved through the top level package index, including distributions added later"""
+        resolver = RequirementResolver({"pyyaml": make_cached_dist("PyYAML", "5.1", ["yaml"])})
+        resolver.add_distributions({"six": make_cached_dist("six", "1.0", ["six"])})
+        self.assertEqual("pyyaml", resolver.get_dist_from_package("yaml").key)
+        self.assertEqual(["six"], list(resolver.resolve_requirements(["six", "unknown"])))
+
+    def test_filter_resolved_requirements(self):
+        """A listed requirement that provides a missing package is neither missing nor extra"""
+        resolver = RequirementResolver({"yaml": make_cached_dist("yaml", "5.1", ["yaml"])})
+        missing_reqs, extra_reqs = RequirementsAnalyzer.filter_resolved_requirements(resolver, {"yaml", "other"},
+                                                                                     {"yaml"})
+        self.assertEqual(({"other"}, set()), (missing_reqs, extra_reqs))
+
+
+class RecordingPipRequirementResolver(RequirementResolver):
+    """Records the requirements of each pip run instead of downloading them"""
+
+    def __init__(self, *args, **kwargs):
+        super(RecordingPipRequirementResolver, self).__init__(*args, **kwargs)
+        self.pip_batches = []
+
+    def filter_existing_requirements(self, requirements):
+        return list(requirements)
+
+    def run_pip_resolve_command(self, temp_path, req_file_path):
+        self.pip_runs += 1
+        with open(req_file_path) as f:
+            self.pip_batches.append(f.read().split("\n"))
+
+
+class TestBatchedResolution(unittest.TestCase):
+    def test_pip_batches(self):
+        """Requirements are downloaded in batches and unresolved requirements are not looked up again"""
+        resolver = RecordingPipRequirementResolver(ignore_third_party=False, pip_batch_size=2)
+        self.assertEqual({}, resolver.resolve_requirements(["c", "a", "b", "a"]))
+        self.assertEqual([["a", "b"], ["c"]], resolver.pip_batches)
+        resolver.resolve_requirements(["b", "c"])
+        self.assertEqual(2, resolver.pip_runs)
+
+    def test_requirements_of_all_packages_resolved_at_once(self):
+        analysis_config = type("AnalysisConfig", (object,), {"check_requirements": True,
+                                                             "stage_timer": StageTimer()})()
+        analyzer = RequirementsAnalyzer(analysis_config)
+        analyzer._req_resolver = RecordingPipRequirementResolver(ignore_third_party=False)
+        analyzer._package_path_dist_map = {
+            "pkg_a": CachedDistribution(StaticDistribution("pkg_a", "pkg-a", "1.0", ["six", "requests"]), ["pkg_a"]),
+            "pkg_b": CachedDistribution(StaticDistribution("pkg_b", "pkg-b", "1.0", ["six", "pyyaml"]), ["pkg_b"])}
+        result = RequirementsAnalysisResult()
+        analyzer.analyze_package(result, "pkg_a", set())
+        analyzer.analyze_package(result, "pkg_b", set())
+        self.assertEqual([], analyzer._req_resolver.pip_batches)
+        analyzer.finish(result)
+        self.assertEqual([["pyyaml", "requests", "six"]], analyzer._req_resolver.pip_batches)
+        self.assertEqual(1, analysis_config.stage_timer.counters["pip_runs"])
+        self.assertEqual([("pkg_a", {"six", "requests"}), ("pkg_b", {"six", "pyyaml"})],
+                         sorted(result.extra_requirements))
@@ -0,0 +1,145 @@
+import os
+import shutil
+import tarfile
+import tempfile
+import unittest
+
+from pordego_dependency.requirement_resolver import get_distribution, discover_distributions, \
+    get_top_level_package_map, RequirementResolver
+from pordego_dependency.setup_metadata import read_static_metadata, SetupMetadataCache
+from tests.test_source_code_names import SOURCE_PATH, TP_PKG
+
+
+class TestStaticMetadata(unittest.TestCase):
+    def setUp(self):
+        self.package_path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.package_path)
+
+    def write(self, file_name, contents):
+        with open(os.path.join(self.package_path, file_name), "w") as f:
+            f.write(contents)
+
+    def test_setup_py_literals(self):
+        """Literal setup() arguments and module level literal constants are read"""
+        self.write("setup.py", "from setuptools import setup\n"
+                               "VERSION = '1.2'\n"
+                               "setup(name='my-package', version=VERSION, install_requires=['six', 'requests>=2'],\n"
+                               "      packages=find_packages())\n")
+        self.assertEqual({"name": "my-package", "version": "1.2", "install_requires": ["six", "requests>=2"]},
+                         read_static_metadata(self.package_path))
+
+    def test_setup_cfg_with_setup_py_override(self):
+        self.write("setup.cfg", "[metadata]\nname = cfg-name\nversion = 2.0\n"
+                                "[options]\ninstall_requires =\n    six\n    requests\n")
+        self.write("setup.py", "from setuptools import setup\nsetup(version='3.0')\n")
+        self.assertEqual({"name": "cfg-name", "version": "3.0", "install_requires": ["six", "requests"]},
+                         read_static_metadata(self.package_path))
+
+    def test_dynamic_values(self):
+        """Computed values can't be read statically"""
+        self.write("setup.py", "from setuptools import setup\n"
+                               "setup(name='my-package', install_requires=open('requirements.txt').readlines())\n")
+        self.assertIsNone(read_static_metadata(self.package_path))
+
+    def test_changed_names_not_static(self):
+        """Names changed after their literal assignment fall back to egg_info"""
+        changes = ["REQS += ['requests']\n",
+                   "REQS.append('requests')\n",
+                   "REQS[0] = 'requests'\n",
+                   "REQS = ['requests']\n",
+                   "if sys.version_info < (3,):\n    REQS = ['requests']\n",
+                   "try:\n    import json\nexcept ImportError:\n    REQS = ['simplejson']\n",
+                   "for REQS in [['requests']]:\n    pass\n",
+                   "from requirements import REQS\n"]
+        for change in changes:
+            self.write("setup.py", "import sys\nfrom setuptools import setup\n"
+                                   "REQS = ['six']\n" + change +
+                                   "setup(name='my-package', install_requires=REQS)\n")
+            self.assertIsNone(read_static_metadata(self.package_path), change)
+
+    def test_name_bound_in_compound_statement_not_static(self):
+        self.write("setup.py", "import sys\nfrom setuptools import setup\n"
+                               "if sys.version_info < (3,):\n    REQS = ['six']\n"
+                               "setup(name='my-package', install_requires=REQS)\n")
+        self.assertIsNone(read_static_metadata(self.package_path))
+
+    def test_unreferenced_changes_are_static(self):
+        """Only the names used by the setup() call matter"""
+        self.write("setup.py", "from setuptools import setup\n"
+                               "REQS = ['six']\nEXTRAS = []\nEXTRAS.append('mock')\n"
+                               "setup(name='my-package', install_requires=REQS, tests_require=EXTRAS)\n")
+        self.assertEqual({"name": "my-package", "version": "0.0.0", "install_requires": ["six"]},
+                         read_static_metadata(self.package_path))
+
+    def test_distribution_from_static_metadata(self):
+        """get_distribution builds the distribution without running setup.py and caches it by file hash"""
+        package_path = os.path.join(SOURCE_PATH, TP_PKG)
+        metadata_cache = SetupMetadataCache()
+        dist = get_distribution(package_path, metadata_cache)
+        self.assertEqual(["snakefood"], [req.name for req in dist.requires()])
+        self.assertEqual(1, len(metadata_cache.entries))
+        self.assertFalse([path for path in os.listdir(package_path) if path.endswith(".egg-info")])
+
+    def test_downloaded_packages_use_the_resolver_cache(self):
+        """The metadata of the downloaded packages is held by the resolver, not by the process"""
+        self.write("setup.py", "from setuptools import setup\nsetup(name='downloaded', install_requires=['six'])\n")
+        download_dir = tempfile.mkdtemp()
+        try:
+            with tarfile.open(os.path.join(download_dir, "downloaded-1.0.tar.gz"), "w:gz") as archive:
+                archive.add(self.package_path, "downloaded-1.0")
+            resolver = RequirementResolver()
+            top_level_package_map = get_top_level_package_map(download_dir, resolver.metadata_cache)
+        finally:
+            shutil.rmtree(download_dir)
+        self.assertEqual(["downloaded"], list(top_level_package_map))
+        self.assertEqual(1, len(resolver.metadata_cache.entries))
+        self.assertEqual({}, RequirementResolver().metadata_cache.entries)
+
+
+class TestDiscoverDistributions(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def create_dynamic_package(self, name, requirement):
+        package_path = os.path.join(self.temp_dir, name)
+        os.mkdir(package_path)
+        with open(os.path.join(package_path, "requirements.txt"), "w") as f:
+            f.write(requirement + "\n")
+        open(os.path.join(package_path, name + "_module.py"), "w").close()
+        with open(os.path.join(package_path, "setup.py"), "w") as f:
+            f.write("from setuptools import setup\n"
+                    "setup(name={!r}, version='1.0', py_modules=['{}_module'],\n"
+                    "      install_requires=open('requirements.txt').read().split())\n".format(name, name))
+        return package_path
+
+    def test_dynamic_metadata_not_cached(self):
+        """The egg-info metadata depends on files that are not hashed, so it is built again by each run"""
+        package_path = self.create_dynamic_package("pkg_dynamic", "six")
+        cache_dir = os.path.join(self.temp_dir, "cache")
+        metadata_cache = SetupMetadataCache(cache_dir)
+        self.assertEqual(["six"], [req.name for req in get_distribution(package_path, metadata_cache).requires()])
+        metadata_cache.save()
+        with open(os.path.join(package_path, "requirements.txt"), "w") as f:
+            f.write("requests\n")
+        self.assertEqual(["requests"], [req.name for req in get_distribution(package_path,
+                                                                             SetupMetadataCache(cache_dir)).requires()])
+
+    def test_egg_info_built_concurrently_in_order(self):
+        """setup.py runs in each package directory without changing the current directory of the process"""
+        package_paths = [self.create_dynamic_package(name, requirement)
+                         for name, requirement in [("pkg_c", "six"), ("pkg_a", "requests"), ("pkg_b", "snakefood")]]
+        cwd = os.getcwd()
+        discovered = discover_distributions(package_paths, SetupMetadataCache(), max_workers=3)
+        self.assertEqual(cwd, os.getcwd())
+        self.assertEqual(package_paths, [package_path for package_path, cached_dist in discovered])
+        self.assertEqual([("pkg-c", ["six"], ["pkg_c_module"]), ("pkg-a", ["requests"], ["pkg_a_module"]),
+                          ("pkg-b", ["snakefood"], ["pkg_b_module"])],
+                         [(cached_dist.distribution.key, [req.name for req in cached_dist.distribution.requires()],
+                           cached_dist.top_level_packages) for package_path, cached_dist in discovered])
+        for package_path in package_paths:
+            self.assertFalse([path for path in os.listdir(package_path) if path.endswith(".egg-info")])
@@ -1,13 +1,26 @@
 import os
+import pickle
+import shutil
+import tempfile
 import unittest
 
 import subprocess
+import sys
+import threading
+from snakefood.util import iter_pyfiles
 
-from pordego_dependency.dependency_config import DependencyCheckInput
-from pordego_dependency.snakefood_lib import find_package_paths, preload_packages, DependencyBuilder
+from pordego_dependency.dependency_config import DependencyCheckInput, DependencyConfig
+from pordego_dependency.ignore_matcher import IgnoreMatcher
+from pordego_dependency.module_resolver import ModuleResolver, LRUCache, get_active_resolver
+from pordego_dependency.parallel_builder import iter_packages_in_pool
+from pordego_dependency.snakefood_lib import find_package_paths, find_package_names, preload_packages, \
+    DependencyBuilder, find_dependencies_ast, find_dependencies_snakefood, find_imports_ast
+from pordego_dependency.source_index import SourceIndex
+from pordego_dependency.stage_timer import StageTimer
 from pordego_dependency.dependency_tools import filter_ignored_dependencies, filter_local_dependencies, \
-    is_builtin_module
-from snakefood.find import find_dotted_module, module_cache
+    is_builtin_module, Dependency, ModuleClassifier, SourcePathMatcher, BUILTIN, LOCAL, UNKNOWN, UNKNOWN_PACKAGE, \
+    get_module_classifier
+from snakefood.find import find_dotted, find_dotted_module, module_cache
 
 from tests.test_source_code_names import SOURCE_PATH, NS_PKG_1_NAME, NAMESPACE_PKG, NS_PKG_2_NAME, LOCAL_PACKAGE, \
     TP_PKG, OTHER_PKG, IMPORT_LOCAL_DEPS_PKG, SOURCE_FOLDER_PATH1
@@ -37,6 +50,50 @@ class TestSnakefoodLib(unittest.TestCase):
         self.assertEqual(module_2_expected_path, find_dotted_module(NAMESPACE_PKG, "module_2", None, 0)[0])
 
 
+class TestSourceIndex(unittest.TestCase):
+    def test_queries_match_filesystem_walks(self):
+        """The index answers package and file queries the same way as walking the tree"""
+        source_index = SourceIndex([SOURCE_PATH])
+        self.assertEqual(find_package_paths([SOURCE_FOLDER_PATH1]),
+                         set(source_index.package_paths([SOURCE_FOLDER_PATH1])))
+        package_path = os.path.join(SOURCE_PATH, OTHER_PKG)
+        self.assertEqual(sorted(iter_pyfiles([package_path], None)), source_index.files_under(package_path))
+        self.assertIn((os.path.realpath(os.path.join(package_path, OTHER_PKG, "__init__.py")), OTHER_PKG),
+                      source_index.package_modules(os.path.realpath(package_path)))
+
+
+class TestAstExtractor(unittest.TestCase):
+    def setUp(self):
+        preload_packages([SOURCE_PATH])
+        self.temp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        module_cache.clear()
+        shutil.rmtree(self.temp_dir)
+
+    def test_same_files_as_snakefood(self):
+        """The ast extractor finds the same imported files as the snakefood parser"""
+        for file_name in iter_pyfiles([SOURCE_PATH], None):
+            self.assertItemsEqual(find_dependencies_snakefood(file_name), find_dependencies_ast(file_name))
+
+    def test_nested_imports_and_pragma(self):
+        """Imports in nested blocks are found, imports followed by an OPTIONAL pragma are flagged"""
+        file_name = os.path.join(self.temp_dir, "module.py")
+        with open(file_name, "w") as f:
+            f.write("from __future__ import absolute_import\n"
+                    "import os.path as p, sys\n"
+                    "try:\n"
+                    "    import json\n"
+                    "except ImportError:\n"
+                    "    import simplejson\n"
+                    "    'OPTIONAL'\n"
+                    "def f():\n"
+                    "    from .sibling import *\n")
+        self.assertEqual([("os.path", None, 2, 0, None), ("sys", None, 2, 0, None), ("json", None, 4, 0, None),
+                          ("simplejson", None, 6, 0, "OPTIONAL"), ("sibling", None, 9, 1, None)],
+                         find_imports_ast(file_name))
+
+
 class TestThirdPartyDetection(unittest.TestCase):
     @classmethod
     def setUpClass(cls):
@@ -51,6 +108,31 @@ class TestThirdPartyDetection(unittest.TestCase):
         self.assertTrue(is_builtin_module(os.path.join("local_package", "subpackage")))
 
 
+class TestModuleClassifier(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        with open(os.path.join(self.temp_dir, "explodes_on_import.py"), "w") as f:
+            f.write("raise RuntimeError('imported')\n")
+        sys.path.append(self.temp_dir)
+
+    def tearDown(self):
+        sys.path.remove(self.temp_dir)
+        shutil.rmtree(self.temp_dir)
+
+    def test_classify_roots(self):
+        classifier = ModuleClassifier([SOURCE_PATH])
+        self.assertEqual(BUILTIN, classifier.classify_root(os.path.dirname(os.__file__)))
+        self.assertEqual(LOCAL, classifier.classify_root(os.path.abspath(os.path.join(SOURCE_PATH, OTHER_PKG))))
+        self.assertEqual(UNKNOWN, classifier.classify_root(os.path.abspath(UNKNOWN_PACKAGE)))
+
+    def test_modules_found_without_import(self):
+        classifier = ModuleClassifier()
+        self.assertTrue(classifier.is_importable_module(os.path.join("json", "decoder.py")))
+        self.assertTrue(classifier.is_importable_module("explodes_on_import.py"))
+        self.assertNotIn("explodes_on_import", sys.modules)
+        self.assertFalse(classifier.is_importable_module("no_such_module_anywhere"))
+
+
 class TestDependencyBuilder(unittest.TestCase):
     def setUp(self):
         preload_packages([SOURCE_PATH])
@@ -89,6 +171,29 @@ class TestDependencyBuilder(unittest.TestCase):
         """Builtin packages should not show up in the list of dependencies"""
         self.check_dependencies("builtin_import_pkg", [])
 
+    def test_overlapping_inputs_parse_files_once(self):
+        """A file included in several inputs of a run is only parsed by the first builder"""
+        package = DependencyCheckInput(OTHER_PKG, source_paths=[SOURCE_PATH])
+        stage_timer = StageTimer()
+        parse_memo = {}
+        first = DependencyBuilder(OTHER_PKG, package.files, source_path=[SOURCE_PATH], stage_timer=stage_timer,
+                                  parse_memo=parse_memo).build()
+        second = DependencyBuilder(OTHER_PKG, package.files, source_path=[SOURCE_PATH], stage_timer=stage_timer,
+                                   parse_memo=parse_memo).build()
+        self.assertEqual(first, second)
+        python_files = [fn for fn in package.files if fn.endswith(".py")]
+        self.assertEqual(len(python_files), stage_timer.counters["parsed_files"])
+        self.assertEqual(len(python_files), stage_timer.counters["deduplicated_parses"])
+
+    def test_classifier_of_the_run_is_used_by_workers(self):
+        """The classifier is passed to the builders of the run, including the ones of the worker processes"""
+        dependency_inputs = [DependencyCheckInput(IMPORT_LOCAL_DEPS_PKG, source_paths=[SOURCE_PATH])]
+        for workers in (1, 2):
+            built = dict(iter_packages_in_pool(dependency_inputs, workers, [SOURCE_PATH], {},
+                                               classifier=EverythingBuiltinClassifier()))
+            self.assertEqual([set()], list(built.values()))
+        self.assertFalse(isinstance(get_module_classifier(), EverythingBuiltinClassifier))
+
     def check_dependencies(self, package_name, expected, ignores=None, filter_local=False, source_paths=None):
         source_paths = source_paths or [SOURCE_PATH]
         package = DependencyCheckInput(package_name, source_paths=source_paths, ignores=["*setup.py"])
@@ -101,5 +206,209 @@ class TestDependencyBuilder(unittest.TestCase):
         self.assertItemsEqual(expected, dep_package_list)
 
 
+class BlockingListingResolver(ModuleResolver):
+    """Resolver whose listing of blocked_dir waits until released is set"""
+
+    def __init__(self, blocked_dir):
+        super(BlockingListingResolver, self).__init__()
+        self.blocked_dir = blocked_dir
+        self.entered = threading.Event()
+        self.released = threading.Event()
+
+    def _listing(self, dir_path):
+        if dir_path == self.blocked_dir:
+            self.entered.set()
+            self.released.wait(5)
+        return super(BlockingListingResolver, self)._listing(dir_path)
+
+
+class EverythingBuiltinClassifier(ModuleClassifier):
+    def classify_root(self, root_path):
+        return BUILTIN
+
+
 def format_deps(deps):
     return "\n".join([str(d) for d in deps])
+
+
+class TestDependency(unittest.TestCase):
+    def test_package_names_computed_once(self):
+        """Package names are attributes set at construction, and are used for equality and pickling"""
+        dependency = Dependency(os.path.join("root", "pkg"), "a.py", os.path.join("site-packages"),
+                                os.path.join("six", "moves.py"))
+        self.assertEqual(("pkg", "six"), (dependency.source_package, dependency.target_package))
+        self.assertFalse(hasattr(dependency, "__dict__"))
+        copy = pickle.loads(pickle.dumps(dependency))
+        self.assertEqual(dependency, copy)
+        self.assertEqual(dependency.to_file, copy.to_file)
+
+    def test_roots_are_shared(self):
+        first = Dependency("".join(["/src/", "pkg"]), "a.py", "/src/other", "b.py")
+        second = Dependency("".join(["/src/", "pkg"]), "c.py", "/src/other", "d.py")
+        self.assertIs(first.from_root, second.from_root)
+
+
+class TestSourcePathMatcher(unittest.TestCase):
+    def test_matches_like_prefix_scan(self):
+        """The bisect matcher gives the same answers as testing every source path"""
+        source_paths = ["/a/b", "/a/bc", "/a/b/nested", "/x", "/a/d"]
+        matcher = SourcePathMatcher(source_paths)
+        for path in ["/a/b/file.py", "/a/bd/file.py", "/a/bc/file.py", "/a/c", "/a", "/x/y", "/a/d", "/b", "/"]:
+            expected = any(path.startswith(source) for source in source_paths)
+            self.assertEqual(expected, matcher.matches(path), path)
+
+
+class TestIgnoreMatcher(unittest.TestCase):
+    def setUp(self):
+        self.root = os.path.realpath(tempfile.mkdtemp())
+        for relative_path in ("pkg/pkg/__init__.py", "pkg/pkg/module.py", "pkg/pkg/module_test.py",
+                              "pkg/vendor/lib/__init__.py", "pkg/tests/test_module.py"):
+            path = os.path.join(self.root, relative_path)
+            if not os.path.isdir(os.path.dirname(path)):
+                os.makedirs(os.path.dirname(path))
+            open(path, "w").close()
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def test_matches_like_fnmatch(self):
+        matcher = IgnoreMatcher(["*_test.py", "*/vendor/*"])
+        self.assertTrue(matcher.matches("/src/pkg/module_test.py"))
+        self.assertTrue(matcher.matches("/src/pkg/vendor/lib/__init__.py"))
+        self.assertFalse(matcher.matches("/src/pkg/module.py"))
+        self.assertFalse(IgnoreMatcher().matches("/src/pkg/module.py"))
+        self.assertTrue(IgnoreMatcher("*.py").matches("/src/pkg/module.py"))
+
+    def test_only_globs_ending_with_star_prune(self):
+        matcher = IgnoreMatcher(["*_test.py", "*/vendor/*", "*/tests/test_*.py"])
+        self.assertTrue(matcher.prunes("/src/pkg/vendor"))
+        self.assertFalse(matcher.prunes("/src/pkg/tests"))
+        self.assertFalse(matcher.prunes("/src/pkg"))
+
+    def test_iter_pyfiles_does_not_walk_pruned_directories(self):
+        checked_files = []
+
+        class RecordingIgnoreMatcher(IgnoreMatcher):
+            def matches(self, path):
+                checked_files.append(path)
+                return super(RecordingIgnoreMatcher, self).matches(path)
+
+        matcher = RecordingIgnoreMatcher(["*_test.py", "*/vendor/*", "*/tests/*"])
+        self.assertEqual([os.path.join(self.root, "pkg/pkg/__init__.py"), os.path.join(self.root, "pkg/pkg/module.py")],
+                         sorted(matcher.iter_pyfiles([self.root])))
+        self.assertEqual([os.path.join(self.root, "pkg/pkg", name) for name in ("__init__.py", "module.py",
+                                                                              "module_test.py")],
+                         sorted(checked_files))
+
+    def test_dependency_check_input_files(self):
+        dependency_input = DependencyCheckInput("pkg", source_paths=[self.root], ignores=["*/vendor/*", "*_test.py"])
+        self.assertEqual(sorted(os.path.join(self.root, path) for path in ("pkg/pkg/__init__.py", "pkg/pkg/module.py",
+                                                                            "pkg/tests/test_module.py")),
+                         sorted(dependency_input.files))
+
+    def test_ignores_only_filter_check_inputs(self):
+        """Ignored files are still indexed and preloaded, so their packages are found and their imports resolved"""
+        config = DependencyConfig(source_paths=[SOURCE_PATH], ignore=["*setup.py", "*test*", "*local*"])
+        self.assertEqual(sorted(find_package_names([SOURCE_PATH])), sorted(config.all_found_packages))
+        self.assertIn(LOCAL_PACKAGE, config.all_found_packages)
+        resolver = ModuleResolver()
+        preload_packages(config.source_paths, source_index=config.source_index, resolver=resolver)
+        self.assertIn(LOCAL_PACKAGE, resolver.module_cache)
+        for package in (LOCAL_PACKAGE, IMPORT_LOCAL_DEPS_PKG, OTHER_PKG):
+            dependency_input = DependencyCheckInput(package, source_paths=[SOURCE_PATH],
+                                                    source_index=config.source_index,
+                                                    ignore_matcher=config.ignore_matcher)
+            self.assertEqual([], [fn for fn in dependency_input.files if config.ignore_matcher.matches(fn)])
+            self.assertFalse([fn for fn in dependency_input.files if fn.endswith("setup.py")])
+
+
+class TestModuleResolver(unittest.TestCase):
+    def test_find_dotted_like_snakefood(self):
+        resolver = ModuleResolver()
+        package_dir = os.path.join(SOURCE_PATH, LOCAL_PACKAGE)
+        for names, parentdir in [(["os"], None), (["json"], None), (["xml", "dom", "minidom"], None),
+                                 (["sys"], None), (["does_not_exist"], None), ([LOCAL_PACKAGE], package_dir),
+                                 ([LOCAL_PACKAGE, "does_not_exist"], package_dir), (["setup"], package_dir),
+                                 ([NAMESPACE_PKG], os.path.join(SOURCE_PATH, NS_PKG_1_NAME))]:
+            self.assertEqual(find_dotted(names, parentdir), resolver.find_dotted(names, parentdir))
+
+    def test_resolutions_are_memoized(self):
+        resolver = ModuleResolver()
+        parent_dir = os.path.join(SOURCE_PATH, LOCAL_PACKAGE, LOCAL_PACKAGE)
+        first = resolver.find_dotted_module("json", "decoder", parent_dir, 0)
+        self.assertEqual(first, resolver.find_dotted_module("json", "decoder", parent_dir, 0))
+        self.assertEqual((1, 1), (resolver.hits, resolver.misses))
+        self.assertTrue(first[0].endswith(os.path.join("json", "decoder.py")))
+        resolver.reset()
+        self.assertEqual(first, resolver.find_dotted_module("json", "decoder", parent_dir, 0))
+        self.assertEqual((0, 1), (resolver.hits, resolver.misses))
+
+    def test_resolvers_are_independent(self):
+        first, second = ModuleResolver(), ModuleResolver()
+        first.add_module("pdep_preloaded", "/src/pdep_preloaded/__init__.py")
+        self.assertEqual("/src/pdep_preloaded/__init__.py",
+                         first.find_dotted_module("pdep_preloaded", None, SOURCE_PATH, 0)[0])
+        self.assertEqual(os.path.join(UNKNOWN_PACKAGE, "pdep_preloaded"),
+                         second.find_dotted_module("pdep_preloaded", None, SOURCE_PATH, 0)[0])
+        self.assertNotIn("pdep_preloaded", module_cache)
+
+    def test_lru_cache_is_bounded(self):
+        cache = LRUCache(2)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)
+        self.assertEqual(2, len(cache))
+        self.assertEqual((1, None, 3), (cache.get("a"), cache.get("b"), cache.get("c")))
+
+    def test_activate_is_per_thread(self):
+        resolver = ModuleResolver()
+        active_in_thread = []
+        with resolver.activate():
+            thread = threading.Thread(target=lambda: active_in_thread.append(get_active_resolver()))
+            thread.start()
+            thread.join()
+            self.assertIs(resolver, get_active_resolver())
+        self.assertEqual([None], active_in_thread)
+        self.assertIsNone(get_active_resolver())
+
+    def test_filesystem_work_outside_of_the_lock(self):
+        """A resolution waiting for a directory listing doesn't block the other threads"""
+        resolver = BlockingListingResolver(os.path.realpath(os.path.join(SOURCE_PATH, LOCAL_PACKAGE)))
+        thread = threading.Thread(target=resolver.find_dotted_module,
+                                  args=(LOCAL_PACKAGE, None, os.path.join(SOURCE_PATH, LOCAL_PACKAGE), 0))
+        thread.start()
+        results = []
+        other_thread = threading.Thread(
+            target=lambda: results.append(resolver.find_dotted_module("json", "decoder", SOURCE_PATH, 0)[0]))
+        try:
+            self.assertTrue(resolver.entered.wait(5))
+            other_thread.start()
+            other_thread.join(2)
+            # resolved while the first thread still waits for its listing
+            self.assertEqual(1, len(results))
+        finally:
+            resolver.released.set()
+            thread.join()
+            other_thread.join()
+        self.assertTrue(results[0].endswith(os.path.join("json", "decoder.py")))
+
+    def test_concurrent_resolutions(self):
+        resolver = ModuleResolver()
+        keys = [(name, rname, os.path.join(SOURCE_PATH, package), 0)
+                for name, rname in [("json", "decoder"), ("os", None), ("xml.dom", "minidom"), ("does_not_exist", None),
+                                    (LOCAL_PACKAGE, None), (NAMESPACE_PKG, None)]
+                for package in (LOCAL_PACKAGE, NS_PKG_1_NAME, OTHER_PKG)]
+        expected = [ModuleResolver().find_dotted_module(*key) for key in keys]
+        results = []
+
+        def resolve():
+            results.append([resolver.find_dotted_module(*key) for key in keys])
+        threads = [threading.Thread(target=resolve) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual([expected] * 8, results)
+        self.assertEqual(len(keys) * 8, resolver.hits + resolver.misses)
+        self.assertTrue(all(len(file_names) == len(set(file_names)) for file_names in resolver.module_cache.values()))
@@ -0,0 +1,102 @@
+import os
+import shutil
+import socket
+import tempfile
+import threading
+import time
+import unittest
+
+from pordego_dependency.watch import AnalysisSession, PollingWatcher, serve, send_request, STOP_COMMAND
+from snakefood.find import module_cache
+from tests.monorepo_generator import generate_monorepo, package_name
+
+
+class TestWatchMode(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.tree = generate_monorepo(self.root, 4, 3)
+        self.session = AnalysisSession({"source_paths": [self.tree["source_path"]],
+                                        "dependency_map": self.tree["dependency_map"]})
+        self.session.load()
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+        module_cache.clear()
+
+    def module_path(self, index, module_name):
+        return os.path.join(self.tree["source_path"], package_name(index), package_name(index), module_name)
+
+    def append_import(self, path, target_index):
+        with open(path, "a") as f:
+            f.write("\nfrom {} import mod_0\n".format(package_name(target_index)))
+        # make sure the change is visible even with a coarse mtime resolution
+        os.utime(path, (time.time() + 5, time.time() + 5))
+
+    def test_modified_file_only_rebuilds_its_package(self):
+        self.assertEqual([], self.session.check())
+        package_dependency_map = dict(self.session.package_dependency_map)
+        changed_file = self.module_path(0, "mod_0.py")
+        self.append_import(changed_file, 3)
+        self.session.add_changes([changed_file])
+        errors = self.session.check()
+        self.assertEqual(1, len(errors))
+        self.assertIn(package_name(3), errors[0])
+        rebuilt_paths = [path for path, dependencies in self.session.package_dependency_map.items()
+                         if package_dependency_map[path] is not dependencies]
+        self.assertEqual([os.path.realpath(os.path.dirname(os.path.dirname(changed_file)))],
+                         [os.path.realpath(path) for path in rebuilt_paths])
+
+    def test_added_file_reloads(self):
+        new_file = self.module_path(0, "new_module.py")
+        self.append_import(new_file, 2)
+        self.session.add_changes([new_file])
+        errors = self.session.check()
+        self.assertEqual(1, len(errors))
+        self.assertTrue(self.session.config.source_index.has_file(new_file))
+        # only the files of the package directory of the new module are parsed again
+        package_dir = os.path.dirname(new_file)
+        self.assertEqual(len([name for name in os.listdir(package_dir) if name.endswith(".py")]),
+                         self.session.import_cache.misses)
+
+    def test_analyzers_kept_between_checks(self):
+        self.session.config_dict["check_requirements"] = True
+        self.session.load()
+        self.session.check()
+        analyzers = self.session.analyzers
+        requirement_resolvers = [getattr(analyzer, "_req_resolver", None) for analyzer in analyzers]
+        self.session.check()
+        self.assertIs(analyzers, self.session.analyzers)
+        self.assertEqual(requirement_resolvers, [getattr(analyzer, "_req_resolver", None) for analyzer in analyzers])
+
+    def test_polling_watcher(self):
+        watcher = PollingWatcher([self.tree["source_path"]])
+        self.assertEqual(set(), watcher.poll())
+        changed_file = self.module_path(1, "mod_1.py")
+        self.append_import(changed_file, 0)
+        new_file = self.module_path(1, "other.py")
+        self.append_import(new_file, 0)
+        self.assertEqual({changed_file, new_file}, watcher.poll())
+
+    def test_check_request_over_socket(self):
+        socket_path = os.path.join(self.root, "watch.sock")
+        watcher = PollingWatcher([self.tree["source_path"]])
+        server_thread = threading.Thread(target=serve, args=(self.session, watcher, socket_path, 0.05, 0.2))
+        server_thread.start()
+        try:
+            for _ in range(100):
+                if os.path.exists(socket_path):
+                    break
+                time.sleep(0.05)
+            idle_client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            idle_client.connect(socket_path)
+            try:
+                self.assertEqual({"ok": True, "errors": []}, send_request(socket_path, timeout=30))
+            finally:
+                idle_client.close()
+            self.append_import(self.module_path(0, "mod_1.py"), 3)
+            response = send_request(socket_path, timeout=30)
+            self.assertFalse(response["ok"])
+        finally:
+            send_request(socket_path, STOP_COMMAND, timeout=30)
+            server_thread.join()
+        self.assertFalse(os.path.exists(socket_path))